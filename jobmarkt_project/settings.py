@@ -43,12 +43,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'registrations.middleware.ProfilingMiddleware',  # Off unless PROFILING_ENABLED
     'django.middleware.security.SecurityMiddleware',
+    'registrations.middleware.PrecompressedStaticMiddleware',  # Collected static files
+    'registrations.middleware.RateLimitMiddleware',  # Before CsrfViewMiddleware reads POST bodies
+    'registrations.middleware.CompressionMiddleware',  # Brotli/gzip responses
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # CORS middleware
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'registrations.middleware.RegistrationMiddleware',  # request.registration
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -59,8 +64,14 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],  # Add project-level templates directory
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Project templates are whitespace-collapsed once when compiled (HTML_MINIFY_TEMPLATES)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'registrations.template_loaders.MinifyingFilesystemLoader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -81,10 +92,42 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Task workers write alongside web requests: take the write lock when a
+        # transaction starts so concurrent writers wait instead of failing, and
+        # use the write-ahead log so readers never block on a writer
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+        },
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'jobmarkt',
     }
 }
 
 
+# Authentication
+# The first backend loads the user's registration in the same query. ModelBackend
+# keeps sessions created before it was added working until users log in again.
+
+AUTHENTICATION_BACKENDS = [
+    'registrations.backends.RegistrationModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Cache the logged-in user and registration for this many seconds (0 disables).
+# Saving or deleting either one drops the cached copy.
+REGISTRATION_CACHE_TIMEOUT = 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -123,6 +166,21 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# collectstatic minifies, content-hashes and precompresses (gzip/brotli) assets
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'registrations.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Browser cache lifetime for static files without a content hash, in seconds.
+# Hashed files are always served as immutable for a year.
+STATIC_CACHE_MAX_AGE = 3600
 
 # Media files (Uploaded files)
 MEDIA_URL = '/media/'
@@ -150,10 +208,81 @@ MESSAGE_TAGS = {
 PAYSTACK_SECRET_KEY = os.environ.get('PAYSTACK_SECRET_KEY', 'sk_test_your_secret_key_here')
 PAYSTACK_PUBLIC_KEY = os.environ.get('PAYSTACK_PUBLIC_KEY', 'pk_test_your_public_key_here')
 PAYSTACK_CALLBACK_URL = os.environ.get('PAYSTACK_CALLBACK_URL', 'http://localhost:8000/payment/verify/')
+PAYSTACK_BASE_URL = os.environ.get('PAYSTACK_BASE_URL', 'https://api.paystack.co')
+
+# Paystack gateway: timeouts in seconds, retries apply to idempotent calls only
+PAYSTACK_CONNECT_TIMEOUT = 3.05
+PAYSTACK_READ_TIMEOUT = 10
+PAYSTACK_MAX_RETRIES = 2
+PAYSTACK_RETRY_BACKOFF = 0.25
+PAYSTACK_POOL_SIZE = 10
+# Consecutive failures that open the circuit, and seconds before a trial call
+PAYSTACK_CIRCUIT_FAILURES = 5
+PAYSTACK_CIRCUIT_RESET = 30
 
 # Monthly subscription amount (in kobo - Paystack uses smallest currency unit)
 MONTHLY_SUBSCRIPTION_AMOUNT = 1500  # GHS 15.00 in pesewas (100 pesewas = 1 GHS)
 
+# Pending checkouts younger than this are reused instead of starting a new one, in seconds
+PAYMENT_CHECKOUT_TTL = 30 * 60
+
+# Recurring billing: subscribers per batch, concurrent charges (at most
+# PAYSTACK_POOL_SIZE so every worker keeps a pooled connection) and charges per second
+BILLING_BATCH_SIZE = 500
+BILLING_WORKERS = 10
+BILLING_RATE_LIMIT = 50
+
+# Prizes per monthly draw (defaults for select_winners and the dashboard odds)
+DRAW_JOB_WINNERS = 10
+DRAW_INCOME_WINNERS = 5
+
+# Eligible-participant snapshots the draws are derived from (registrations.draws).
+# Keep these files: `manage.py verify_draw` re-derives a draw's winners from them.
+DRAW_SNAPSHOT_DIR = BASE_DIR / 'draws'
+
+# Default winner selection: 'uniform', 'stratified' (by region) or 'weighted' (by months paid)
+DRAW_STRATEGY = 'uniform'
+
+# Basic income prize: GHS per month, paid for this many months from the draw month
+BASIC_INCOME_MONTHLY_AMOUNT = 500
+BASIC_INCOME_MONTHS = 12
+
+# A registration can't win draws less than this many months apart (0 allows any)
+WINNER_COOLDOWN_MONTHS = 12
+
+# Payouts per Paystack bulk transfer request (Paystack accepts at most 100)
+PAYOUT_BATCH_SIZE = 100
+
+# `manage.py archive_data` moves settled payments and winners (with their payouts)
+# for months older than this to the archive tables, this many rows per transaction.
+# Keep it above WINNER_COOLDOWN_MONTHS and BASIC_INCOME_MONTHS.
+ARCHIVE_AFTER_MONTHS = 24
+ARCHIVE_BATCH_SIZE = 1000
+
+# Background tasks (webhooks, deferred payment checks, winner emails) are queued
+# in the database and run by `manage.py run_tasks`. Failed tasks are retried up to
+# MAX_ATTEMPTS times, RETRY_DELAY seconds apart and doubling; tasks still running
+# after LEASE_TIMEOUT seconds belong to a dead worker and are queued again.
+TASKS = {
+    'default': {
+        'BACKEND': 'registrations.task_backend.DatabaseBackend',
+        'OPTIONS': {
+            'MAX_ATTEMPTS': 3,
+            'RETRY_DELAY': 30,
+            'LEASE_TIMEOUT': 600,
+        },
+    },
+}
+
+# Duplicate registrations (registrations.duplicates): smallest name similarity
+# (0-1) that counts as the same person, and blocks larger than this many
+# registrations are reported by find_duplicates instead of compared
+DUPLICATE_NAME_SIMILARITY = 0.85
+DUPLICATE_MAX_BLOCK = 200
+
+# Resync interval for the cached per-draw odds snapshot, in seconds
+ODDS_SNAPSHOT_TIMEOUT = 3600
+
 # Email Configuration (for notifications)
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.environ.get('EMAIL_HOST', 'smtp.gmail.com')
@@ -177,3 +306,89 @@ CORS_ALLOW_CREDENTIALS = True
 
 # Allow all headers (adjust as needed for production)
 CORS_ALLOW_ALL_ORIGINS = False  # Only allow specific origins listed above
+
+# Public page cache (home, FAQ, how it works, registration success)
+PAGE_CACHE_ENABLED = True
+PAGE_CACHE_TIMEOUT = 300  # Static content pages, in seconds
+PAGE_CACHE_DRAW_STATS_TIMEOUT = 30  # Pages showing participant counts, in seconds
+
+# Live draw progress on the home page (registrations.live). Each ASGI worker
+# reads the cached counter every LIVE_POLL_INTERVAL seconds while visitors
+# are connected; under WSGI browsers poll every LIVE_RECONNECT_MS instead.
+LIVE_POLL_INTERVAL = 2
+LIVE_KEEPALIVE_SECONDS = 20  # Comment sent on an idle stream so proxies keep it open
+LIVE_RECONNECT_MS = 10000
+LIVE_PROGRESS_TIMEOUT = 60  # Resync of the cached counter, in seconds
+
+# Read-only JSON API (registrations.api_views): how long browsers and CDNs
+# may reuse a public response before revalidating it, in seconds
+API_DRAW_MAX_AGE = 10
+API_STATS_MAX_AGE = 60
+API_JOBS_MAX_AGE = 300
+API_JOBS_PAGE_SIZE = 50
+
+# Public job board (registrations.search). Result pages and facet counts are
+# cached until a listing changes, or for this many seconds at most.
+JOB_SEARCH_CACHE_TIMEOUT = 600
+JOB_SEARCH_PAGE_SIZE = 20
+
+# Rate limits and load shedding (registrations.ratelimit). Requests over a
+# limit get 429 and requests arriving while the server is overloaded get 503,
+# before their body is read. See the module for the RATE_LIMITS rules.
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+RATE_LIMIT_CACHE = 'default'  # Cache alias holding the buckets, None for each process's memory
+RATE_LIMIT_MEMORY_MAX_KEYS = 100000  # Buckets kept per process without a cache
+RATE_LIMIT_PROXY_COUNT = int(os.environ.get('RATE_LIMIT_PROXY_COUNT', '0'))  # Proxies appending to X-Forwarded-For
+RATE_LIMITS = {
+    # Every attempt hashes a password with PBKDF2
+    'user_login': [
+        {'key': 'ip', 'rate': '10/m', 'methods': ['POST']},
+        {'key': 'ip', 'rate': '100/h', 'methods': ['POST']},
+        {'key': 'endpoint', 'rate': '1200/m', 'burst': 200, 'methods': ['POST']},
+    ],
+    'user_register': [
+        {'key': 'ip', 'rate': '5/m', 'methods': ['POST']},
+        {'key': 'ip', 'rate': '20/h', 'methods': ['POST']},
+    ],
+    # CV uploads of up to 5 MB
+    'registration': [
+        {'key': 'ip', 'rate': '5/m', 'methods': ['POST']},
+        {'key': 'ip', 'rate': '20/h', 'methods': ['POST']},
+    ],
+    # HMAC-SHA512 of the whole body; Paystack retries refused deliveries
+    'paystack_webhook': [
+        {'key': 'ip', 'rate': '300/m', 'burst': 100},
+    ],
+    # Calls Paystack
+    'verify_payment': [
+        {'key': 'ip', 'rate': '30/m'},
+    ],
+    # Opens a Paystack checkout
+    'payment_page': [
+        {'key': 'user', 'rate': '10/m', 'methods': ['POST']},
+    ],
+    # Uncached searches run a full-text query
+    'jobs': [
+        {'key': 'ip', 'rate': '60/m', 'burst': 30},
+    ],
+}
+LOAD_SHED_MAX_IN_FLIGHT = 100  # Requests served at once by one process
+LOAD_SHED_MAX_QUEUE_MS = 5000  # Wait behind the front proxy, from its X-Request-Start header
+LOAD_SHED_RETRY_AFTER = 5  # Seconds, sent with 503
+
+# Response compression (registrations.middleware.CompressionMiddleware)
+COMPRESSION_MIN_SIZE = 1024  # Smaller responses are sent uncompressed, in bytes
+COMPRESSION_BROTLI_QUALITY = 5  # 0-11, higher is smaller but slower
+
+# Collapse indentation and blank lines in project templates when they are compiled
+HTML_MINIFY_TEMPLATES = True
+
+# Sampling profiler (registrations.profiling), listed for staff at /admin-profiles/.
+# A share of requests is sampled from the start and any other request once it has
+# run for PROFILING_SLOW_REQUEST_MS; the newest PROFILING_MAX_FILES profiles are kept.
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '') == '1'
+PROFILING_SAMPLE_RATE = 0.01
+PROFILING_SLOW_REQUEST_MS = 1000
+PROFILING_INTERVAL_MS = 5  # Between stack samples of a profiled request
+PROFILING_MAX_FILES = 200
+PROFILING_DIR = BASE_DIR / 'profiles'
@@ -1,11 +1,12 @@
 from django.contrib import admin
-from .models import Registration, JobListing, MonthlyDraw, Winner
+from django.db.models import Count, Min
+from .models import Registration, JobListing, MonthlyDraw, Winner, PaymentAuthorization, BillingRun, Payout, QueuedTask, DuplicateCluster, DuplicateMember, ArchivedPayment, ArchivedWinner, ArchivedPayout, PaymentEvent, MonthlyRevenue
 
 @admin.register(Registration)
 class RegistrationAdmin(admin.ModelAdmin):
     list_display = ['full_name', 'email', 'region', 'mobile_money_provider', 'registration_date', 'is_active']
-    list_filter = ['region', 'mobile_money_provider', 'is_active', 'registration_date']
-    search_fields = ['first_name', 'last_name', 'email']
+    list_filter = ['region', 'mobile_money_provider', 'is_active', 'registration_date', 'duplicate_membership__cluster__status']
+    search_fields = ['first_name', 'last_name', 'email', 'phone_number']
     readonly_fields = ['registration_date']
     ordering = ['-registration_date']
     
@@ -50,7 +51,7 @@ class MonthlyDrawAdmin(admin.ModelAdmin):
     list_display = ['draw_month', 'current_participants', 'minimum_participants', 'status', 'winners_selected']
     list_filter = ['status', 'winners_selected', 'draw_month']
     ordering = ['-draw_month']
-    readonly_fields = ['created_date']
+    readonly_fields = ['created_date', 'snapshot_file', 'snapshot_sha256', 'snapshot_size', 'draw_seed', 'draw_strategy', 'merkle_root']
     
     fieldsets = (
         ('Draw Information', {
@@ -59,6 +60,11 @@ class MonthlyDrawAdmin(admin.ModelAdmin):
         ('Status', {
             'fields': ('status', 'winners_selected')
         }),
+        ('Verification', {
+            'fields': ('snapshot_file', 'snapshot_sha256', 'snapshot_size', 'draw_seed', 'draw_strategy', 'merkle_root',
+                       'excluded_registrations', 'winner_cooldown_months'),
+            'classes': ('collapse',)
+        }),
         ('System Information', {
             'fields': ('created_date',),
             'classes': ('collapse',)
@@ -77,6 +83,150 @@ class WinnerAdmin(admin.ModelAdmin):
         qs = super().get_queryset(request)
         return qs.select_related('registration', 'monthly_draw')
 
+@admin.register(PaymentAuthorization)
+class PaymentAuthorizationAdmin(admin.ModelAdmin):
+    list_display = ['registration', 'channel', 'last4', 'is_active', 'updated_date']
+    list_filter = ['is_active', 'channel']
+    search_fields = ['registration__first_name', 'registration__last_name', 'email']
+    readonly_fields = ['authorization_code', 'created_date', 'updated_date']
+    list_select_related = ['registration']
+
+@admin.register(BillingRun)
+class BillingRunAdmin(admin.ModelAdmin):
+    list_display = ['month', 'status', 'charged', 'failed', 'last_registration_id', 'started_at', 'finished_at']
+    list_filter = ['status']
+    ordering = ['-month']
+    readonly_fields = ['started_at', 'updated_date', 'finished_at']
+
+@admin.register(Payout)
+class PayoutAdmin(admin.ModelAdmin):
+    list_display = ['registration', 'installment', 'due_month', 'amount', 'mobile_money_provider', 'status', 'paid_at']
+    list_filter = ['status', 'mobile_money_provider', 'due_month']
+    search_fields = ['registration__first_name', 'registration__last_name', 'reference']
+    readonly_fields = ['reference', 'transfer_code', 'attempts', 'paid_at', 'created_date', 'updated_date']
+    ordering = ['-due_month']
+    list_select_related = ['registration']
+
+@admin.register(QueuedTask)
+class QueuedTaskAdmin(admin.ModelAdmin):
+    list_display = ['task_path', 'queue_name', 'priority', 'status', 'attempts', 'available_at', 'finished_at']
+    list_filter = ['status', 'queue_name', 'task_path']
+    readonly_fields = ['enqueued_at', 'started_at', 'last_attempted_at', 'finished_at', 'worker_ids', 'errors', 'return_value']
+    ordering = ['-enqueued_at']
+
+class DuplicateMemberInline(admin.TabularInline):
+    model = DuplicateMember
+    fields = ['registration', 'phone_number', 'date_of_birth', 'registration_date', 'is_active']
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    ordering = ['registration_id']
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('registration')
+
+    def phone_number(self, obj):
+        return obj.registration.phone_number
+
+    def date_of_birth(self, obj):
+        return obj.registration.date_of_birth
+
+    def registration_date(self, obj):
+        return obj.registration.registration_date
+
+    @admin.display(boolean=True)
+    def is_active(self, obj):
+        return obj.registration.is_active
+
+@admin.register(DuplicateCluster)
+class DuplicateClusterAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'status', 'size', 'updated_date']
+    list_filter = ['status']
+    readonly_fields = ['created_date', 'updated_date']
+    inlines = [DuplicateMemberInline]
+    actions = ['confirm_duplicates', 'dismiss']
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.annotate(size=Count('members'))
+
+    @admin.display(ordering='size')
+    def size(self, obj):
+        return obj.size
+
+    @admin.action(description='Confirm: keep the first registration, deactivate the others')
+    def confirm_duplicates(self, request, queryset):
+        cluster_ids = list(queryset.values_list('pk', flat=True))
+        first_ids = DuplicateMember.objects.filter(cluster__in=cluster_ids).values('cluster').annotate(
+            first_id=Min('registration_id'),
+        ).values_list('first_id', flat=True)
+        duplicates = Registration.objects.filter(
+            duplicate_membership__cluster__in=cluster_ids, is_active=True,
+        ).exclude(pk__in=list(first_ids))
+        # Saved one by one so cached pages and logins see the change
+        deactivated = 0
+        for registration in duplicates:
+            registration.is_active = False
+            registration.save(update_fields=['is_active', 'updated_date'])
+            deactivated += 1
+        DuplicateCluster.objects.filter(pk__in=cluster_ids).update(status='confirmed')
+        self.message_user(request, f"Deactivated {deactivated} duplicate registrations")
+
+    @admin.action(description='Dismiss: not duplicates')
+    def dismiss(self, request, queryset):
+        DuplicateCluster.objects.filter(pk__in=list(queryset.values_list('pk', flat=True))).update(status='dismissed')
+
+class ReadOnlyAdmin(admin.ModelAdmin):
+    """Archived rows and the payment ledger are history: viewable, never edited"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(ArchivedPayment)
+class ArchivedPaymentAdmin(ReadOnlyAdmin):
+    list_display = ['reference', 'registration', 'amount', 'payment_type', 'status', 'month_paid_for', 'paid_at']
+    list_filter = ['status', 'payment_type', 'month_paid_for']
+    search_fields = ['reference', 'registration__first_name', 'registration__last_name', 'email']
+    ordering = ['-created_date']
+    list_select_related = ['registration']
+
+@admin.register(ArchivedWinner)
+class ArchivedWinnerAdmin(ReadOnlyAdmin):
+    list_display = ['registration', 'monthly_draw', 'prize_type', 'is_claimed', 'claim_date']
+    list_filter = ['prize_type', 'is_claimed', 'monthly_draw']
+    search_fields = ['registration__first_name', 'registration__last_name', 'registration__email']
+    ordering = ['-monthly_draw__draw_month']
+    list_select_related = ['registration', 'monthly_draw']
+
+@admin.register(ArchivedPayout)
+class ArchivedPayoutAdmin(ReadOnlyAdmin):
+    list_display = ['registration', 'installment', 'due_month', 'amount', 'mobile_money_provider', 'status', 'paid_at']
+    list_filter = ['status', 'mobile_money_provider', 'due_month']
+    search_fields = ['registration__first_name', 'registration__last_name', 'reference']
+    ordering = ['-due_month']
+    list_select_related = ['registration']
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(ReadOnlyAdmin):
+    list_display = ['created_date', 'reference', 'month', 'mobile_money_provider', 'amount', 'from_status', 'to_status']
+    list_filter = ['to_status', 'mobile_money_provider', 'month']
+    search_fields = ['reference']
+    ordering = ['-id']
+
+@admin.register(MonthlyRevenue)
+class MonthlyRevenueAdmin(ReadOnlyAdmin):
+    list_display = ['month', 'mobile_money_provider', 'status', 'payments', 'amount', 'updated_date']
+    list_filter = ['status', 'mobile_money_provider', 'month']
+
 # Customize admin site header
 admin.site.site_header = "Jobmarkt Admin"
 admin.site.site_title = "Jobmarkt Admin Portal"
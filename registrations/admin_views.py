@@ -1,8 +1,11 @@
 from django.shortcuts import render, get_object_or_404
+from django.conf import settings
+from django.http import FileResponse, Http404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.db.models import Count, Sum, Avg
 from django.utils import timezone
 from datetime import datetime, timedelta
+from . import archive, profiling
 from .models import Registration, MonthlyDraw, Winner, JobListing
 import json
 
@@ -140,12 +143,18 @@ def admin_monthly_draws(request):
 def admin_winners(request):
     """Admin winners management page"""
     
-    winners = Winner.objects.select_related(
-        'registration', 'monthly_draw'
-    ).order_by('-created_date')
+    # Winners of draws past ARCHIVE_AFTER_MONTHS are in the archive
+    show_archived = request.GET.get('archived') == '1'
+    if show_archived:
+        winners = archive.winner_history()
+    else:
+        winners = Winner.objects.select_related(
+            'registration', 'monthly_draw'
+        ).order_by('-created_date')
     
     context = {
         'winners': winners,
+        'show_archived': show_archived,
         'page_title': 'Winners',
     }
     
@@ -177,4 +186,34 @@ def admin_registration_detail(request, registration_id):
         'page_title': f'Registration Detail - {registration.full_name}',
     }
     
-    return render(request, 'registrations/admin_registration_detail.html', context)
\ No newline at end of file
+    return render(request, 'registrations/admin_registration_detail.html', context)
+
+@login_required
+@user_passes_test(is_staff_user)
+def admin_profiles(request):
+    """Request profiles written by ProfilingMiddleware"""
+    profiles = profiling.list_profiles()
+    url_names = sorted({profile['url_name'] for profile in profiles})
+    url_name = request.GET.get('url_name')
+    if url_name:
+        profiles = [profile for profile in profiles if profile['url_name'] == url_name]
+
+    context = {
+        'profiles': profiles,
+        'url_names': url_names,
+        'selected_url_name': url_name,
+        'profiling_enabled': settings.PROFILING_ENABLED,
+        'page_title': 'Request Profiles',
+    }
+
+    return render(request, 'registrations/admin_profiles.html', context)
+
+@login_required
+@user_passes_test(is_staff_user)
+def admin_profile_download(request, name, extension):
+    """One profile file, as an attachment"""
+    path = profiling.profile_path(name, '.' + extension)
+    if path is None:
+        raise Http404('Profile not found')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=name + '.' + extension,
+                        content_type='text/plain' if extension == 'folded' else 'application/octet-stream')
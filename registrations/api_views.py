@@ -0,0 +1,198 @@
+"""
+Read-only JSON API for the current draw, public stats, job listings and
+the logged-in user's summary.
+
+Rows are read with values() and serialized directly, with orjson when it
+is installed. Every response carries an ETag of its body, so clients and
+CDNs revalidate with 304 Not Modified, and a Cache-Control header:
+
+    /api/draw/   public, API_DRAW_MAX_AGE
+    /api/stats/  public, API_STATS_MAX_AGE
+    /api/jobs/   public, API_JOBS_MAX_AGE
+    /api/me/     private, revalidated on every use
+
+Public bodies are also kept in the cache under the page cache groups they
+depend on, so a change shows up at once and polling costs no queries.
+The public views never touch the session, so responses do not vary on
+Cookie and a CDN can share them.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_http_methods
+import hashlib
+import json
+
+from .cache import DRAW_STATS, JOB_LISTINGS, get_group_version
+from .models import (
+    ArchivedPayment, ArchivedWinner, JobListing, MonthlyDraw, Payment, Registration, Winner,
+)
+from .odds import current_draw_month, get_odds_snapshot
+
+try:
+    import orjson
+except ImportError:  # Serialized with the standard library when the package is missing
+    orjson = None
+
+JOB_FIELDS = ['id', 'title', 'description', 'job_type', 'salary_range', 'requirements', 'created_date']
+WIN_FIELDS = ['monthly_draw__draw_month', 'prize_type', 'prize_details', 'is_claimed', 'claim_date', 'created_date']
+
+
+def dumps(data):
+    """JSON bytes of plain dicts and lists, dates and decimals included"""
+    if orjson is not None:
+        return orjson.dumps(data, default=str)
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(request, body, max_age=None):
+    """
+    The body with its ETag, or 304 Not Modified when the client has it.
+    Without max_age the response is private to the user.
+    """
+    response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = f'"{hashlib.md5(body).hexdigest()}"'
+    if max_age is None:
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Cookie',))
+    else:
+        patch_cache_control(response, public=True, max_age=max_age)
+    return get_conditional_response(request, etag=response['ETag'], response=response)
+
+
+def cached_value(name, depends_on, timeout, build):
+    """build(), cached until a group it depends on is invalidated"""
+    versions = '.'.join(f"{group}{get_group_version(group)}" for group in depends_on)
+    key = f"api:{name}:{versions}"
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, timeout)
+    return value
+
+
+def cached_body(name, depends_on, timeout, build):
+    """Serialized build(), cached until a group it depends on is invalidated"""
+    return cached_value(name, depends_on, timeout, lambda: dumps(build()))
+
+
+def _draw():
+    snapshot = get_odds_snapshot()
+    draw = snapshot['draw']
+    return {
+        'draw_month': draw['draw_month'].strftime('%Y-%m'),
+        'status': draw['status'],
+        'minimum_participants': draw['minimum_participants'],
+        'current_participants': draw['current_participants'],
+        'winners_selected': draw['winners_selected'],
+        'is_ready_for_draw': draw['is_ready_for_draw'],
+        'paid_entrants': snapshot['paid_entrants'],
+        'job_slots': snapshot['job_slots'],
+        'income_slots': snapshot['income_slots'],
+        'win_probability': snapshot['win_probability'],
+    }
+
+
+@require_http_methods(["GET", "HEAD"])
+def api_draw(request):
+    """The current month's draw and the odds of winning it"""
+    body = cached_body('draw', [DRAW_STATS], settings.API_DRAW_MAX_AGE, _draw)
+    return json_response(request, body, settings.API_DRAW_MAX_AGE)
+
+
+def _stats():
+    active = Registration.objects.filter(is_active=True)
+    winners = {}
+    for model in (Winner, ArchivedWinner):
+        for row in model.objects.values('prize_type').annotate(count=Count('id')).order_by():
+            winners[row['prize_type']] = winners.get(row['prize_type'], 0) + row['count']
+    return {
+        'participants': active.count(),
+        'regions': list(active.values('region').annotate(count=Count('id')).order_by('-count', 'region')),
+        'draws_completed': MonthlyDraw.objects.filter(winners_selected=True).count(),
+        'winners': winners,
+        'active_jobs': JobListing.objects.filter(is_active=True).count(),
+    }
+
+
+@require_http_methods(["GET", "HEAD"])
+def api_stats(request):
+    """Participants per region, completed draws and winners per prize"""
+    body = cached_body('stats', [DRAW_STATS, JOB_LISTINGS], settings.API_STATS_MAX_AGE, _stats)
+    return json_response(request, body, settings.API_STATS_MAX_AGE)
+
+
+def _jobs(page, count):
+    listings = JobListing.objects.filter(is_active=True).order_by('-created_date', '-id')
+    size = settings.API_JOBS_PAGE_SIZE
+    return {
+        'count': count,
+        'page': page,
+        'pages': max(1, -(-count // size)),
+        'results': list(listings.values(*JOB_FIELDS)[(page - 1) * size:page * size]),
+    }
+
+
+@require_http_methods(["GET", "HEAD"])
+def api_jobs(request):
+    """Active job listings, newest first, API_JOBS_PAGE_SIZE per ?page="""
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+    count = cached_value(
+        'jobs:count', [JOB_LISTINGS], settings.API_JOBS_MAX_AGE,
+        lambda: JobListing.objects.filter(is_active=True).count(),
+    )
+    # Checked before the page goes into a cache key, so made-up pages cannot flood the cache
+    if page > max(1, -(-count // settings.API_JOBS_PAGE_SIZE)):
+        return JsonResponse({'error': 'No such page.'}, status=404)
+    body = cached_body(f'jobs:{page}', [JOB_LISTINGS], settings.API_JOBS_MAX_AGE, lambda: _jobs(page, count))
+    return json_response(request, body, settings.API_JOBS_MAX_AGE)
+
+
+@require_http_methods(["GET", "HEAD"])
+def api_me(request):
+    """The logged-in user's registration, payments and wins"""
+    registration = request.registration if request.user.is_authenticated else None
+    if not registration:
+        response = JsonResponse({'error': 'Log in with a registered account.'}, status=401)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+    current_month = current_draw_month()
+    paid = {'registration_id': registration.pk, 'status': 'success'}
+    months_paid = 0
+    last_paid_month = None
+    for model in (Payment, ArchivedPayment):
+        row = model.objects.filter(**paid).aggregate(months=Count('month_paid_for', distinct=True), last=Max('month_paid_for'))
+        months_paid += row['months']
+        if row['last'] and (last_paid_month is None or row['last'] > last_paid_month):
+            last_paid_month = row['last']
+
+    wins = Winner.objects.filter(registration_id=registration.pk).values(*WIN_FIELDS).union(
+        ArchivedWinner.objects.filter(registration_id=registration.pk).values(*WIN_FIELDS), all=True,
+    ).order_by('-created_date')
+
+    body = dumps({
+        'registration': Registration.objects.filter(pk=registration.pk).values(
+            'id', 'first_name', 'last_name', 'email', 'region', 'mobile_money_provider',
+            'language', 'registration_date', 'is_active',
+        ).first(),
+        'payments': {
+            'months_paid': months_paid,
+            'last_paid_month': last_paid_month,
+            'paid_this_month': last_paid_month is not None and last_paid_month >= current_month,
+        },
+        'wins': [
+            {
+                'draw_month': win.pop('monthly_draw__draw_month').strftime('%Y-%m'),
+                **win,
+            }
+            for win in wins
+        ],
+    })
+    return json_response(request, body)
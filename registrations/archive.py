@@ -0,0 +1,141 @@
+"""
+Archival of old payments and draw winners.
+
+Payments and winners only ever grow, while nearly every query is about the
+last few months. Rows for months more than ARCHIVE_AFTER_MONTHS ago move to
+the Archived* tables, keeping their ids, so the hot tables stay the size of
+that window:
+
+    payments  any status but pending, for a month before the cutoff (or
+              created before it when not for a month)
+    winners   of draws before the cutoff, with all their payouts, once no
+              payout is scheduled, processing or failed (failed payouts can
+              still be retried)
+
+Each batch is copied with INSERT ... SELECT and deleted in one transaction,
+so a run can be stopped at any point and the next one carries on where it
+left off. Pages that show old rows read both tables through the helpers
+at the bottom.
+"""
+from datetime import datetime, time
+import heapq
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ArchivedPayment, ArchivedPayout, ArchivedWinner, Payment, Payout, Winner
+from .odds import current_draw_month
+from .payouts import add_months
+
+# Payouts that may still change; their winners stay in the hot tables
+OPEN_PAYOUT_STATUSES = ['scheduled', 'processing', 'failed']
+
+
+def cutoff_month(months=None):
+    """First month that is kept in the hot tables"""
+    months = settings.ARCHIVE_AFTER_MONTHS if months is None else months
+    return add_months(current_draw_month(), -months)
+
+
+def archivable_payments(cutoff):
+    start = timezone.make_aware(datetime.combine(cutoff, time.min))
+    return Payment.objects.exclude(status='pending').filter(
+        Q(month_paid_for__lt=cutoff) | Q(month_paid_for__isnull=True, created_date__lt=start)
+    )
+
+
+def archivable_winners(cutoff):
+    return Winner.objects.filter(monthly_draw__draw_month__lt=cutoff).exclude(
+        payouts__status__in=OPEN_PAYOUT_STATUSES,
+    )
+
+
+def _move(cursor, hot, cold, column, ids):
+    """Copy the rows of ``hot`` whose ``column`` is in ``ids`` to ``cold``, then delete them"""
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in cold._meta.concrete_fields)
+    condition = f"{quote(column)} IN ({', '.join(['%s'] * len(ids))})"
+    cursor.execute(
+        f"INSERT INTO {quote(cold._meta.db_table)} ({columns}) "
+        f"SELECT {columns} FROM {quote(hot._meta.db_table)} WHERE {condition}",
+        ids,
+    )
+    cursor.execute(f"DELETE FROM {quote(hot._meta.db_table)} WHERE {condition}", ids)
+    return cursor.rowcount
+
+
+def _archive(queryset, move, batch_size, log):
+    """Move the queryset's rows in id order, one transaction per batch; returns the rows moved"""
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    moved = 0
+    last_id = 0
+    while True:
+        # Rows are picked inside the transaction, which holds the write lock,
+        # so none can change between the check and the move
+        with transaction.atomic(), connection.cursor() as cursor:
+            ids = list(queryset.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return moved
+            move(cursor, ids)
+        last_id = ids[-1]
+        moved += len(ids)
+        if log:
+            log(moved)
+
+
+def archive_payments(cutoff, batch_size=None, log=None):
+    """Move settled payments from before the cutoff month; returns the number moved"""
+    def move(cursor, ids):
+        _move(cursor, Payment, ArchivedPayment, 'id', ids)
+    return _archive(archivable_payments(cutoff), move, batch_size, log)
+
+
+def archive_winners(cutoff, batch_size=None, log=None):
+    """Move winners of draws before the cutoff month with their payouts; returns the winners moved"""
+    def move(cursor, ids):
+        # Winners first: the archived payouts point at them
+        quote = connection.ops.quote_name
+        placeholders = ', '.join(['%s'] * len(ids))
+        columns = ', '.join(quote(field.column) for field in ArchivedWinner._meta.concrete_fields)
+        cursor.execute(
+            f"INSERT INTO {quote(ArchivedWinner._meta.db_table)} ({columns}) "
+            f"SELECT {columns} FROM {quote(Winner._meta.db_table)} WHERE id IN ({placeholders})",
+            ids,
+        )
+        _move(cursor, Payout, ArchivedPayout, 'winner_id', ids)
+        cursor.execute(f"DELETE FROM {quote(Winner._meta.db_table)} WHERE id IN ({placeholders})", ids)
+    return _archive(archivable_winners(cutoff), move, batch_size, log)
+
+
+def newest_first(*querysets):
+    """Merge querysets each ordered by -created_date into one list"""
+    return list(heapq.merge(*querysets, key=attrgetter('created_date'), reverse=True))
+
+
+def payment_history(registration, archived=False):
+    """The registration's payments, newest first; archived ones only when asked for"""
+    payments = Payment.objects.filter(registration=registration).order_by('-created_date')
+    if not archived:
+        return payments
+    return newest_first(
+        payments, ArchivedPayment.objects.filter(registration=registration).order_by('-created_date'),
+    )
+
+
+def winner_history(**filters):
+    """Hot and archived winners matching the filters, newest first, with their registration and draw"""
+    return newest_first(*(
+        model.objects.filter(**filters).select_related('registration', 'monthly_draw').order_by('-created_date')
+        for model in (Winner, ArchivedWinner)
+    ))
+
+
+def winner_registrations(*args, **filters):
+    """Ids of the registrations with a hot or archived win matching the filters"""
+    return {
+        pk for model in (Winner, ArchivedWinner)
+        for pk in model.objects.filter(*args, **filters).values_list('registration_id', flat=True)
+    }
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+
+def user_cache_key(user_id):
+    return f"auth_user:{user_id}"
+
+
+def invalidate_cached_user(user_id):
+    """Forget the cached user (and registration) after either one changes"""
+    if user_id is not None:
+        cache.delete(user_cache_key(user_id))
+
+
+class RegistrationModelBackend(ModelBackend):
+    """
+    ModelBackend that loads the user's registration in the same query.
+
+    Views read it as ``request.registration`` (see RegistrationMiddleware)
+    without another round-trip. With REGISTRATION_CACHE_TIMEOUT set, the
+    user and registration are also cached per user for that many seconds;
+    save/delete signals on either model drop the cached copy.
+    """
+
+    def get_user(self, user_id):
+        timeout = getattr(settings, 'REGISTRATION_CACHE_TIMEOUT', 0)
+        if timeout:
+            user = cache.get(user_cache_key(user_id))
+            if user is not None:
+                return user if self.user_can_authenticate(user) else None
+
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.select_related('registration').get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+
+        if timeout:
+            cache.set(user_cache_key(user_id), user, timeout)
+
+        return user if self.user_can_authenticate(user) else None
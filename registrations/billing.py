@@ -0,0 +1,261 @@
+"""
+Recurring monthly billing with saved Paystack authorizations.
+
+A run walks active subscribers in registration id order, one batch at a
+time. Each batch inserts its pending payments with one bulk_create, charges
+them from a bounded thread pool under a shared rate limit, then records the
+results and the run checkpoint in one transaction. An interrupted run picks
+up after the last finished batch.
+
+Charges whose outcome is unknown (timeout, lost response) stay pending and
+are verified after the last batch, and again by a rerun, instead of being
+charged a second time.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import Payment, PaymentAuthorization, BillingRun
+from .payments import discard_pending_payments, open_payments, settle_payments
+from .paystack import get_gateway, PaystackError, PaystackUnavailable
+
+REFERENCE_PREFIX = 'JM-BILL-'
+
+# Charge was never sent (run stopping); the pending payment is dropped
+NOT_ATTEMPTED = object()
+
+
+class TokenBucket:
+    """Allow ``rate`` calls per second on average, in bursts of up to ``capacity``"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def billing_reference(registration_id, month):
+    """One reference per subscriber and month, so Paystack rejects a second charge"""
+    return f"{REFERENCE_PREFIX}{month:%Y%m}-{registration_id}"
+
+
+def due_authorizations(month):
+    """Active authorizations not yet billed for the month"""
+    billed = Payment.objects.filter(
+        registration_id=OuterRef('registration_id'),
+        month_paid_for=month,
+    ).filter(Q(status__in=['success', 'pending']) | Q(reference__startswith=REFERENCE_PREFIX))
+
+    return PaymentAuthorization.objects.filter(
+        is_active=True,
+        registration__is_active=True,
+    ).exclude(Exists(billed))
+
+
+def due_subscribers(month, after_id, limit):
+    """Next batch of due subscribers after the checkpoint"""
+    return list(
+        due_authorizations(month).filter(
+            registration_id__gt=after_id,
+        ).order_by('registration_id').values(
+            'registration_id', 'authorization_code', 'email',
+            'registration__user_id', 'registration__phone_number', 'registration__mobile_money_provider',
+        )[:limit]
+    )
+
+
+def create_pending_payments(month, subscribers):
+    """Insert one pending payment per subscriber and return them keyed by reference"""
+    amount = settings.MONTHLY_SUBSCRIPTION_AMOUNT / 100  # Convert to GHS for storage
+    references = [billing_reference(subscriber['registration_id'], month) for subscriber in subscribers]
+    with transaction.atomic():
+        # Pending payments left by an interrupted run are already in the ledger
+        existing = set(Payment.objects.filter(reference__in=references).values_list('reference', flat=True))
+        Payment.objects.bulk_create([
+            Payment(
+                registration_id=subscriber['registration_id'],
+                user_id=subscriber['registration__user_id'],
+                amount=amount,
+                payment_type='monthly',
+                reference=reference,
+                email=subscriber['email'],
+                phone_number=subscriber['registration__phone_number'],
+                month_paid_for=month,
+                mobile_money_provider=subscriber['registration__mobile_money_provider'],
+            )
+            for subscriber, reference in zip(subscribers, references)
+            if reference not in existing
+        ], ignore_conflicts=True)
+
+        # A subscriber who opened a checkout meanwhile hits the pending constraint and is skipped
+        payments = list(Payment.objects.filter(reference__in=references, status='pending'))
+        open_payments([payment for payment in payments if payment.reference not in existing])
+    return {payment.reference: payment for payment in payments}
+
+
+def charge_outcome(response):
+    """Map a charge or verify response to (status, channel, reference), or None if undecided"""
+    data = response.get('data') or {}
+    if not response.get('status'):
+        # Rejected outright, e.g. an authorization that is no longer valid
+        return ('failed', None, None)
+    if data.get('status') == 'success':
+        return ('success', data.get('channel'), data.get('reference'))
+    if data.get('status') in ('failed', 'abandoned', 'reversed'):
+        return ('failed', data.get('channel'), data.get('reference'))
+    # send_otp, pending, ...: the customer still has to act
+    return None
+
+
+def _charge(gateway, bucket, stop, month, subscriber, payment):
+    if stop.is_set():
+        return payment.pk, NOT_ATTEMPTED
+    bucket.acquire()
+    try:
+        response = gateway.charge_authorization(
+            email=subscriber['email'],
+            amount=settings.MONTHLY_SUBSCRIPTION_AMOUNT,
+            authorization_code=subscriber['authorization_code'],
+            reference=payment.reference,
+            metadata={
+                'payment_id': payment.pk,
+                'registration_id': subscriber['registration_id'],
+                'month': month.strftime('%Y-%m'),
+                'billing_run': True,
+            },
+        )
+    except PaystackUnavailable:
+        stop.set()
+        return payment.pk, NOT_ATTEMPTED
+    except PaystackError:
+        return payment.pk, None
+    return payment.pk, charge_outcome(response)
+
+
+def _verify(gateway, bucket, stop, payment):
+    if stop.is_set():
+        return payment.pk, None
+    bucket.acquire()
+    try:
+        response = gateway.verify_transaction(payment.reference)
+    except PaystackUnavailable:
+        stop.set()
+        return payment.pk, None
+    except PaystackError:
+        return payment.pk, None
+    if not response.get('status'):
+        # Paystack never saw this reference, so it can be charged again
+        return payment.pk, NOT_ATTEMPTED
+    return payment.pk, charge_outcome(response)
+
+
+def _run_in_pool(pool, calls):
+    return dict(future.result() for future in as_completed([pool.submit(*call) for call in calls]))
+
+
+def _record(run, month, results, checkpoint=None):
+    """Store one batch of results and the checkpoint atomically"""
+    outcomes = {pk: outcome for pk, outcome in results.items() if outcome not in (None, NOT_ATTEMPTED)}
+    not_attempted = [pk for pk, outcome in results.items() if outcome is NOT_ATTEMPTED]
+
+    with transaction.atomic():
+        charged = settle_payments(month, outcomes) if outcomes else 0
+        if not_attempted:
+            discard_pending_payments(not_attempted)
+        run.charged += charged
+        run.failed += sum(1 for outcome in outcomes.values() if outcome[0] == 'failed')
+        if checkpoint is not None:
+            run.last_registration_id = checkpoint
+        run.save(update_fields=['charged', 'failed', 'last_registration_id', 'updated_date'])
+    return not_attempted
+
+
+def _settle_undecided(run, month, pool, gateway, bucket, stop, log):
+    """Verify pending billing charges; returns how many are still undecided"""
+    unsettled = list(Payment.objects.filter(
+        month_paid_for=month,
+        status='pending',
+        reference__startswith=REFERENCE_PREFIX,
+    ).only('id', 'reference', 'registration_id'))
+    if not unsettled:
+        return 0
+
+    log(f"Verifying {len(unsettled)} undecided charges")
+    results = _run_in_pool(pool, [(_verify, gateway, bucket, stop, payment) for payment in unsettled])
+    retry = set(_record(run, month, results))
+    if retry:
+        # Rewind so the next batches pick these subscribers up again
+        first = min(payment.registration_id for payment in unsettled if payment.pk in retry)
+        run.last_registration_id = min(run.last_registration_id, first - 1)
+        run.save(update_fields=['last_registration_id', 'updated_date'])
+    return sum(1 for outcome in results.values() if outcome is None)
+
+
+def run_billing(month, gateway=None, batch_size=None, workers=None, rate=None, log=None):
+    """Charge every due subscriber for the month; safe to rerun until completed"""
+    gateway = gateway or get_gateway()
+    batch_size = batch_size or settings.BILLING_BATCH_SIZE
+    workers = workers or settings.BILLING_WORKERS
+    bucket = TokenBucket(rate or settings.BILLING_RATE_LIMIT)
+    log = log or (lambda message: None)
+    stop = threading.Event()
+
+    run, created = BillingRun.objects.get_or_create(month=month)
+    if run.status == 'completed':
+        log(f"{run} already finished")
+        return run
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Charges left undecided by an earlier, interrupted run
+        _settle_undecided(run, month, pool, gateway, bucket, stop, log)
+
+        while not stop.is_set():
+            subscribers = due_subscribers(month, run.last_registration_id, batch_size)
+            if not subscribers:
+                break
+
+            payments = create_pending_payments(month, subscribers)
+            calls = [
+                (_charge, gateway, bucket, stop, month, subscriber, payments[reference])
+                for subscriber in subscribers
+                if (reference := billing_reference(subscriber['registration_id'], month)) in payments
+            ]
+            results = _run_in_pool(pool, calls)
+
+            # An aborted batch is retried from its start; its finished charges are already excluded
+            checkpoint = None if stop.is_set() else subscribers[-1]['registration_id']
+            _record(run, month, results, checkpoint)
+            log(f"Up to registration {run.last_registration_id}: {run.charged} charged, {run.failed} failed")
+
+        if not stop.is_set():
+            undecided = _settle_undecided(run, month, pool, gateway, bucket, stop, log)
+            if undecided:
+                log(f"{undecided} charges await customer action; the webhook settles them")
+
+    if stop.is_set():
+        log("Paystack is unavailable; stopping. Rerun to resume.")
+        return run
+
+    run.status = 'completed'
+    run.finished_at = timezone.now()
+    run.save(update_fields=['status', 'finished_at', 'updated_date'])
+    return run
@@ -0,0 +1,74 @@
+"""
+Performance budgets for the pages in urls.py, enforced by registrations.tests.
+
+The tests load every table with each of BUDGET_SCALES rows in turn and
+request each page as the given user:
+
+    queries  most queries the page may make; the count must also be the
+             same at every scale, so an N+1 fails even within budget
+    ms       slowest acceptable response at the largest scale: the time
+             measured when the budget was set plus 50%, and at least 50 ms.
+             Only checked with BUDGET_TIMINGS=1, as it depends on the machine
+
+Pages in UNPAGINATED render a whole table, so their time grows with it and
+they have no ms budget until they are paginated.
+
+A new page needs an entry here, or in UNBUDGETED with the reason.
+"""
+
+BUDGET_SCALES = [10, 1000, 10000]
+
+VIEW_BUDGETS = {
+    # Public pages
+    'home': {'user': None, 'queries': 2, 'ms': 50},
+    'registration': {'user': None, 'queries': 0, 'ms': 50},
+    'registration_success': {'user': None, 'queries': 0, 'ms': 50},
+    'faq': {'user': None, 'queries': 0, 'ms': 50},
+    'how_it_works': {'user': None, 'queries': 0, 'ms': 50},
+    'user_register': {'user': None, 'queries': 0, 'ms': 50},
+    'user_login': {'user': None, 'queries': 0, 'ms': 50},
+    'jobs': {'user': None, 'queries': 4, 'ms': 50},
+    # The single event sent under WSGI
+    'draw_progress_stream': {'user': None, 'queries': 2, 'ms': 50},
+    'api_draw': {'user': None, 'queries': 3, 'ms': 50},
+    'api_stats': {'user': None, 'queries': 6, 'ms': 50},
+    'api_jobs': {'user': None, 'queries': 2, 'ms': 50},
+
+    # A member who has paid and won every month
+    'user_dashboard': {'user': 'member', 'queries': 7},
+    'user_profile': {'user': 'member', 'queries': 2, 'ms': 50},
+    'user_winners': {'user': 'member', 'queries': 5},
+    'payment_page': {'user': 'member', 'queries': 2, 'ms': 50},
+    'payment_history': {'user': 'member', 'queries': 4},
+    'api_me': {'user': 'member', 'queries': 6},
+
+    # Staff pages
+    'admin_dashboard': {'user': 'staff', 'queries': 10, 'ms': 50},
+    'admin_registrations': {'user': 'staff', 'queries': 3},
+    'admin_monthly_draws': {'user': 'staff', 'queries': 3},
+    'admin_winners': {'user': 'staff', 'queries': 3},
+    'admin_jobs': {'user': 'staff', 'queries': 3},
+    'admin_registration_detail': {'user': 'staff', 'queries': 4, 'ms': 50},
+    'admin_profiles': {'user': 'staff', 'queries': 2, 'ms': 50},
+}
+
+UNPAGINATED = {
+    'user_dashboard': "every one of the member's wins",
+    'user_winners': "every one of the member's wins",
+    'payment_history': "every one of the member's payments",
+    'api_me': "every one of the member's wins",
+    'admin_registrations': 'every registration',
+    'admin_monthly_draws': 'every draw',
+    'admin_winners': 'every winner',
+    'admin_jobs': 'every job listing',
+}
+
+UNBUDGETED = {
+    'set_language': 'POST only',
+    'get_language': 'reads the session only',
+    'user_logout': 'redirects',
+    'verify_payment': 'calls Paystack',
+    'paystack_webhook': 'POST only',
+    'draw_entry_proof': "reads a closed draw's snapshot files",
+    'admin_profile_download': 'serves a file from disk',
+}
@@ -0,0 +1,89 @@
+from functools import wraps
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_max_age
+
+# Cache groups a page can depend on. Bumping a group's version makes every
+# page cached under the old version unreachable without having to know its key.
+DRAW_STATS = 'draw_stats'
+JOB_LISTINGS = 'job_listings'
+
+
+def _group_version_key(group):
+    return f"page_cache:version:{group}"
+
+
+def get_group_version(group):
+    """Current version number of a page cache group"""
+    return cache.get_or_set(_group_version_key(group), 1, timeout=None)
+
+
+def invalidate_page_cache(group):
+    """Drop every cached page that depends on the given group"""
+    try:
+        cache.incr(_group_version_key(group))
+    except ValueError:
+        cache.set(_group_version_key(group), 2, timeout=None)
+
+
+def page_cache_key(request, language, depends_on=()):
+    """Cache key for a public page: URL + language + group versions"""
+    versions = '.'.join(f"{group}{get_group_version(group)}" for group in depends_on)
+    path = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+    return f"page_cache:{language}:{versions}:{path}"
+
+
+def is_cacheable_request(request):
+    """Only anonymous GET/HEAD requests without pending flash messages are cached"""
+    if request.method not in ('GET', 'HEAD'):
+        return False
+
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return False
+
+    # Peeking at the message storage does not mark the messages as used,
+    # so they are still rendered by the view on a bypass.
+    storage = getattr(request, '_messages', None)
+    if storage is not None and len(storage):
+        return False
+
+    return True
+
+
+def cache_public_page(timeout=None, depends_on=()):
+    """
+    Cache the rendered HTML of a public page per URL and language.
+
+    Logged-in users and requests carrying flash messages always hit the view,
+    and responses the view marked max-age=0 (add_never_cache_headers) are not
+    kept. Pages listing a group in ``depends_on`` are invalidated together
+    when ``invalidate_page_cache(group)`` is called.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not getattr(settings, 'PAGE_CACHE_ENABLED', True) or not is_cacheable_request(request):
+                return view_func(request, *args, **kwargs)
+
+            language = request.session.get('language', 'en')
+            key = page_cache_key(request, language, depends_on)
+
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+
+            response = view_func(request, *args, **kwargs)
+
+            if (response.status_code == 200 and not response.streaming and not response.cookies
+                    and get_max_age(response) != 0):
+                page_timeout = timeout if timeout is not None else settings.PAGE_CACHE_TIMEOUT
+                cache.set(key, (response.content, response['Content-Type']), page_timeout)
+
+            return response
+        return wrapper
+    return decorator
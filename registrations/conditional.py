@@ -0,0 +1,123 @@
+from functools import wraps
+import hashlib
+
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from .models import Payment, Registration, Winner
+from .odds import get_odds_snapshot
+
+
+def _has_pending_messages(request):
+    storage = getattr(request, '_messages', None)
+    return storage is not None and len(storage) > 0
+
+
+def _make_etag(request, *parts):
+    """Hash the data versions a page depends on into an ETag"""
+    language = request.session.get('language', 'en')
+    raw = '|'.join(str(part) for part in (request.user.pk, language) + parts)
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def _per_registration(model, aggregate):
+    """
+    Correlated subquery aggregating the registration's rows of a model.
+
+    Joining winners and payments in one aggregate would multiply the rows,
+    making a member with years of history quadratic to validate.
+    """
+    rows = model.objects.filter(registration=OuterRef('pk')).order_by().values('registration')
+    return Subquery(rows.annotate(value=aggregate).values('value'))
+
+
+def _registration_versions(request):
+    """
+    One aggregate query for the data versions of the user's registration.
+
+    Cached on the request, which may ask for it more than once.
+    """
+    if not hasattr(request, '_registration_versions'):
+        if not request.registration:
+            request._registration_versions = None
+            return None
+        request._registration_versions = Registration.objects.filter(
+            pk=request.registration.pk
+        ).annotate(
+            win_count=Coalesce(_per_registration(Winner, Count('pk')), 0),
+            last_win=_per_registration(Winner, Max('created_date')),
+            last_claim=_per_registration(Winner, Max('claim_date')),
+            payment_count=Coalesce(_per_registration(Payment, Count('pk')), 0),
+            last_payment=_per_registration(Payment, Max('updated_date')),
+        ).values(
+            'id', 'updated_date', 'win_count', 'last_win', 'last_claim',
+            'payment_count', 'last_payment',
+        ).first()
+    return request._registration_versions
+
+
+def dashboard_etag(request):
+    """
+    Registration, winner history and current draw progress.
+
+    Winner changes touch the registration's updated_date and the draw state
+    comes from the cached odds snapshot, so no query is needed at all.
+    """
+    registration = request.registration
+    if not registration or _has_pending_messages(request):
+        return None
+
+    snapshot = get_odds_snapshot()
+    draw = snapshot['draw']
+
+    return _make_etag(
+        request, registration.updated_date, draw['draw_month'], draw['status'],
+        draw['current_participants'], draw['minimum_participants'],
+        snapshot['paid_entrants'], snapshot['prize_slots'],
+    )
+
+
+def winners_etag(request):
+    """Winner rows of the user's registration"""
+    versions = _registration_versions(request)
+    if versions is None or _has_pending_messages(request):
+        return None
+
+    return _make_etag(request, versions['win_count'], versions['last_win'], versions['last_claim'])
+
+
+def payment_history_etag(request):
+    """Payment rows of the user's registration"""
+    versions = _registration_versions(request)
+    if versions is None or _has_pending_messages(request):
+        return None
+
+    # Archiving payments changes the count, so the archived view needs no version of its own
+    return _make_etag(request, versions['payment_count'], versions['last_payment'], request.GET.get('archived') == '1')
+
+
+def conditional_page(etag_func=None, last_modified_func=None):
+    """
+    Answer conditional GETs for a per-user page with 304 Not Modified.
+
+    Validators are computed from data versions before the view runs, so a
+    matching request never renders the template. Responses must be
+    revalidated on every use and vary on the session cookie.
+
+    Pages listing rows should have no Last-Modified validator: the latest
+    timestamp does not change when rows are deleted or archived, while the
+    row counts in their ETag do.
+    """
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,533 @@
+"""
+Deterministic, verifiable draw engine.
+
+At draw time every eligible registration is written, sorted by id, to a
+NumPy ``.npy`` file of (id, region, months_paid) records and its SHA-256 is
+stored on the MonthlyDraw as a commitment. Winners are derived from the
+snapshot and a seed only, so anyone can re-derive them without the database.
+All randomness comes from counter-based generators keyed by
+
+    key = SHA-256(seed ":" snapshot_sha256)
+
+Strategies (STRATEGIES), each drawing the job winners first and then the
+basic income winners from the entrants left:
+
+    uniform     sparse Fisher-Yates shuffle driven by SHA-256(key || counter),
+                O(k) time and memory for k winners
+    stratified  winners split over regions in proportion to their entrants
+                (largest remainder), then uniform within each region
+    weighted    chance proportional to the months an entrant has paid for,
+                from a Walker alias table (O(n) to build, O(1) per sample)
+                with batched, vectorized Philox sampling and rejection of
+                entrants already drawn: O(n + k log k) overall
+
+A Merkle tree over the snapshot lets each participant check they were in
+the draw. Its levels are stored leaves first in a ``.merkle`` file next to
+the snapshot (32 bytes per node) and the root on the MonthlyDraw:
+
+    leaf = SHA-256(0x00 || id as int64 LE)    node = SHA-256(0x01 || left || right)
+
+A node without a sibling moves up a level unchanged.
+
+Registrations that won a draw less than WINNER_COOLDOWN_MONTHS away stay in
+the snapshot but can't win; the barred ids are stored on the MonthlyDraw so
+the draw can still be re-derived.
+"""
+from bisect import bisect_left
+from hashlib import sha256
+import os
+import secrets
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+import numpy as np
+
+from .archive import winner_registrations
+from .models import ArchivedPayment, MonthlyDraw, Payment, Registration
+from .payouts import add_months
+
+SNAPSHOT_DTYPE = np.dtype([('id', '<i8'), ('region', 'u1'), ('months_paid', '<u2')])
+
+# Region codes in snapshots are indexes into this list; only ever append to it
+REGIONS = [region for region, _ in Registration.REGION_CHOICES]
+
+STRATEGIES = ['uniform', 'stratified', 'weighted']
+
+HASH_SIZE = 32
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+
+
+class SnapshotMismatch(Exception):
+    """The snapshot file does not match its recorded SHA-256"""
+
+
+class CounterRng:
+    """Uniform integers from SHA-256 of a key and a 64-bit counter"""
+
+    def __init__(self, key, stream=''):
+        # Independent streams (winners, jobs) share the key
+        self.key = sha256(key + stream.encode()).digest()
+        self.counter = 0
+
+    def next64(self):
+        block = sha256(self.key + self.counter.to_bytes(8, 'little')).digest()
+        self.counter += 1
+        return int.from_bytes(block[:8], 'little')
+
+    def below(self, n):
+        """Uniform in [0, n), rejecting the biased top of the 64-bit range"""
+        limit = 2 ** 64 - 2 ** 64 % n
+        while True:
+            value = self.next64()
+            if value < limit:
+                return value % n
+
+    def sample(self, n, k):
+        """k distinct positions of range(n) in draw order"""
+        return SparseShuffle(self, n).take(k)
+
+
+class SparseShuffle:
+    """Fisher-Yates shuffle of range(n) that only stores the swapped positions"""
+
+    def __init__(self, rng, n):
+        self.rng = rng
+        self.n = int(n)
+        self.i = 0
+        self.swapped = {}
+
+    def take(self, k, blocked=()):
+        """The next k positions not in ``blocked``; later calls never repeat earlier ones"""
+        positions = []
+        while len(positions) < k and self.i < self.n:
+            i = self.i
+            j = i + self.rng.below(self.n - i)
+            position = self.swapped.get(j, j)
+            self.swapped[j] = self.swapped.get(i, i)
+            self.i += 1
+            if position not in blocked:
+                positions.append(position)
+        return positions
+
+
+class UniformStream:
+    """Batches of uniform floats in [0, 1) from the Philox counter-based generator"""
+
+    def __init__(self, key, stream=''):
+        words = np.frombuffer(sha256(key + stream.encode()).digest()[:16], dtype='<u8')
+        self.bit_generator = np.random.Philox(key=words)
+
+    def random(self, size):
+        # Built from the raw 64-bit outputs, which are fixed for a key, unlike
+        # Generator methods whose algorithms may change between NumPy versions
+        return (self.bit_generator.random_raw(size) >> np.uint64(11)) * (1.0 / 2 ** 53)
+
+
+class AliasTable:
+    """Walker alias table: O(1) samples from a discrete distribution"""
+
+    def __init__(self, weights):
+        n = len(weights)
+        total = np.sum(weights)
+        if not total > 0:
+            raise ValueError('An alias table needs weights with a positive sum')
+        prob = np.asarray(weights, dtype=np.float64) * (n / total)
+        alias = np.arange(n)
+        small = np.flatnonzero(prob < 1)
+        large = np.flatnonzero(prob >= 1)
+
+        # Vose's pairing, a whole batch of (small, large) pairs per step
+        while len(small) >= 64 and len(large) >= 64:
+            m = min(len(small), len(large))
+            s, l = small[:m], large[:m]
+            alias[s] = l
+            prob[l] -= 1 - prob[s]
+            small = np.concatenate([small[m:], l[prob[l] < 1]])
+            large = np.concatenate([large[m:], l[prob[l] >= 1]])
+
+        # A few heavy entries would take one step each; pair the rest one by one
+        small, large = small.tolist(), large.tolist()
+        while small and large:
+            s, l = small.pop(), large.pop()
+            alias[s] = l
+            prob[l] -= 1 - prob[s]
+            (small if prob[l] < 1 else large).append(l)
+        # Whatever is left only differs from 1 by rounding
+        prob[small] = 1
+        prob[large] = 1
+
+        self.prob = prob
+        self.alias = alias
+
+    def sample(self, stream, size):
+        n = len(self.prob)
+        columns = np.minimum((stream.random(size) * n).astype(np.int64), n - 1)
+        keep = stream.random(size) < self.prob[columns]
+        return np.where(keep, columns, self.alias[columns])
+
+
+def new_seed():
+    return secrets.token_hex(32)
+
+
+def draw_key(seed, snapshot_sha256):
+    """Bind the seed to the committed snapshot"""
+    return sha256(f"{seed}:{snapshot_sha256}".encode()).digest()
+
+
+def eligible_snapshot(draw_month):
+    """Snapshot records of the registrations that paid for the month, sorted by id"""
+    entrants = Registration.objects.filter(
+        is_active=True,
+        payments__month_paid_for=draw_month,
+        payments__status='success',
+    ).order_by('id').values_list('id', 'region').distinct()
+    region_codes = {region: code for code, region in enumerate(REGIONS)}
+    snapshot = np.fromiter(
+        ((pk, region_codes.get(region, region_codes['other']), 0) for pk, region in entrants.iterator(chunk_size=10000)),
+        dtype=SNAPSHOT_DTYPE,
+    )
+
+    # Months paid for up to the draw, counted in one grouped query per table;
+    # a registration's archived months are all older than its hot ones
+    counts = np.concatenate([
+        np.fromiter(
+            ((row['registration_id'], row['months']) for row in model.objects.filter(
+                status='success',
+                month_paid_for__lte=draw_month,
+                registration__is_active=True,
+            ).order_by('registration_id').values('registration_id').annotate(
+                months=Count('month_paid_for', distinct=True),
+            ).iterator(chunk_size=10000)),
+            dtype=[('id', '<i8'), ('months', '<i8')],
+        )
+        for model in (Payment, ArchivedPayment)
+    ])
+    positions = np.searchsorted(snapshot['id'], counts['id'])
+    found = positions < len(snapshot)
+    found[found] = snapshot['id'][positions[found]] == counts['id'][found]
+    months_paid = np.zeros(len(snapshot), dtype='<i8')
+    np.add.at(months_paid, positions[found], counts['months'][found])
+    snapshot['months_paid'] = np.minimum(months_paid, np.iinfo('<u2').max)
+    return snapshot
+
+
+def snapshot_digest(snapshot):
+    return sha256(np.ascontiguousarray(snapshot, dtype=SNAPSHOT_DTYPE).tobytes()).hexdigest()
+
+
+def snapshot_path(draw_month):
+    return os.path.join(settings.DRAW_SNAPSHOT_DIR, f"draw-{draw_month:%Y-%m}.npy")
+
+
+def write_snapshot(path, snapshot):
+    """Write the snapshot to a file; returns its SHA-256"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        np.save(f, np.asarray(snapshot, dtype=SNAPSHOT_DTYPE))
+    return snapshot_digest(snapshot)
+
+
+def load_snapshot(path, expected_sha256=None):
+    """Memory-map a snapshot, checking it against its commitment"""
+    snapshot = np.load(path, mmap_mode='r')
+    if snapshot.dtype != SNAPSHOT_DTYPE or snapshot.ndim != 1:
+        raise SnapshotMismatch(f"{path} is not a draw snapshot")
+    if expected_sha256 is not None and snapshot_digest(snapshot) != expected_sha256:
+        raise SnapshotMismatch(f"{path} does not match SHA-256 {expected_sha256}")
+    return snapshot
+
+
+def prepare_draw(draw_id, seed=None, strategy='uniform'):
+    """
+    Snapshot a draw's entrants and build its Merkle tree, once; returns the draw.
+
+    The slow part runs outside any transaction so several draws can be
+    prepared in parallel processes. The files are moved into place and
+    recorded with the draw row locked; a draw prepared meanwhile is kept.
+    A draw without eligible entrants is returned unprepared.
+    """
+    monthly_draw = MonthlyDraw.objects.get(pk=draw_id)
+    if monthly_draw.snapshot_sha256:
+        return monthly_draw
+    snapshot = eligible_snapshot(monthly_draw.draw_month)
+    if not len(snapshot):
+        return monthly_draw
+
+    path = snapshot_path(monthly_draw.draw_month)
+    suffix = f".{os.getpid()}.tmp"
+    digest = write_snapshot(path + suffix, snapshot)
+    merkle_root = build_merkle_tree(snapshot, merkle_path(path) + suffix)
+
+    with transaction.atomic():
+        monthly_draw = MonthlyDraw.objects.select_for_update().get(pk=draw_id)
+        if not monthly_draw.snapshot_sha256:
+            os.replace(path + suffix, path)
+            os.replace(merkle_path(path) + suffix, merkle_path(path))
+            monthly_draw.snapshot_file = path
+            monthly_draw.snapshot_sha256 = digest
+            monthly_draw.snapshot_size = len(snapshot)
+            monthly_draw.draw_seed = seed or new_seed()
+            monthly_draw.draw_strategy = strategy
+            monthly_draw.merkle_root = merkle_root
+            monthly_draw.save(update_fields=[
+                'snapshot_file', 'snapshot_sha256', 'snapshot_size', 'draw_seed', 'draw_strategy', 'merkle_root',
+            ])
+            return monthly_draw
+
+    os.remove(path + suffix)
+    os.remove(merkle_path(path) + suffix)
+    return monthly_draw
+
+
+def lock_for_selection(draw_id, cooldown):
+    """
+    Lock a draw and every draw less than ``cooldown`` months from it; returns
+    the draw and the registrations that won one of the others.
+
+    Call inside a transaction. Locking the whole window, in month order,
+    keeps concurrent selections of nearby months from picking the same
+    registration.
+    """
+    draw_month = MonthlyDraw.objects.values_list('draw_month', flat=True).get(pk=draw_id)
+    window = MonthlyDraw.objects.select_for_update().filter(
+        Q(pk=draw_id) | Q(
+            draw_month__gt=add_months(draw_month, -cooldown),
+            draw_month__lt=add_months(draw_month, cooldown),
+        )
+    ).order_by('draw_month')
+    draws = {monthly_draw.pk: monthly_draw for monthly_draw in window}
+    excluded = winner_registrations(monthly_draw__in=[pk for pk in draws if pk != draw_id])
+    return draws[draw_id], excluded
+
+
+def allocate(count, sizes):
+    """Split count over strata in proportion to their sizes, by largest remainder"""
+    sizes = np.asarray(sizes, dtype=np.int64)
+    total = int(sizes.sum())
+    if count >= total:
+        return sizes.copy()
+    quotas = sizes * count / total
+    allocation = np.floor(quotas).astype(np.int64)
+    # Ties go to the larger stratum, then to the first one
+    order = np.lexsort((np.arange(len(sizes)), -sizes, allocation - quotas))
+    allocation[order[:count - int(allocation.sum())]] += 1
+    return allocation
+
+
+def _uniform(snapshot, key, counts, blocked):
+    shuffle = SparseShuffle(CounterRng(key, 'winners'), len(snapshot))
+    return [shuffle.take(count, blocked) for count in counts]
+
+
+def _stratified(snapshot, key, counts, blocked):
+    regions = np.asarray(snapshot['region'])
+    sizes = np.bincount(regions, minlength=len(REGIONS))
+    # Positions grouped by region (a radix sort for 8-bit codes)
+    by_region = np.argsort(regions, kind='stable')
+    starts = np.concatenate([[0], np.cumsum(sizes)])
+    shuffles = [SparseShuffle(CounterRng(key, f'region:{code}'), size) for code, size in enumerate(sizes)]
+
+    # Blocked entrants as indexes within their region, and the entrants left per region
+    blocked_local = [set() for _ in REGIONS]
+    if blocked:
+        rank = np.empty(len(snapshot), dtype=np.int64)
+        rank[by_region] = np.arange(len(snapshot))
+        for position in blocked:
+            code = int(regions[position])
+            blocked_local[code].add(int(rank[position]) - int(starts[code]))
+    available = sizes - np.array([len(local) for local in blocked_local])
+
+    winners = []
+    for count in counts:
+        positions = []
+        for code, share in enumerate(allocate(count, available)):
+            local = shuffles[code].take(int(share), blocked_local[code])
+            positions.extend(int(by_region[starts[code] + index]) for index in local)
+            available[code] -= len(local)
+        winners.append(positions)
+    return winners
+
+
+def _weighted(snapshot, key, counts, blocked):
+    weights = np.asarray(snapshot['months_paid'], dtype=np.float64)
+    # Everyone in the draw paid for at least this month
+    weights = np.maximum(weights, 1)
+    weights[list(blocked)] = 0
+    if not sum(counts):
+        # Everyone may be blocked, leaving no weight to build a table from
+        return [[] for _ in counts]
+    stream = UniformStream(key, 'weighted')
+    table = AliasTable(weights)
+    total = weights.sum()
+    drawn = set()
+    drawn_weight = 0.0
+
+    winners = []
+    for count in counts:
+        positions = []
+        while len(positions) < count:
+            if drawn_weight > total / 2:
+                # Most samples would be rejected; rebuild without the entrants drawn
+                weights[list(drawn)] = 0
+                table = AliasTable(weights)
+                total = weights.sum()
+                drawn_weight = 0.0
+            for position in table.sample(stream, 2 * (count - len(positions)) + 16).tolist():
+                if position not in drawn:
+                    drawn.add(position)
+                    drawn_weight += weights[position]
+                    positions.append(position)
+                    if len(positions) == count:
+                        break
+        winners.append(positions)
+    return winners
+
+
+SAMPLERS = {
+    'uniform': _uniform,
+    'stratified': _stratified,
+    'weighted': _weighted,
+}
+
+
+def blocked_positions(snapshot, excluded):
+    """Snapshot positions of the excluded registrations that are in it"""
+    excluded = np.fromiter(excluded, dtype=np.int64)
+    positions = np.searchsorted(snapshot['id'], excluded)
+    found = positions < len(snapshot)
+    found[found] = snapshot['id'][positions[found]] == excluded[found]
+    return set(positions[found].tolist())
+
+
+def draw_winners(snapshot, seed, snapshot_sha256, counts, strategy='uniform', excluded=()):
+    """
+    Registration ids of the winners of each prize category, in draw order.
+
+    ``excluded`` registrations (recent winners) stay in the snapshot but can't win.
+    """
+    blocked = blocked_positions(snapshot, excluded)
+    available = len(snapshot) - len(blocked)
+    capped = []
+    for count in counts:
+        capped.append(min(count, available))
+        available -= capped[-1]
+
+    key = draw_key(seed, snapshot_sha256)
+    ids = snapshot['id']
+    return [
+        [int(ids[position]) for position in positions]
+        for positions in SAMPLERS[strategy](snapshot, key, capped, blocked)
+    ]
+
+
+def assign_jobs(job_ids, seed, snapshot_sha256, count):
+    """Job ids for the first ``count`` job winners, reusing jobs when there are fewer"""
+    job_ids = sorted(job_ids)
+    rng = CounterRng(draw_key(seed, snapshot_sha256), 'jobs')
+    order = rng.sample(len(job_ids), len(job_ids))
+    return [job_ids[order[i % len(order)]] for i in range(count)] if order else []
+
+
+def merkle_path(snapshot_file):
+    return f"{os.path.splitext(snapshot_file)[0]}.merkle"
+
+
+def level_sizes(leaf_count):
+    """Node count of every level, leaves first"""
+    sizes = [leaf_count]
+    while sizes[-1] > 1:
+        sizes.append((sizes[-1] + 1) // 2)
+    return sizes
+
+
+def _parents(level):
+    """Hash adjacent pairs of a run of nodes; a trailing odd node moves up unchanged"""
+    parents = [
+        sha256(NODE_PREFIX + level[offset:offset + 2 * HASH_SIZE]).digest()
+        for offset in range(0, len(level) - HASH_SIZE, 2 * HASH_SIZE)
+    ]
+    if len(level) // HASH_SIZE % 2:
+        parents.append(level[-HASH_SIZE:])
+    return b''.join(parents)
+
+
+def build_merkle_tree(snapshot, path, chunk_size=65536):
+    """
+    Write every level of the snapshot's Merkle tree to ``path``; returns the root.
+
+    Levels are built one chunk of nodes at a time, so memory stays bounded
+    by ``chunk_size`` however large the draw.
+    """
+    if not len(snapshot):
+        raise ValueError('Cannot build a Merkle tree without entrants')
+    chunk_size += chunk_size % 2  # Pairs never straddle two chunks
+    sizes = level_sizes(len(snapshot))
+    temp_path = f"{path}.tmp"
+
+    with open(temp_path, 'w+b') as f:
+        fd = f.fileno()
+        for start in range(0, len(snapshot), chunk_size):
+            ids = np.ascontiguousarray(snapshot['id'][start:start + chunk_size], dtype='<i8').tobytes()
+            width = 8
+            f.write(b''.join(
+                sha256(LEAF_PREFIX + ids[offset:offset + width]).digest()
+                for offset in range(0, len(ids), width)
+            ))
+
+        level_offset = 0
+        for size in sizes[:-1]:
+            f.flush()
+            for start in range(0, size, chunk_size):
+                count = min(chunk_size, size - start)
+                f.write(_parents(os.pread(fd, count * HASH_SIZE, (level_offset + start) * HASH_SIZE)))
+            level_offset += size
+
+        f.flush()
+        root = os.pread(fd, HASH_SIZE, level_offset * HASH_SIZE)
+    os.replace(temp_path, path)
+    return root.hex()
+
+
+def inclusion_proof(path, leaf_count, index):
+    """Sibling hashes from leaf ``index`` up to the root, with the side each sits on"""
+    proof = []
+    level_offset = 0
+    with open(path, 'rb') as f:
+        for size in level_sizes(leaf_count)[:-1]:
+            sibling = index ^ 1
+            if sibling < size:
+                f.seek((level_offset + sibling) * HASH_SIZE)
+                proof.append({
+                    'hash': f.read(HASH_SIZE).hex(),
+                    'position': 'left' if sibling < index else 'right',
+                })
+            level_offset += size
+            index //= 2
+    return proof
+
+
+def leaf_hash(registration_id):
+    return sha256(LEAF_PREFIX + int(registration_id).to_bytes(8, 'little', signed=True)).digest()
+
+
+def verify_inclusion(registration_id, proof, root):
+    """Recompute the root from a leaf and its proof"""
+    node = leaf_hash(registration_id)
+    for step in proof:
+        sibling = bytes.fromhex(step['hash'])
+        pair = sibling + node if step['position'] == 'left' else node + sibling
+        node = sha256(NODE_PREFIX + pair).digest()
+    return node.hex() == root
+
+
+def entrant_index(snapshot, registration_id):
+    """Position of the registration in the sorted snapshot, or None"""
+    # bisect reads O(log n) records; searchsorted would copy the strided id column
+    ids = snapshot['id']
+    index = bisect_left(ids, registration_id)
+    if index < len(ids) and ids[index] == registration_id:
+        return index
+    return None
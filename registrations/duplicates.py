@@ -0,0 +1,292 @@
+"""
+Duplicate registration detection.
+
+Only the email is unique, so someone can register again with a new email
+to multiply their draw odds. Every registration gets two normalized
+blocking keys, stored in indexed columns:
+
+    phone_key   national number, digits only: "+233 24 123 4567" -> "241234567"
+    name_key    date of birth + Soundex of the first name token in
+                alphabetical order: "1995-01-01", "Kwame Mensah" -> "19950101K500"
+
+Registrations are only compared with others sharing a key, so the work
+grows with the size of the blocks rather than with the square of the
+table. Two registrations are duplicates when they share a phone and either
+the date of birth or a similar name, or share the date of birth and have a
+similar name (difflib ratio of the sorted name tokens, at least
+DUPLICATE_NAME_SIMILARITY). Duplicates are grouped into DuplicateClusters
+for staff to review.
+
+check_registration() runs when a registration's keys change and only does
+two index lookups. find_duplicates() rescans everything: one ordered pass
+per key, comparing within each block of equal keys.
+"""
+from difflib import SequenceMatcher
+from heapq import merge
+from itertools import groupby
+from operator import itemgetter
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import DuplicateCluster, DuplicateMember, Registration
+
+BLOCKING_KEYS = ['phone_key', 'name_key']
+
+# The fields a comparison needs, in this order
+ENTRANT_FIELDS = ['id', 'first_name', 'last_name', 'date_of_birth', 'phone_key']
+
+SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'),
+    **dict.fromkeys('cgjkqsxz', '2'),
+    **dict.fromkeys('dt', '3'),
+    'l': '4',
+    **dict.fromkeys('mn', '5'),
+    'r': '6',
+}
+
+
+def normalize_phone(phone_number):
+    """Ghanaian national number without the country code or trunk zero"""
+    digits = re.sub(r'\D', '', phone_number or '')
+    if digits.startswith('233'):
+        digits = digits[3:]
+    return digits.lstrip('0')[-9:]
+
+
+def name_tokens(*names):
+    """Lowercase ASCII words of the names, sorted so swapped names compare equal"""
+    text = unicodedata.normalize('NFKD', ' '.join(name or '' for name in names))
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return sorted(re.findall(r'[a-z]+', text))
+
+
+def soundex(word):
+    code = word[0].upper()
+    last = SOUNDEX_CODES.get(word[0])
+    for c in word[1:]:
+        digit = SOUNDEX_CODES.get(c)
+        if digit and digit != last:
+            code += digit
+            if len(code) == 4:
+                break
+        # h and w don't separate letters with the same code
+        if c not in 'hw':
+            last = digit
+    return code.ljust(4, '0')
+
+
+def blocking_keys(first_name, last_name, phone_number, date_of_birth):
+    """(phone_key, name_key) of a registration's details"""
+    tokens = name_tokens(first_name, last_name)
+    name_key = f"{date_of_birth:%Y%m%d}{soundex(tokens[0])}" if tokens and date_of_birth else ''
+    return normalize_phone(phone_number), name_key
+
+
+def entrant(row):
+    """(id, normalized name, date of birth, phone_key) from ENTRANT_FIELDS values"""
+    pk, first_name, last_name, date_of_birth, phone_key = row
+    return pk, ' '.join(name_tokens(first_name, last_name)), date_of_birth, phone_key
+
+
+def similar_names(a, b):
+    threshold = settings.DUPLICATE_NAME_SIMILARITY
+    if a == b:
+        return True
+    matcher = SequenceMatcher(None, a, b)
+    # The quick upper bounds rule most pairs out without the full comparison
+    return matcher.real_quick_ratio() >= threshold and matcher.quick_ratio() >= threshold and matcher.ratio() >= threshold
+
+
+def is_duplicate(a, b):
+    """Whether two entrants are the same person registered twice"""
+    if a[3] and a[3] == b[3]:
+        return a[2] == b[2] or similar_names(a[1], b[1])
+    return a[2] == b[2] and similar_names(a[1], b[1])
+
+
+def check_registration(registration):
+    """
+    Flag a registration that duplicates existing ones; returns its cluster or None.
+
+    Only registrations sharing one of its blocking keys are read, with an
+    index lookup each.
+    """
+    lookups = Q()
+    for key in BLOCKING_KEYS:
+        if getattr(registration, key):
+            lookups |= Q(**{key: getattr(registration, key)})
+    if not lookups:
+        return None
+
+    candidates = Registration.objects.filter(lookups).exclude(pk=registration.pk).values_list(*ENTRANT_FIELDS)
+    this = entrant([getattr(registration, field) for field in ENTRANT_FIELDS])
+    matches = [
+        other[0] for other in map(entrant, candidates[:settings.DUPLICATE_MAX_BLOCK])
+        if is_duplicate(this, other)
+    ]
+    if not matches:
+        return None
+    return flag_cluster([registration.pk] + matches)
+
+
+def flag_cluster(ids):
+    """Put the registrations in one cluster, merging any clusters they are in"""
+    with transaction.atomic():
+        members = dict(DuplicateMember.objects.filter(registration_id__in=ids).values_list('registration_id', 'cluster_id'))
+        cluster_ids = set(members.values())
+        if not cluster_ids:
+            cluster = DuplicateCluster.objects.create()
+        else:
+            cluster = DuplicateCluster.objects.select_for_update().get(pk=min(cluster_ids))
+            merged = cluster_ids - {cluster.pk}
+            DuplicateMember.objects.filter(cluster__in=merged).update(cluster=cluster)
+            DuplicateCluster.objects.filter(pk__in=merged).delete()
+        added = DuplicateMember.objects.bulk_create(
+            [DuplicateMember(cluster=cluster, registration_id=pk) for pk in ids if pk not in members],
+            ignore_conflicts=True,
+        )
+        if (added or len(cluster_ids) > 1) and cluster.status != 'open':
+            # New members need another look, even in a reviewed cluster
+            cluster.status = 'open'
+            cluster.save(update_fields=['status', 'updated_date'])
+    return cluster
+
+
+def stale_keys(chunk_size=5000):
+    """
+    Registrations whose stored blocking keys are out of date, one list per
+    chunk in id order, as ENTRANT_FIELDS values with the fresh phone_key
+    followed by the fresh name_key.
+    """
+    last_id = 0
+    while True:
+        rows = list(Registration.objects.filter(pk__gt=last_id).order_by('pk').values_list(
+            'id', 'first_name', 'last_name', 'phone_number', 'date_of_birth', 'phone_key', 'name_key',
+        )[:chunk_size])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+
+        stale = []
+        for pk, first_name, last_name, phone_number, date_of_birth, phone_key, name_key in rows:
+            keys = blocking_keys(first_name, last_name, phone_number, date_of_birth)
+            if keys != (phone_key, name_key):
+                stale.append((pk, first_name, last_name, date_of_birth, *keys))
+        yield stale
+
+
+def rekey(chunk_size=5000):
+    """Recompute every registration's blocking keys, in id order; returns the rows changed"""
+    changed = 0
+    for stale in stale_keys(chunk_size):
+        # One prepared statement per chunk; bulk_update's CASE WHEN grows with the batch
+        # and would also bump updated_date, which the dashboards use as a version
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                f"UPDATE {Registration._meta.db_table} SET phone_key = %s, name_key = %s WHERE id = %s",
+                [(phone_key, name_key, pk) for pk, *_, phone_key, name_key in stale],
+            )
+        changed += len(stale)
+    return changed
+
+
+def find_duplicates(chunk_size=5000, stale=None):
+    """
+    Compare registrations within every block; returns the duplicate groups and counts.
+
+    Each key is read once in index order, so only one block is in memory at a
+    time. Blocks larger than DUPLICATE_MAX_BLOCK (a phone number shared by
+    hundreds of registrations) are reported instead of compared. stale maps
+    ids to stale_keys() rows, compared with their fresh keys instead of the
+    stored ones without writing them.
+    """
+    stale = stale or {}
+    parent = {}
+
+    def root(pk):
+        while parent.setdefault(pk, pk) != pk:
+            parent[pk] = parent[parent[pk]]
+            pk = parent[pk]
+        return pk
+
+    stats = {'blocks': 0, 'comparisons': 0, 'oversized': []}
+    for key in BLOCKING_KEYS:
+        rows = Registration.objects.exclude(**{key: ''}).order_by(key, 'pk').values_list(key, *ENTRANT_FIELDS)
+        rows = rows.iterator(chunk_size=chunk_size)
+        if stale:
+            # stale_keys() rows end with the fresh BLOCKING_KEYS, phone_key being the last entrant field
+            position = len(ENTRANT_FIELDS) - 1 + BLOCKING_KEYS.index(key)
+            fresh = sorted((row[position], *row[:len(ENTRANT_FIELDS)]) for row in stale.values() if row[position])
+            rows = merge((row for row in rows if row[1] not in stale), fresh)
+        for value, block in groupby(rows, itemgetter(0)):
+            block = list(block)
+            if len(block) < 2:
+                continue
+            if len(block) > settings.DUPLICATE_MAX_BLOCK:
+                stats['oversized'].append((key, value, len(block)))
+                continue
+            stats['blocks'] += 1
+            entrants = [entrant(row[1:]) for row in block]
+            for i, a in enumerate(entrants):
+                for b in entrants[i + 1:]:
+                    stats['comparisons'] += 1
+                    if is_duplicate(a, b):
+                        parent[root(a[0])] = root(b[0])
+
+    groups = {}
+    for pk in parent:
+        groups.setdefault(root(pk), []).append(pk)
+    return [sorted(group) for group in groups.values() if len(group) > 1], stats
+
+
+def save_clusters(groups):
+    """
+    Make the DuplicateClusters match the groups; returns (created, changed, removed).
+
+    A group keeps the cluster most of its members are already in, and with
+    it the staff review unless its members changed.
+    """
+    cluster_of = dict(DuplicateMember.objects.values_list('registration_id', 'cluster_id'))
+    current = {}
+    for pk, cluster_id in cluster_of.items():
+        current.setdefault(cluster_id, set()).add(pk)
+
+    created = changed = 0
+    kept = set()
+    with transaction.atomic():
+        for group in groups:
+            votes = {}
+            for pk in group:
+                if pk in cluster_of and cluster_of[pk] not in kept:
+                    votes[cluster_of[pk]] = votes.get(cluster_of[pk], 0) + 1
+            if votes:
+                cluster_id = min(votes, key=lambda cluster_id: (-votes[cluster_id], cluster_id))
+                kept.add(cluster_id)
+                if current[cluster_id] == set(group):
+                    continue
+                DuplicateCluster.objects.filter(pk=cluster_id).update(status='open', updated_date=timezone.now())
+                changed += 1
+            else:
+                cluster_id = DuplicateCluster.objects.create().pk
+                created += 1
+
+            moved = [pk for pk in group if pk in cluster_of and cluster_of[pk] != cluster_id]
+            for start in range(0, len(moved), 500):
+                DuplicateMember.objects.filter(registration_id__in=moved[start:start + 500]).update(cluster_id=cluster_id)
+            DuplicateMember.objects.bulk_create(
+                [DuplicateMember(cluster_id=cluster_id, registration_id=pk) for pk in group if pk not in cluster_of],
+                batch_size=500,
+            )
+
+        # Members that no longer match anyone, then the clusters left empty
+        flagged = {pk for group in groups for pk in group}
+        stale = [pk for pk in cluster_of if pk not in flagged]
+        for start in range(0, len(stale), 500):
+            DuplicateMember.objects.filter(registration_id__in=stale[start:start + 500]).delete()
+        removed, _ = DuplicateCluster.objects.filter(members=None).delete()
+    return created, changed, removed
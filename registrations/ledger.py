@@ -0,0 +1,134 @@
+"""
+Append-only payment ledger and the monthly revenue summary.
+
+Payment rows are updated in place, so they only tell where a payment ended
+up. Every status change also appends a PaymentEvent, and moves the payment
+between MonthlyRevenue rows (month x provider x status) in the same
+transaction:
+
+    checkout opened   ''       -> pending    pending +1
+    charge succeeded  pending  -> success    pending -1, success +1
+    charge failed     pending  -> failed     pending -1, failed +1
+    checkout expired  pending  -> cancelled  pending -1, cancelled +1
+    late charge       cancelled/failed -> success
+                                             cancelled/failed -1, success +1
+    never attempted   pending  -> ''         pending -1
+
+The summary therefore always equals a replay of the ledger, and revenue
+reports read it instead of aggregating payments. Events keep the payment's
+month and provider, so archiving or deleting payments changes neither.
+`manage.py verify_revenue` replays the ledger and compares.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import MonthlyRevenue, PaymentEvent
+
+
+def revenue_month(payment):
+    """The month a payment's revenue counts towards"""
+    return payment.month_paid_for or timezone.localdate(payment.created_date).replace(day=1)
+
+
+def to_pesewas(amount):
+    # Freshly created payments still hold the float they were given
+    return int(Decimal(str(amount)) * 100)
+
+
+def event(payment, from_status, to_status):
+    """An unsaved ledger entry for a payment's change of status"""
+    return PaymentEvent(
+        payment_id=payment.pk,
+        reference=payment.reference,
+        month=revenue_month(payment),
+        mobile_money_provider=payment.mobile_money_provider,
+        amount=payment.amount,
+        from_status=from_status,
+        to_status=to_status,
+    )
+
+
+def add(totals, month, provider, from_status, to_status, pesewas):
+    """Apply one transition to ``{(month, provider, status): [payments, pesewas]}``"""
+    if from_status:
+        row = totals.setdefault((month, provider, from_status), [0, 0])
+        row[0] -= 1
+        row[1] -= pesewas
+    if to_status:
+        row = totals.setdefault((month, provider, to_status), [0, 0])
+        row[0] += 1
+        row[1] += pesewas
+
+
+def record(events):
+    """Append the events and apply them to the summary; call inside the transaction that changed the payments"""
+    events = [entry for entry in events if entry.from_status != entry.to_status]
+    if not events:
+        return
+    PaymentEvent.objects.bulk_create(events)
+
+    totals = {}
+    for entry in events:
+        add(totals, entry.month, entry.mobile_money_provider, entry.from_status, entry.to_status, to_pesewas(entry.amount))
+    # One upsert per summary row; the rows are few and hot, so they are
+    # changed in place rather than read, modified and saved
+    ops = connection.ops
+    now = ops.adapt_datetimefield_value(timezone.now())
+    table = ops.quote_name(MonthlyRevenue._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {table} (month, mobile_money_provider, status, payments, amount_pesewas, updated_date) "
+            f"VALUES (%s, %s, %s, %s, %s, %s) "
+            f"ON CONFLICT (month, mobile_money_provider, status) DO UPDATE SET "
+            f"payments = {table}.payments + excluded.payments, "
+            f"amount_pesewas = {table}.amount_pesewas + excluded.amount_pesewas, "
+            f"updated_date = excluded.updated_date",
+            [
+                (ops.adapt_datefield_value(month), provider, status, payments, pesewas, now)
+                for (month, provider, status), (payments, pesewas) in totals.items()
+            ],
+        )
+
+
+def replay(chunk_size=10000):
+    """Totals rebuilt from the whole ledger in one pass, in id order"""
+    totals = {}
+    rows = PaymentEvent.objects.order_by('id').values_list(
+        'month', 'mobile_money_provider', 'from_status', 'to_status', 'amount',
+    )
+    for month, provider, from_status, to_status, amount in rows.iterator(chunk_size=chunk_size):
+        add(totals, month, provider, from_status, to_status, to_pesewas(amount))
+    return {key: tuple(value) for key, value in totals.items() if value != [0, 0]}
+
+
+def summary():
+    """The stored totals, keyed like replay()"""
+    return {
+        (month, provider, status): (payments, pesewas)
+        for month, provider, status, payments, pesewas in MonthlyRevenue.objects.values_list(
+            'month', 'mobile_money_provider', 'status', 'payments', 'amount_pesewas',
+        )
+        if (payments, pesewas) != (0, 0)
+    }
+
+
+def differences(expected, stored):
+    """(key, expected, stored) for every summary row that disagrees with the ledger"""
+    return [
+        (key, expected.get(key, (0, 0)), stored.get(key, (0, 0)))
+        for key in sorted(expected.keys() | stored.keys())
+        if expected.get(key, (0, 0)) != stored.get(key, (0, 0))
+    ]
+
+
+def rebuild(totals):
+    """Replace the summary with the given totals"""
+    with transaction.atomic():
+        MonthlyRevenue.objects.all().delete()
+        MonthlyRevenue.objects.bulk_create([
+            MonthlyRevenue(month=month, mobile_money_provider=provider, status=status,
+                           payments=payments, amount_pesewas=pesewas)
+            for (month, provider, status), (payments, pesewas) in totals.items()
+        ], batch_size=500)
@@ -0,0 +1,129 @@
+"""
+Live draw progress for the home page.
+
+The participant counter and draw status shown on the home page are cached
+as one small dict by draw_progress(). The Registration and MonthlyDraw
+signals drop it, and the next reader rebuilds it with two queries.
+
+Under ASGI, each worker runs one ProgressBroadcaster per event loop. While
+anyone is listening it reads the cached dict every LIVE_POLL_INTERVAL
+seconds and wakes every listener when it changes, so the cache is read
+once per worker instead of once per visitor. An idle listener is a
+suspended coroutine waiting on a shared future.
+"""
+import asyncio
+import json
+import logging
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from . import odds
+from .models import Registration
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_KEY = 'live:draw_progress'
+
+
+def draw_progress():
+    """Participants, participants still needed and status of the current draw"""
+    progress = cache.get(PROGRESS_KEY)
+    if progress is None:
+        draw = odds.get_or_create_draw(odds.current_draw_month())
+        participants = Registration.objects.filter(is_active=True).count()
+        progress = {
+            'draw_month': draw.draw_month.strftime('%Y-%m'),
+            'status': draw.status,
+            'participants': participants,
+            'minimum_participants': draw.minimum_participants,
+            'needed_participants': max(0, draw.minimum_participants - participants),
+        }
+        cache.set(PROGRESS_KEY, progress, settings.LIVE_PROGRESS_TIMEOUT)
+    return progress
+
+
+def invalidate_progress():
+    cache.delete(PROGRESS_KEY)
+
+
+class ProgressBroadcaster:
+    """Polls draw_progress() for all of one event loop's listeners"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.listeners = 0
+        self.progress = None
+        self.changed = None
+        self.poller = None
+
+    async def listen(self, keepalive):
+        """
+        Yield the current progress, then every change. None is yielded
+        after ``keepalive`` seconds without a change.
+        """
+        self.listeners += 1
+        try:
+            if self.poller is None:
+                self.changed = asyncio.get_running_loop().create_future()
+                self.poller = asyncio.create_task(self.poll())
+            if self.progress is None:
+                # Awaiting the shared future directly would cancel it for
+                # every listener when this one disconnects
+                await asyncio.wait([self.changed])
+
+            sent = None
+            while True:
+                if self.progress is not sent:
+                    sent = self.progress
+                    yield sent
+                else:
+                    yield None
+                # wait() leaves the shared future alone when it times out
+                await asyncio.wait([self.changed], timeout=keepalive)
+        finally:
+            self.listeners -= 1
+
+    async def poll(self):
+        try:
+            while self.listeners:
+                try:
+                    progress = await sync_to_async(draw_progress)()
+                except Exception:
+                    logger.exception("Could not read the draw progress")
+                else:
+                    if progress != self.progress:
+                        self.progress = progress
+                        changed, self.changed = self.changed, asyncio.get_running_loop().create_future()
+                        if not changed.done():
+                            changed.set_result(None)
+                await asyncio.sleep(self.interval)
+        finally:
+            # The next listener starts a fresh poller
+            self.poller = None
+            self.progress = None
+
+
+_broadcasters = weakref.WeakKeyDictionary()
+
+
+def get_broadcaster():
+    """The running event loop's broadcaster"""
+    loop = asyncio.get_running_loop()
+    if loop not in _broadcasters:
+        _broadcasters[loop] = ProgressBroadcaster(settings.LIVE_POLL_INTERVAL)
+    return _broadcasters[loop]
+
+
+def progress_event(progress):
+    return f"event: progress\ndata: {json.dumps(progress)}\n\n"
+
+
+async def progress_events():
+    """Server-sent events for one visitor, until they disconnect"""
+    yield f"retry: {settings.LIVE_RECONNECT_MS}\n\n"
+    async for progress in get_broadcaster().listen(settings.LIVE_KEEPALIVE_SECONDS):
+        # Comments keep proxies from closing an idle connection
+        yield progress_event(progress) if progress is not None else ": keepalive\n\n"
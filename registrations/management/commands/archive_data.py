@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+import time
+
+from registrations.archive import (
+    archivable_payments, archivable_winners, archive_payments, archive_winners, cutoff_month,
+)
+
+
+class Command(BaseCommand):
+    help = 'Move settled payments and finished winners of old months to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months',
+            type=int,
+            default=settings.ARCHIVE_AFTER_MONTHS,
+            help='Keep this many months before the current one in the hot tables',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.ARCHIVE_BATCH_SIZE,
+            help='Rows moved per transaction',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count the rows that would move without moving them',
+        )
+
+    def handle(self, *args, **options):
+        if options['months'] < 1:
+            raise CommandError('--months must be at least 1')
+        cutoff = cutoff_month(options['months'])
+        self.stdout.write(f"Archiving payments and winners for months before {cutoff.strftime('%B %Y')}")
+
+        if options['dry_run']:
+            self.stdout.write(f"Payments: {archivable_payments(cutoff).count()}")
+            self.stdout.write(f"Winners: {archivable_winners(cutoff).count()}")
+            self.stdout.write(self.style.WARNING('DRY RUN - nothing moved'))
+            return
+
+        # Every batch commits on its own: an interrupted run resumes where it stopped
+        start = time.perf_counter()
+        payments = archive_payments(cutoff, options['batch_size'], log=self.progress('payments'))
+        winners = archive_winners(cutoff, options['batch_size'], log=self.progress('winners'))
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {payments} payments and {winners} winners ({time.perf_counter() - start:.1f}s)"
+        ))
+
+    def progress(self, name):
+        def log(moved):
+            self.stdout.write(f"  {moved} {name} moved")
+        return log
@@ -0,0 +1,867 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.hashers import make_password
+from django.test import Client, RequestFactory
+from django.test.runner import DiscoverRunner
+from django.template import engines
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.tasks import default_task_backend, task
+from django.utils import timezone
+from django.core.cache import cache
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.urls import resolve
+from django.utils.text import compress_string
+from datetime import date, timedelta
+import hashlib
+import hmac
+import logging
+import numpy as np
+import os
+import requests
+import statistics
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+from registrations.middleware import brotli, RateLimitMiddleware
+from registrations.billing import run_billing
+from registrations.cache import JOB_LISTINGS, invalidate_page_cache
+from registrations.duplicates import check_registration, find_duplicates, rekey, save_clusters
+from registrations.draws import (
+    build_merkle_tree, draw_winners, inclusion_proof, load_snapshot, snapshot_path, verify_inclusion, write_snapshot,
+    AliasTable, REGIONS, SNAPSHOT_DTYPE, STRATEGIES,
+)
+from registrations.management.commands.run_tasks import work
+from registrations.ledger import differences, replay, summary as ledger_summary
+from registrations.models import Registration, MonthlyDraw, Winner, Payment, PaymentAuthorization, BillingRun, Payout, QueuedTask, DuplicateMember, PaymentEvent, MonthlyRevenue, JobListing
+from registrations.payouts import process_payouts, apply_transfer_results, add_months
+from registrations.paystack import PaystackGateway, PaystackError, PaystackUnavailable, CircuitBreaker
+from registrations.paystack_stub import PaystackStubServer, FakePaystackGateway
+from registrations.search import refresh_facets, search_jobs
+
+
+@task
+def noop_task(index):
+    return index
+
+
+@task(takes_context=True)
+def flaky_task(context, index):
+    # Every tenth task fails its first attempt
+    if index % 10 == 0 and context.attempt == 1:
+        raise RuntimeError('Injected failure')
+    return index
+
+
+class Command(BaseCommand):
+    help = 'Run performance benchmarks against a throwaway test database'
+
+    suites = ['conditional', 'compression', 'paystack', 'billing', 'payouts', 'tasks', 'draws', 'duplicates', 'jobs', 'ratelimit']
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--suite',
+            action='append',
+            choices=self.suites,
+            help='Benchmark suite to run (repeatable, defaults to all suites)',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=200,
+            help='Number of timed iterations per measurement',
+        )
+        parser.add_argument(
+            '--subscribers',
+            type=int,
+            default=5000,
+            help='Subscribers to create for the billing suite',
+        )
+        parser.add_argument(
+            '--winners',
+            type=int,
+            default=2000,
+            help='Basic income winners to create for the payouts suite',
+        )
+        parser.add_argument(
+            '--tasks',
+            type=int,
+            default=2000,
+            help='Tasks to enqueue for the tasks suite',
+        )
+        parser.add_argument(
+            '--entrants',
+            type=int,
+            default=1000000,
+            help='Draw entrants for the draws suite',
+        )
+        parser.add_argument(
+            '--registrations',
+            type=int,
+            default=100000,
+            help='Registrations to scan in the duplicates suite',
+        )
+        parser.add_argument(
+            '--listings',
+            type=int,
+            default=30000,
+            help='Job listings to search in the jobs suite',
+        )
+
+    def handle(self, *args, **options):
+        # Benchmarks never touch the real database. It is a file rather than
+        # in memory so the task workers' threads can write to it concurrently.
+        settings.DATABASES['default'].setdefault('TEST', {})['NAME'] = settings.BASE_DIR / 'benchmark.sqlite3'
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+
+        try:
+            for suite in options['suite'] or self.suites:
+                self.stdout.write(self.style.MIGRATE_HEADING(f"\n== {suite} =="))
+                getattr(self, f'bench_{suite}')(options)
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+    # Helpers
+
+    def timed(self, func, iterations):
+        """Call func repeatedly and return (mean ms, p95 ms, last result)"""
+        durations = []
+        result = None
+        for _ in range(iterations):
+            start = time.perf_counter()
+            result = func()
+            durations.append((time.perf_counter() - start) * 1000)
+        durations.sort()
+        p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        return statistics.mean(durations), p95, result
+
+    def create_participant(self, prefix, index, **fields):
+        """Create a user with a linked registration; each suite uses its own prefix"""
+        user = User.objects.create_user(
+            username=f'{prefix}{index}',
+            email=f'{prefix}{index}@example.com',
+            password='bench-password',
+        )
+        defaults = {
+            'first_name': f'{prefix.title()}{index}',
+            'last_name': 'User',
+            'email': user.email,
+            'phone_number': f'024{index:07d}',
+            'date_of_birth': date(1995, 1, 1),
+            'region': 'accra',
+            'mobile_money_provider': 'mtn',
+            'cv_file': 'cv_files/bench.pdf',
+            'terms_accepted': True,
+            'user': user,
+        }
+        defaults.update(fields)
+        return Registration.objects.create(**defaults)
+
+    def create_participants(self, prefix, count):
+        """Bulk-create users with registrations, skipping password hashing; each suite uses its own prefix"""
+        User.objects.bulk_create([
+            User(username=f'{prefix}{index}', email=f'{prefix}{index}@example.com', password='!')
+            for index in range(count)
+        ], batch_size=1000)
+        users = User.objects.filter(username__startswith=prefix).values_list('id', 'email')
+        Registration.objects.bulk_create([
+            Registration(
+                first_name=f'{prefix.title()}{index}',
+                last_name='User',
+                email=email,
+                phone_number=f'020{index:07d}',
+                date_of_birth=date(1995, 1, 1),
+                region='accra',
+                mobile_money_provider='mtn',
+                cv_file='cv_files/bench.pdf',
+                terms_accepted=True,
+                user_id=user_id,
+            )
+            for index, (user_id, email) in enumerate(users)
+        ], batch_size=1000)
+        return Registration.objects.filter(email__startswith=prefix)
+
+    def write_row(self, label, *columns):
+        self.stdout.write(f"  {label:<28}" + ''.join(f"{column:>16}" for column in columns))
+
+    # Suites
+
+    def bench_conditional(self, options):
+        """Full renders versus 304 revalidations of the per-user pages"""
+        iterations = options['iterations']
+        current_month = date.today().replace(day=1)
+
+        registration = self.create_participant('conditional', 0)
+        draw = MonthlyDraw.objects.create(draw_month=current_month, current_participants=1200)
+        for month in range(1, 13):
+            Payment.objects.create(
+                registration=registration,
+                user=registration.user,
+                amount=15,
+                payment_type='monthly',
+                status='success',
+                reference=f'JM-BENCH{month:04d}',
+                email=registration.email,
+                month_paid_for=date(current_month.year - 1, month, 1),
+                paid_at=timezone.now(),
+            )
+        Winner.objects.create(
+            registration=registration,
+            monthly_draw=draw,
+            prize_type='job',
+            prize_details='Benchmark job',
+        )
+
+        client = Client()
+        client.force_login(registration.user)
+
+        self.write_row('view', 'full ms', '304 ms', 'full bytes', '304 bytes')
+        for url in ['/user/dashboard/', '/user/winners/', '/payment/history/']:
+            full_mean, _, response = self.timed(lambda: client.get(url), iterations)
+            full_bytes = len(response.content)
+            etag = response['ETag']
+
+            cond_mean, _, response = self.timed(
+                lambda: client.get(url, headers={'If-None-Match': etag}), iterations
+            )
+            if response.status_code != 304:
+                self.stdout.write(self.style.ERROR(f"  {url} answered {response.status_code} to a matching ETag"))
+                continue
+
+            self.write_row(url, f"{full_mean:.2f}", f"{cond_mean:.2f}", full_bytes, len(response.content))
+            self.stdout.write(self.style.SUCCESS(
+                f"  {'':<28}saved {full_bytes - len(response.content)} bytes and "
+                f"{(1 - cond_mean / full_mean) * 100:.0f}% CPU per revalidation"
+            ))
+
+    def bench_compression(self, options):
+        """Bytes saved versus CPU spent by template minification and response compression"""
+        iterations = options['iterations']
+
+        registration = self.create_participant('compression', 0)
+        staff = User.objects.create_user(username='benchstaff', password='bench-password', is_staff=True)
+
+        user_client = Client()
+        user_client.force_login(registration.user)
+        staff_client = Client()
+        staff_client.force_login(staff)
+        anonymous_client = Client()
+
+        pages = [
+            ('/', anonymous_client),
+            ('/user/register/', anonymous_client),
+            ('/user/dashboard/', user_client),
+            ('/user/profile/', user_client),
+            (f'/admin-registration/{registration.id}/', staff_client),
+        ]
+
+        def render_pages(minify):
+            with override_settings(HTML_MINIFY_TEMPLATES=minify, PAGE_CACHE_ENABLED=False):
+                # Templates are minified when compiled, so drop the compiled ones
+                engines['django'].engine.template_loaders[0].reset()
+                return {url: client.get(url).content for url, client in pages}
+
+        raw_pages = render_pages(minify=False)
+        minified_pages = render_pages(minify=True)
+
+        self.write_row('view', 'raw bytes', 'minified', 'gzip bytes', 'gzip ms', 'br bytes', 'br ms')
+        for url, _ in pages:
+            content = minified_pages[url]
+            gzip_ms, _, gzipped = self.timed(lambda: compress_string(content, max_random_bytes=100), iterations)
+            if brotli is not None:
+                quality = settings.COMPRESSION_BROTLI_QUALITY
+                br_ms, _, compressed = self.timed(lambda: brotli.compress(content, quality=quality), iterations)
+                br_columns = (len(compressed), f"{br_ms:.3f}")
+            else:
+                br_columns = ('n/a', 'n/a')
+            self.write_row(
+                url, len(raw_pages[url]), len(content), len(gzipped), f"{gzip_ms:.3f}", *br_columns
+            )
+
+    def bench_paystack(self, options):
+        """Pooled gateway against a local Paystack stub with injected latency and errors"""
+        iterations = options['iterations']
+
+        server = PaystackStubServer(('127.0.0.1', 0))
+        server.start()
+        # Injected failures would log a warning per attempt
+        logger = logging.getLogger('registrations.paystack')
+        log_level = logger.level
+        logger.setLevel(logging.CRITICAL)
+
+        def make_gateway(max_retries=2, failure_threshold=5, reset_timeout=30):
+            return PaystackGateway(
+                secret_key='sk_test_bench',
+                base_url=server.base_url,
+                connect_timeout=1,
+                read_timeout=0.5,
+                max_retries=max_retries,
+                backoff=0.01,
+                pool_size=4,
+                breaker=CircuitBreaker(failure_threshold, reset_timeout),
+            )
+
+        def attempt(call):
+            try:
+                return call().get('status', False)
+            except PaystackError:
+                return False
+
+        try:
+            # Keep-alive pooling versus a new connection per call
+            gateway = make_gateway()
+            reference = f'JM-{uuid.uuid4().hex[:12].upper()}'
+            gateway.initialize_transaction('bench@example.com', 1500, reference, 'http://localhost/')
+
+            def unpooled_verify():
+                with requests.Session() as session:
+                    return session.get(f'{server.base_url}/transaction/verify/{reference}', timeout=1).json()
+
+            unpooled_mean, unpooled_p95, _ = self.timed(unpooled_verify, iterations)
+            pooled_mean, pooled_p95, _ = self.timed(lambda: gateway.verify_transaction(reference), iterations)
+
+            self.write_row('verify', 'mean ms', 'p95 ms')
+            self.write_row('new connection per call', f"{unpooled_mean:.2f}", f"{unpooled_p95:.2f}")
+            self.write_row('pooled gateway', f"{pooled_mean:.2f}", f"{pooled_p95:.2f}")
+
+            # Retries against a flaky upstream
+            server.error_rate = 0.3
+            self.write_row('30% injected 503s', 'ok calls', 'stub requests')
+            for label, retries in [('no retries', 0), ('2 jittered retries', 2)]:
+                gateway = make_gateway(max_retries=retries, failure_threshold=iterations + 1)
+                server.request_count = 0
+                ok = sum(attempt(lambda: gateway.verify_transaction(reference)) for _ in range(iterations))
+                self.write_row(label, f"{ok}/{iterations}", server.request_count)
+
+            # Read timeouts, then fail fast once the circuit is open
+            server.error_rate = 0.0
+            server.latency = 0.6
+            gateway = make_gateway(max_retries=0, failure_threshold=3)
+            calls = min(iterations, 20)
+            timeout_mean, _, _ = self.timed(lambda: attempt(lambda: gateway.verify_transaction(reference)), 3)
+            server.request_count = 0
+            open_mean, _, _ = self.timed(lambda: attempt(lambda: gateway.verify_transaction(reference)), calls)
+
+            self.write_row('0.6s upstream latency', 'mean ms', 'stub requests')
+            self.write_row('closed (read timeout)', f"{timeout_mean:.2f}", 3)
+            self.write_row(f'open ({gateway.breaker.state})', f"{open_mean:.3f}", server.request_count)
+
+            self.stdout.write('  per-call latency recorded by the gateway:')
+            for operation, stats in gateway.stats.snapshot().items():
+                self.stdout.write(
+                    f"    {operation}: {stats['calls']} calls, {stats['errors']} errors, "
+                    f"mean {stats['mean'] * 1000:.1f} ms, max {stats['max'] * 1000:.1f} ms"
+                )
+        finally:
+            logger.setLevel(log_level)
+            server.shutdown()
+            server.server_close()
+
+    def bench_billing(self, options):
+        """Recurring billing run against an in-process fake gateway, including an interrupted run"""
+        count = options['subscribers']
+        month = date.today().replace(day=1)
+        latency = 0.02
+
+        registrations = self.create_participants('billing', count)
+        PaymentAuthorization.objects.bulk_create([
+            PaymentAuthorization(registration_id=registration_id, authorization_code=f'AUTH_{registration_id}', email=email)
+            for registration_id, email in registrations.values_list('id', 'email')
+        ], batch_size=1000)
+
+        def bill(gateway, **kwargs):
+            start = time.perf_counter()
+            run = run_billing(month, gateway=gateway, rate=10000, **kwargs)
+            return run, time.perf_counter() - start
+
+        self.write_row('run', 'subscribers', 'seconds', 'charges/s', 'charged', 'failed')
+        for workers in [4, 10, 32]:
+            BillingRun.objects.all().delete()
+            Payment.objects.all().delete()
+            PaymentEvent.objects.all().delete()
+            MonthlyRevenue.objects.all().delete()
+            MonthlyDraw.objects.all().delete()
+            gateway = FakePaystackGateway(latency=latency, decline_rate=0.05, seed=1)
+            run, seconds = bill(gateway, workers=workers)
+            self.write_row(f'{workers} workers, {latency * 1000:.0f}ms', count, f"{seconds:.2f}",
+                           f"{count / seconds:.0f}", run.charged, run.failed)
+
+        # Gateway that becomes unavailable part way, then recovers
+        class FlakyGateway(FakePaystackGateway):
+            outage_after = count // 3
+
+            def charge_authorization(self, *args, **kwargs):
+                with self.lock:
+                    down = 0 < self.outage_after <= len(self.charges)
+                if down:
+                    raise PaystackUnavailable('Injected outage')
+                return super().charge_authorization(*args, **kwargs)
+
+        BillingRun.objects.all().delete()
+        Payment.objects.all().delete()
+        PaymentEvent.objects.all().delete()
+        MonthlyRevenue.objects.all().delete()
+        MonthlyDraw.objects.all().delete()
+        gateway = FlakyGateway(latency=0, decline_rate=0.05, error_rate=0.01, seed=2)
+        first, _ = bill(gateway, workers=10)
+        gateway.outage_after = 0
+        resumed, _ = bill(gateway, workers=10)
+
+        paid = Payment.objects.filter(month_paid_for=month, status='success').count()
+        draw = MonthlyDraw.objects.get(draw_month=month)
+        revenue = MonthlyRevenue.objects.filter(month=month, status='success').aggregate(payments=Sum('payments'))['payments']
+        self.write_row('interrupted run', first.status, first.charged, '', '', '')
+        self.write_row('resumed run', resumed.status, resumed.charged, '', '', '')
+        consistent = (
+            len(gateway.charges) == count
+            and paid == draw.current_participants == resumed.charged
+            and paid == sum(1 for status in gateway.charges.values() if status == 'success')
+            and paid == revenue
+            and not differences(replay(), ledger_summary())
+        )
+        style = self.style.SUCCESS if consistent else self.style.ERROR
+        self.stdout.write(style(
+            f"  {len(gateway.charges)} charges for {count} subscribers, {paid} paid, "
+            f"draw counts {draw.current_participants}, revenue summary counts {revenue}"
+        ))
+
+        # Paystack latency dominates at scale; the run is bounded by workers and rate
+        per_second = min(settings.BILLING_RATE_LIMIT, settings.BILLING_WORKERS / 0.5)
+        self.stdout.write(
+            f"  100,000 subscribers at 500ms per charge with the default settings: "
+            f"~{100000 / per_second / 60:.0f} minutes"
+        )
+
+    def bench_payouts(self, options):
+        """Generating and paying a month of basic income installments in bulk"""
+        count = options['winners']
+        month = date.today().replace(day=1)
+        providers = [choice for choice, _ in Registration.MOBILE_MONEY_CHOICES]
+
+        registrations = list(self.create_participants('payouts', count).values_list('id', flat=True))
+        Registration.objects.bulk_update(
+            [Registration(pk=pk, mobile_money_provider=providers[index % len(providers)]) for index, pk in enumerate(registrations)],
+            ['mobile_money_provider'], batch_size=1000,
+        )
+        # Winners spread over the past year's draws, so several installments are due
+        draws = MonthlyDraw.objects.bulk_create([
+            MonthlyDraw(draw_month=add_months(month, -offset), status='completed', winners_selected=True)
+            for offset in range(1, 13)
+        ])
+        Winner.objects.bulk_create([
+            Winner(registration_id=pk, monthly_draw=draws[index % len(draws)], prize_type='basic_income',
+                   prize_details='1 Year Basic Income Support - GHS 500 per month for 12 months')
+            for index, pk in enumerate(registrations)
+        ], batch_size=1000)
+
+        gateway = FakePaystackGateway(seed=3)
+        start = time.perf_counter()
+        stats = process_payouts(month, gateway=gateway)
+        first_run = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rerun = process_payouts(month, gateway=gateway)
+        second_run = time.perf_counter() - start
+
+        # Settle every transfer as the webhooks would, in one call
+        start = time.perf_counter()
+        settled = apply_transfer_results({reference: ('success', None) for reference in gateway.transfers})
+        settle_seconds = time.perf_counter() - start
+
+        self.write_row('step', 'seconds', 'payouts', 'requests')
+        self.write_row('generate + pay', f"{first_run:.2f}", stats['submitted'], gateway.bulk_requests)
+        self.write_row('rerun', f"{second_run:.2f}", rerun['submitted'], '')
+        self.write_row('settle (webhooks)', f"{settle_seconds:.2f}", settled, '')
+
+        rows = Payout.objects.count()
+        claimed = Winner.objects.filter(is_claimed=True).count()
+        consistent = (
+            rows == count * settings.BASIC_INCOME_MONTHS
+            and rerun['submitted'] == 0
+            and len(gateway.transfers) == stats['submitted'] == settled
+            and claimed == count
+        )
+        style = self.style.SUCCESS if consistent else self.style.ERROR
+        self.stdout.write(style(
+            f"  {rows} payouts for {count} winners, {len(gateway.transfers)} transfers, {claimed} prizes claimed"
+        ))
+
+    def bench_tasks(self, options):
+        """Enqueue, claim and end-to-end throughput of the database task queue"""
+        count = options['tasks']
+        backend = default_task_backend
+        # Per-task log lines would dominate the timings
+        logger = logging.getLogger('django.tasks')
+        log_level = logger.level
+        logger.setLevel(logging.WARNING)
+
+        def enqueue_all(task):
+            QueuedTask.objects.all().delete()
+            start = time.perf_counter()
+            for index in range(count):
+                task.enqueue(index)
+            return time.perf_counter() - start
+
+        self.write_row('step', 'tasks', 'seconds', 'tasks/s')
+        seconds = enqueue_all(noop_task)
+        self.write_row('enqueue', count, f"{seconds:.2f}", f"{count / seconds:.0f}")
+
+        for batch_size in [1, 10, 100]:
+            QueuedTask.objects.update(status='READY', attempts=0, worker_ids=[])
+            start = time.perf_counter()
+            claimed = 0
+            while batch := backend.claim('bench', limit=batch_size):
+                claimed += len(batch)
+            seconds = time.perf_counter() - start
+            self.write_row(f'claim, batches of {batch_size}', claimed, f"{seconds:.2f}", f"{claimed / seconds:.0f}")
+
+        for threads in [1, 4, 8]:
+            enqueue_all(noop_task)
+            start = time.perf_counter()
+            done = work(None, threads, 10, 0.01, burst=True)
+            seconds = time.perf_counter() - start
+            self.write_row(f'run, {threads} threads', done, f"{seconds:.2f}", f"{done / seconds:.0f}")
+
+        # Failed first attempts come back after the retry delay
+        retry_delay = backend.retry_delay
+        backend.retry_delay = 0
+        try:
+            enqueue_all(flaky_task)
+            start = time.perf_counter()
+            done = work(None, 4, 10, 0.01, burst=True)
+            seconds = time.perf_counter() - start
+        finally:
+            backend.retry_delay = retry_delay
+        self.write_row('run with 10% retries', done, f"{seconds:.2f}", f"{done / seconds:.0f}")
+
+        logger.setLevel(log_level)
+
+        successful = QueuedTask.objects.filter(status='SUCCESSFUL').count()
+        retried = QueuedTask.objects.filter(attempts=2).count()
+        consistent = successful == count and retried == len(range(0, count, 10)) and done == count + retried
+        style = self.style.SUCCESS if consistent else self.style.ERROR
+        self.stdout.write(style(f"  {successful} of {count} tasks successful, {retried} after a retry"))
+
+    def bench_draws(self, options):
+        """Snapshot, draw strategies, Merkle tree and inclusion proofs for a large draw"""
+        count = options['entrants']
+        iterations = options['iterations']
+        month = date.today().replace(day=1)
+        rng = np.random.default_rng(7)
+        entrants = np.zeros(count, dtype=SNAPSHOT_DTYPE)
+        # Sorted ids with gaps, like registrations after some were deleted
+        entrants['id'] = np.cumsum(rng.integers(1, 4, count))
+        # Most entrants in the big regions, 1-24 months paid
+        region_shares = np.array([40, 20, 15, 10, 8, 5, 2]) / 100
+        entrants['region'] = rng.choice(len(REGIONS), count, p=region_shares)
+        entrants['months_paid'] = rng.integers(1, 25, count)
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(DRAW_SNAPSHOT_DIR=directory):
+            self.write_row('step', 'entrants', 'mean ms', 'p95 ms')
+
+            start = time.perf_counter()
+            path = snapshot_path(month)
+            digest = write_snapshot(path, entrants)
+            self.write_row('write + hash snapshot', count, f"{(time.perf_counter() - start) * 1000:.1f}", '')
+
+            start = time.perf_counter()
+            snapshot = load_snapshot(path, digest)
+            self.write_row('load + check snapshot', count, f"{(time.perf_counter() - start) * 1000:.1f}", '')
+
+            # Strategies at the default prize counts and at a much larger k, at most half the entrants
+            large_k = min(10000, count // 2)
+            winners = {}
+            strategy_iterations = max(1, iterations // 20)
+            for strategy in STRATEGIES:
+                for prizes in ([10, 5], [large_k // 2, large_k - large_k // 2]):
+                    mean, p95, winners[strategy, sum(prizes)] = self.timed(
+                        lambda: draw_winners(snapshot, 'seed', digest, prizes, strategy), strategy_iterations,
+                    )
+                    self.write_row(f'{strategy}, k={sum(prizes)}', count, f"{mean:.1f}", f"{p95:.1f}")
+
+            weights = np.asarray(snapshot['months_paid'], dtype=np.float64)
+            mean, p95, _ = self.timed(lambda: AliasTable(weights), strategy_iterations)
+            self.write_row('alias table build', count, f"{mean:.1f}", f"{p95:.1f}")
+            # What a weighted draw costs with NumPy's own sampler
+            generator = np.random.default_rng(9)
+            mean, p95, _ = self.timed(
+                lambda: generator.choice(count, large_k, replace=False, p=weights / weights.sum()), strategy_iterations,
+            )
+            self.write_row(f'Generator.choice, k={large_k}', count, f"{mean:.1f}", f"{p95:.1f}")
+
+            # Stratified winners follow the regions' shares; weighted favour long-time payers
+            positions = np.searchsorted(snapshot['id'], sum(winners['stratified', large_k], []))
+            by_region = np.bincount(snapshot['region'][positions], minlength=len(REGIONS)) / len(positions)
+            self.stdout.write(f"  stratified region shares: {' '.join(f'{share:.3f}' for share in by_region)}"
+                              f" (entrants: {' '.join(f'{share:.3f}' for share in region_shares)})")
+            for strategy in STRATEGIES:
+                positions = np.searchsorted(snapshot['id'], sum(winners[strategy, large_k], []))
+                self.stdout.write(f"  {strategy} winners' mean months paid: {snapshot['months_paid'][positions].mean():.2f}")
+
+            tree_path = os.path.join(directory, 'draw.merkle')
+            start = time.perf_counter()
+            root = build_merkle_tree(snapshot, tree_path)
+            self.write_row('build Merkle tree', count, f"{(time.perf_counter() - start) * 1000:.0f}", '')
+
+            # Again with allocation tracing, which is too slow to time
+            tracemalloc.start()
+            build_merkle_tree(snapshot, tree_path)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            rng = np.random.default_rng(8)
+            indexes = iter(rng.integers(0, count, iterations))
+            mean, p95, proof = self.timed(lambda: inclusion_proof(tree_path, count, int(next(indexes))), iterations)
+            self.write_row('inclusion proof', count, f"{mean:.3f}", f"{p95:.3f}")
+
+            valid = all(
+                verify_inclusion(int(snapshot['id'][index]), inclusion_proof(tree_path, count, int(index)), root)
+                for index in rng.integers(0, count, 100)
+            )
+            distinct = all(len(set(sum(drawn, []))) == k for (_, k), drawn in winners.items())
+            style = self.style.SUCCESS if valid and distinct else self.style.ERROR
+            self.stdout.write(style(
+                f"  Tree {os.path.getsize(tree_path) / 1e6:.0f} MB on disk, built in at most {peak / 1e6:.1f} MB "
+                f"of memory, proofs of {len(proof)} hashes verified"
+            ))
+
+    def bench_duplicates(self, options):
+        """Full duplicate rescan at two table sizes, and the check at registration time"""
+        rng = np.random.default_rng(11)
+        first_names = ['Kwame', 'Kofi', 'Kwabena', 'Yaw', 'Kwaku', 'Ama', 'Akosua', 'Abena', 'Efua', 'Adwoa',
+                       'Yaa', 'Afua', 'Esi', 'Kojo', 'Kwesi', 'Nana', 'Ekow', 'Fiifi', 'Akua', 'Araba']
+        # Surnames from two parts, so unrelated people rarely share name and birthday
+        surname_parts = ['Men', 'Ow', 'Boa', 'As', 'Os', 'Agye', 'Ap', 'Ad', 'Amo', 'Ofo', 'Dar', 'Achea',
+                         'Ant', 'Ba', 'Opo', 'Sar', 'Frim', 'Nkru']
+        surname_ends = ['sah', 'usu', 'teng', 'ante', 'ei', 'mang', 'piah', 'do', 'ah', 'ri', 'ko', 'mpong',
+                        'wi', 'du', 'ku', 'pong', 'fo', 'mah']
+
+        def person(index):
+            return {
+                'first_name': first_names[rng.integers(len(first_names))],
+                'last_name': surname_parts[rng.integers(len(surname_parts))] + surname_ends[rng.integers(len(surname_ends))],
+                'phone_number': f"0{rng.choice([20, 24, 27, 50, 54, 55])}{rng.integers(10 ** 7):07d}",
+                'date_of_birth': date(1970, 1, 1) + timedelta(days=int(rng.integers(365 * 35))),
+            }
+
+        def variant(original):
+            """Register again: swapped names, a typo or another phone format"""
+            copy = dict(original)
+            change = rng.integers(3)
+            if change == 0:
+                copy['first_name'], copy['last_name'] = copy['last_name'], copy['first_name']
+                copy['phone_number'] = '+233 ' + copy['phone_number'][1:]
+            elif change == 1:
+                copy['last_name'] = copy['last_name'][:-1]
+                copy['phone_number'] = f"0{rng.choice([20, 24])}{rng.integers(10 ** 7):07d}"
+            else:
+                copy['phone_number'] = copy['phone_number'][:3] + ' ' + copy['phone_number'][3:]
+            return copy
+
+        def create(count):
+            """Registrations without signals, one in a hundred a re-registration; returns the planted pairs"""
+            people = []
+            copies = []
+            for index in range(count):
+                if people and rng.random() < 0.01:
+                    original = rng.integers(len(people))
+                    people.append(variant(people[original]))
+                    copies.append((original, index))
+                else:
+                    people.append(person(index))
+            offset = Registration.objects.count()
+            created = Registration.objects.bulk_create([
+                Registration(
+                    email=f'dup{offset + index}@example.com', region='accra', mobile_money_provider='mtn',
+                    cv_file='cv_files/bench.pdf', terms_accepted=True, **fields,
+                )
+                for index, fields in enumerate(people)
+            ], batch_size=1000)
+            return [(created[original].pk, created[copy].pk) for original, copy in copies]
+
+        total = options['registrations']
+        self.write_row('step', 'registrations', 'ms', 'per 1k ms')
+        planted = []
+        for size in (total // 10, total):
+            planted += create(size - Registration.objects.count())
+
+            start = time.perf_counter()
+            rekey()
+            elapsed = (time.perf_counter() - start) * 1000
+            self.write_row('compute blocking keys', size, f"{elapsed:.0f}", f"{elapsed / size * 1000:.1f}")
+
+            start = time.perf_counter()
+            groups, stats = find_duplicates()
+            elapsed = (time.perf_counter() - start) * 1000
+            self.write_row('compare within blocks', size, f"{elapsed:.0f}", f"{elapsed / size * 1000:.1f}")
+
+            start = time.perf_counter()
+            save_clusters(groups)
+            self.write_row('save clusters', size, f"{(time.perf_counter() - start) * 1000:.0f}", '')
+            group_of = {pk: index for index, group in enumerate(groups) for pk in group}
+            found = sum(1 for a, b in planted if a in group_of and group_of.get(a) == group_of.get(b))
+            self.stdout.write(
+                f"  {stats['comparisons']} comparisons in {stats['blocks']} blocks: "
+                f"{found} of {len(planted)} planted re-registrations found, "
+                f"{sum(len(group) - 1 for group in groups)} duplicates flagged"
+            )
+
+        # The incremental check on save: two index lookups and a few comparisons
+        registrations = iter(Registration.objects.order_by('?')[:options['iterations']])
+        mean, p95, _ = self.timed(lambda: check_registration(next(registrations)), options['iterations'])
+        self.write_row('check one registration', total, f"{mean:.2f}", f"p95 {p95:.2f}")
+        self.stdout.write(f"  {DuplicateMember.objects.count()} registrations flagged")
+
+    def bench_jobs(self, options):
+        """Job board searches right after a listing change and from the cache"""
+        rng = np.random.default_rng(5)
+        roles = ['Driver', 'Nurse', 'Teacher', 'Accountant', 'Sales Agent', 'Developer', 'Electrician',
+                 'Cashier', 'Security Guard', 'Farm Manager', 'Cook', 'Marketing Officer', 'Mechanic', 'Tailor']
+        places = ['Accra', 'Kumasi', 'Tamale', 'Takoradi', 'Cape Coast', 'Ho', 'Sunyani', 'Koforidua']
+        words = ['customer', 'service', 'experience', 'team', 'reports', 'daily', 'records', 'support',
+                 'training', 'stock', 'orders', 'clients', 'schedule', 'safety', 'quality', 'equipment',
+                 'cash', 'deliveries', 'students', 'patients', 'software', 'repairs', 'market', 'field']
+        salaries = ['GHS 800 - 1200', 'GHS 1200 - 2000', 'GHS 2000 - 3000', 'GHS 3000 - 5000', 'GHS 5000 - 8000']
+        job_types = [value for value, _ in JobListing.JOB_TYPE_CHOICES]
+
+        def text(count):
+            return ' '.join(words[index] for index in rng.integers(len(words), size=count))
+
+        # bulk_create skips the signal; the FTS triggers still index every row
+        start = time.perf_counter()
+        JobListing.objects.bulk_create([
+            JobListing(
+                title=f"{roles[rng.integers(len(roles))]} ({places[rng.integers(len(places))]})",
+                description=text(60),
+                job_type=job_types[rng.integers(len(job_types))],
+                salary_range=salaries[rng.integers(len(salaries))],
+                requirements=text(20),
+                is_active=rng.random() < 0.9,
+            )
+            for _ in range(options['listings'])
+        ], batch_size=1000)
+        refresh_facets()
+        self.stdout.write(f"  {options['listings']} listings created and indexed in {time.perf_counter() - start:.1f}s")
+
+        searches = [
+            ('', '', ''),
+            ('', 'contract', ''),
+            ('driver', '', ''),
+            ('nurse kumasi', '', ''),
+            ('sales', 'full_time', 'GHS 2000 - 3000'),
+            ('custom', '', ''),
+            ('electrician repairs equipment', '', ''),
+        ]
+        iterations = options['iterations']
+
+        def uncached(search):
+            # What the first visitor after a listing change pays
+            invalidate_page_cache(JOB_LISTINGS)
+            return search_jobs(*search)
+
+        self.write_row('search', 'results', 'changed ms', 'p95', 'cached ms', 'p95')
+        for search in searches:
+            _, cold_p95, result = self.timed(lambda: uncached(search), iterations)
+            cold_mean, _, _ = self.timed(lambda: uncached(search), iterations)
+            warm_mean, warm_p95, _ = self.timed(lambda: search_jobs(*search), iterations)
+            label = ' / '.join(part for part in search if part) or '(all)'
+            self.write_row(label[:28], result['count'], f"{cold_mean:.2f}", f"{cold_p95:.2f}", f"{warm_mean:.2f}", f"{warm_p95:.2f}")
+
+        client = Client()
+        cache.clear()
+        _, p95, response = self.timed(lambda: client.get('/jobs/', {'q': 'driver', 'page': 2}), iterations)
+        status = self.style.SUCCESS if p95 < 50 else self.style.WARNING
+        self.stdout.write(status(f"  /jobs/?q=driver&page=2 p95 {p95:.2f} ms ({response.status_code}, target 50 ms)"))
+
+    def bench_ratelimit(self, options):
+        """Per-request overhead of the rate limit middleware versus the work it protects"""
+        iterations = options['iterations']
+        batch = 1000
+        factory = RequestFactory()
+        user = User.objects.create_user(username='benchlimit', password='bench-password')
+        limits = {
+            # Generous rates so every request is let through
+            'jobs': [{'key': 'ip', 'rate': '1000000/s'}],
+            'user_login': [
+                {'key': 'ip', 'rate': '1000000/s'},
+                {'key': 'ip', 'rate': '1000000/s'},
+                {'key': 'endpoint', 'rate': '1000000/s'},
+            ],
+            'payment_page': [{'key': 'user', 'rate': '1000000/s'}],
+        }
+
+        def make_request(path, method='get', **extra):
+            request = getattr(factory, method)(path, **extra)
+            request.resolver_match = resolve(path)
+            request.user = user
+            return request
+
+        requests_ = [
+            ('unlimited page', make_request('/faq/')),
+            ('one ip rule', make_request('/jobs/')),
+            ('login, three rules', make_request('/user/login/', 'post')),
+            ('one user rule', make_request('/payment/', 'post')),
+        ]
+
+        addresses = [f'10.0.{index >> 8}.{index & 255}' for index in range(batch)]
+
+        def per_request(middleware, request, clients=1):
+            # Microseconds per request, averaged over a batch
+            def run():
+                for index in range(batch):
+                    request.META['REMOTE_ADDR'] = addresses[index % clients]
+                    middleware(request)
+            mean, p95, _ = self.timed(run, iterations)
+            return mean * 1000 / batch, p95 * 1000 / batch
+
+        response = HttpResponse()
+
+        def respond(request):
+            # Stands in for the rest of the stack, which Django runs between the two
+            return middleware.process_view(request, None, (), {}) or response
+
+        self.write_row('request', 'memory us', 'p95', 'cache us', 'p95')
+        stores = [None, 'default']
+        for label, request in requests_:
+            columns = []
+            for store in stores:
+                with override_settings(RATE_LIMITS=limits, RATE_LIMIT_CACHE=store):
+                    middleware = RateLimitMiddleware(respond)
+                    cache.clear()
+                    mean, p95 = per_request(middleware, request)
+                columns += [f"{mean:.1f}", f"{p95:.1f}"]
+            self.write_row(label, *columns)
+
+        # Distinct clients past RATE_LIMIT_MEMORY_MAX_KEYS evict buckets on every request
+        request = make_request('/jobs/')
+        columns = []
+        for store in stores:
+            with override_settings(RATE_LIMITS=limits, RATE_LIMIT_CACHE=store, RATE_LIMIT_MEMORY_MAX_KEYS=batch // 2):
+                middleware = RateLimitMiddleware(respond)
+                cache.clear()
+                mean, p95 = per_request(middleware, request, clients=batch)
+            columns += [f"{mean:.1f}", f"{p95:.1f}"]
+        self.write_row(f'ip rule, {batch} clients', *columns)
+
+        # Refused requests never reach the view
+        with override_settings(RATE_LIMITS={'user_login': [{'key': 'ip', 'rate': '1/d'}]}, RATE_LIMIT_CACHE=None):
+            middleware = RateLimitMiddleware(respond)
+            request = make_request('/user/login/', 'post')
+            middleware(request)
+            mean, p95 = per_request(middleware, request)
+        self.write_row('login, refused', f"{mean:.1f}", f"{p95:.1f}")
+
+        # What an unthrottled request costs
+        hash_ms, _, _ = self.timed(lambda: make_password('bench-password'), min(iterations, 20))
+        body = os.urandom(5 * 1024 * 1024)
+        hmac_ms, _, _ = self.timed(lambda: hmac.new(b'sk_test_bench', body, hashlib.sha512).hexdigest(), min(iterations, 20))
+        self.stdout.write(self.style.SUCCESS(
+            f"  A login attempt hashes for {hash_ms:.1f} ms and a 5 MB webhook body takes "
+            f"{hmac_ms:.1f} ms to verify"
+        ))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+import time
+
+from registrations.duplicates import find_duplicates, rekey, save_clusters, stale_keys
+
+
+class Command(BaseCommand):
+    help = 'Rescan all registrations for duplicates and update the clusters staff review'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Registrations read per query',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report the duplicates without updating blocking keys or clusters',
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        # Keys are kept up to date on save; bulk imports and rule changes skip that
+        stale = None
+        if options['dry_run']:
+            stale = {row[0]: row for rows in stale_keys(options['chunk_size']) for row in rows}
+            if stale:
+                self.stdout.write(f"Would update the blocking keys of {len(stale)} registrations")
+        else:
+            rekeyed = rekey(options['chunk_size'])
+            if rekeyed:
+                self.stdout.write(f"Updated the blocking keys of {rekeyed} registrations")
+
+        groups, stats = find_duplicates(options['chunk_size'], stale)
+        self.stdout.write(
+            f"Compared {stats['comparisons']} pairs in {stats['blocks']} blocks: "
+            f"{sum(len(group) for group in groups)} registrations in {len(groups)} duplicate groups"
+        )
+        for key, value, size in stats['oversized']:
+            self.stdout.write(self.style.WARNING(f"Skipped {key} {value}: shared by {size} registrations"))
+
+        if options['dry_run']:
+            for group in groups:
+                self.stdout.write(f"  {group}")
+            self.stdout.write(self.style.WARNING('DRY RUN - clusters not updated'))
+            return
+
+        created, changed, removed = save_clusters(groups)
+        self.stdout.write(self.style.SUCCESS(
+            f"Clusters: {created} new, {changed} changed, {removed} removed "
+            f"({time.perf_counter() - start:.1f}s)"
+        ))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from registrations.paystack_stub import PaystackStubServer
+
+
+class Command(BaseCommand):
+    help = 'Run a local Paystack API stub (point PAYSTACK_BASE_URL at it)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--port',
+            type=int,
+            default=8765,
+            help='Port to listen on',
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.0,
+            help='Seconds to delay every response',
+        )
+        parser.add_argument(
+            '--jitter',
+            type=float,
+            default=0.0,
+            help='Extra random delay of up to this many seconds',
+        )
+        parser.add_argument(
+            '--error-rate',
+            type=float,
+            default=0.0,
+            help='Fraction of requests answered with HTTP 503 (0-1)',
+        )
+
+    def handle(self, *args, **options):
+        server = PaystackStubServer(
+            ('127.0.0.1', options['port']),
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            verbose=options['verbosity'] > 1,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Paystack stub listening on {server.base_url}'))
+        self.stdout.write(f'Run the site with PAYSTACK_BASE_URL={server.base_url}')
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db.models import Count, Sum
+from datetime import date
+
+from registrations.models import Registration
+from registrations.payouts import process_payouts, due_payouts, retry_failed_payouts
+
+
+class Command(BaseCommand):
+    help = 'Pay due basic income installments with Paystack bulk transfers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--month',
+            type=str,
+            help='Pay installments due up to this month (YYYY-MM format, defaults to the current month)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.PAYOUT_BATCH_SIZE,
+            help='Transfers per bulk transfer request',
+        )
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Schedule failed payouts again before paying',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what is due without transferring anything',
+        )
+
+    def handle(self, *args, **options):
+        # Determine the cut-off month
+        if options['month']:
+            try:
+                year, month = options['month'].split('-')
+                month = date(int(year), int(month), 1)
+            except ValueError:
+                self.stdout.write(self.style.ERROR('Invalid month format. Use YYYY-MM'))
+                return
+        else:
+            month = date.today().replace(day=1)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('DRY RUN - No changes will be made'))
+            due = due_payouts(month).values('mobile_money_provider').annotate(
+                count=Count('id'), total=Sum('amount'),
+            ).order_by('mobile_money_provider')
+            providers = dict(Registration.MOBILE_MONEY_CHOICES)
+            for row in due:
+                self.stdout.write(
+                    f"{providers[row['mobile_money_provider']]}: {row['count']} payouts, GHS {row['total']}"
+                )
+            return
+
+        if options['retry_failed']:
+            self.stdout.write(f"Rescheduled {retry_failed_payouts(month)} failed payouts")
+
+        self.stdout.write(f"Processing payouts due by {month.strftime('%B %Y')}...")
+        stats = process_payouts(month, batch_size=options['batch_size'], log=self.stdout.write)
+
+        summary = (
+            f"{stats['submitted']} transfers in {stats['requests']} bulk requests, "
+            f"{stats['recovered']} interrupted transfers checked"
+        )
+        if 'error' in stats:
+            self.stdout.write(self.style.WARNING(f"Payout run interrupted: {summary}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Payout run completed: {summary}"))
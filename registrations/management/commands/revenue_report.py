@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from datetime import date
+
+from registrations.models import MonthlyRevenue, Registration
+from registrations.payouts import add_months
+
+
+class Command(BaseCommand):
+    help = 'Subscription revenue per month and mobile money provider, from the monthly revenue summary'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months',
+            type=int,
+            default=12,
+            help='Months to show, up to and including the current one',
+        )
+
+    def handle(self, *args, **options):
+        current = date.today().replace(day=1)
+        first = add_months(current, 1 - options['months'])
+        rows = MonthlyRevenue.objects.filter(month__gte=first, month__lte=current).order_by('month', 'mobile_money_provider')
+
+        report = {}
+        for row in rows:
+            report.setdefault((row.month, row.mobile_money_provider), {})[row.status] = row
+
+        providers = dict(Registration.MOBILE_MONEY_CHOICES)
+        self.stdout.write(f"{'Month':<10}{'Provider':<20}{'Paid':>8}{'Collected (GHS)':>18}{'Failed':>8}{'Pending':>9}")
+        total = 0
+        for (month, provider), statuses in report.items():
+            paid = statuses.get('success')
+            total += paid.amount_pesewas if paid else 0
+            self.stdout.write(
+                f"{month.strftime('%Y-%m'):<10}{providers.get(provider, 'Unknown'):<20}"
+                f"{paid.payments if paid else 0:>8}{paid.amount if paid else 0:>18,.2f}"
+                f"{statuses['failed'].payments if 'failed' in statuses else 0:>8}"
+                f"{statuses['pending'].payments if 'pending' in statuses else 0:>9}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Collected since {first.strftime('%B %Y')}: GHS {total / 100:,.2f}"))
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from datetime import date, datetime
+
+from registrations.billing import run_billing, due_authorizations
+
+
+class Command(BaseCommand):
+    help = 'Charge saved Paystack authorizations for the monthly subscription'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--month',
+            type=str,
+            help='Month to bill (YYYY-MM format, defaults to the current month)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.BILLING_BATCH_SIZE,
+            help='Subscribers per batch and checkpoint',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.BILLING_WORKERS,
+            help='Concurrent charge requests',
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=settings.BILLING_RATE_LIMIT,
+            help='Maximum charge requests per second',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count due subscribers without charging anyone',
+        )
+
+    def handle(self, *args, **options):
+        # Determine which month to bill
+        if options['month']:
+            try:
+                month = datetime.strptime(options['month'], '%Y-%m').date().replace(day=1)
+            except ValueError:
+                self.stdout.write(self.style.ERROR('Invalid month format. Use YYYY-MM'))
+                return
+        else:
+            month = date.today().replace(day=1)
+
+        if options['dry_run']:
+            due = due_authorizations(month).count()
+            self.stdout.write(f"{due} subscribers are due for {month.strftime('%B %Y')}")
+            return
+
+        self.stdout.write(f"Billing subscribers for {month.strftime('%B %Y')}...")
+        run = run_billing(
+            month,
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            rate=options['rate'],
+            log=self.stdout.write,
+        )
+
+        message = f"{run.charged} charged, {run.failed} failed"
+        if run.status == 'completed':
+            self.stdout.write(self.style.SUCCESS(f"Billing run completed: {message}"))
+        else:
+            self.stdout.write(self.style.WARNING(f"Billing run interrupted: {message}. Run again to resume."))
@@ -0,0 +1,149 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import logging
+import multiprocessing
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.tasks import DEFAULT_TASK_BACKEND_ALIAS, task_backends
+
+from registrations.task_backend import DatabaseBackend
+
+logger = logging.getLogger(__name__)
+
+
+def run_task(backend, record):
+    try:
+        return backend.execute(record)
+    except Exception:
+        # Don't keep a connection a database error may have broken
+        connection.close()
+        raise
+
+
+def work(queues, threads, batch_size, poll_interval, burst, log=None):
+    """Claim and run tasks until interrupted, or until the queue is empty in burst mode"""
+    log = log or (lambda message: None)
+    # The instance itself: default_task_backend would resolve to a new one in each thread
+    backend = task_backends[DEFAULT_TASK_BACKEND_ALIAS]
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    requeue_every = backend.lease_timeout / 2
+    next_requeue = 0
+    running = {}
+    done = 0
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        while True:
+            if time.monotonic() >= next_requeue:
+                requeued = backend.requeue_stale()
+                if requeued:
+                    log(f"{worker_id}: requeued {requeued} abandoned tasks")
+                next_requeue = time.monotonic() + requeue_every
+
+            free = threads - len(running)
+            claimed = backend.claim(worker_id, queues, min(free, batch_size)) if free else []
+            running.update((pool.submit(run_task, backend, record), record) for record in claimed)
+
+            if not running:
+                if burst:
+                    return done
+                time.sleep(poll_interval)
+                continue
+
+            if len(running) >= threads:
+                timeout = None  # Every thread is busy
+            elif claimed:
+                timeout = 0  # There may be more ready tasks
+            else:
+                timeout = poll_interval
+            finished, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record = running.pop(future)
+                try:
+                    record = future.result()
+                except Exception as e:
+                    # Its outcome was not saved, so it stays RUNNING and runs again once its lease expires
+                    logger.exception("Could not run task #%s", record.pk)
+                    log(f"{worker_id}: {record.task_path} #{record.pk} could not be run: {e}")
+                    continue
+                done += 1
+                if record.status == 'FAILED':
+                    log(f"{worker_id}: {record.task_path} #{record.pk} failed after {record.attempts} attempts")
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=1,
+            help='Worker processes',
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=4,
+            help='Concurrent tasks per process',
+        )
+        parser.add_argument(
+            '--queue',
+            action='append',
+            help='Queue to take tasks from (repeatable, defaults to all queues of the backend)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10,
+            help='Most tasks claimed per query',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait when no task is ready',
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Exit once no task is ready instead of waiting for more',
+        )
+
+    def handle(self, *args, **options):
+        if not isinstance(task_backends[DEFAULT_TASK_BACKEND_ALIAS], DatabaseBackend):
+            self.stdout.write(self.style.ERROR('The default TASKS backend is not the database backend'))
+            return
+
+        arguments = (
+            options['queue'],
+            options['threads'],
+            options['batch_size'],
+            options['poll_interval'],
+            options['burst'],
+            self.stdout.write,
+        )
+
+        try:
+            if options['processes'] <= 1:
+                done = work(*arguments)
+                self.stdout.write(self.style.SUCCESS(f"Ran {done} tasks"))
+                return
+
+            # Forked children must not share the parent's database connections
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            processes = [
+                context.Process(target=work, args=arguments, daemon=True)
+                for _ in range(options['processes'])
+            ]
+            for process in processes:
+                process.start()
+            self.stdout.write(f"Started {len(processes)} worker processes")
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            # Tasks cut short stay RUNNING until their lease expires, then run again
+            self.stdout.write(self.style.WARNING('Stopped'))
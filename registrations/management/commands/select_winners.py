@@ -1,11 +1,20 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from django.core.mail import send_mail
 from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
 from datetime import date
-import random
 
-from registrations.models import MonthlyDraw, Registration, Winner, JobListing, Payment
+from registrations.draws import (
+    assign_jobs, blocked_positions, draw_winners, eligible_snapshot, load_snapshot, lock_for_selection, new_seed,
+    prepare_draw, snapshot_digest, STRATEGIES,
+)
+from registrations.models import MonthlyDraw, Registration, Winner, JobListing
+from registrations.payouts import generate_payouts
+from registrations.tasks import send_winner_notification
 
 
 class Command(BaseCommand):
@@ -20,15 +29,36 @@ class Command(BaseCommand):
         parser.add_argument(
             '--job-winners',
             type=int,
-            default=10,
+            default=settings.DRAW_JOB_WINNERS,
             help='Number of job winners to select',
         )
         parser.add_argument(
             '--income-winners',
             type=int,
-            default=5,
+            default=settings.DRAW_INCOME_WINNERS,
             help='Number of basic income winners to select',
         )
+        parser.add_argument(
+            '--seed',
+            type=str,
+            help='Draw seed, e.g. published public randomness (defaults to a random 256-bit value)',
+        )
+        parser.add_argument(
+            '--strategy',
+            choices=STRATEGIES,
+            help='uniform, stratified by region, or weighted by months paid (defaults to DRAW_STRATEGY)',
+        )
+        parser.add_argument(
+            '--backlog',
+            action='store_true',
+            help='Process every ready draw whose winners have not been selected, oldest first',
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=4,
+            help='Draws snapshotted in parallel in backlog mode',
+        )
         parser.add_argument(
             '--dry-run',
             action='store_true',
@@ -36,6 +66,13 @@ class Command(BaseCommand):
         )
 
     def handle(self, *args, **options):
+        if options['backlog']:
+            if options['month'] or options['seed']:
+                self.stdout.write(self.style.ERROR('--month and --seed apply to a single draw, not to --backlog'))
+                return
+            self.process_backlog(options)
+            return
+
         # Determine which month to process
         if options['month']:
             try:
@@ -69,49 +106,124 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING(f'Winners already selected for this draw'))
             return
 
-        # Get eligible participants (those who paid for this month)
-        eligible_registrations = Registration.objects.filter(
-            is_active=True,
-            payments__month_paid_for=draw_month,
-            payments__status='success'
-        ).distinct()
+        self.select(monthly_draw, options)
+
+    def process_backlog(self, options):
+        """Select the winners of every ready draw still waiting for them, in month order"""
+        backlog = list(MonthlyDraw.objects.filter(
+            status='active',
+            winners_selected=False,
+            current_participants__gte=F('minimum_participants'),
+        ).order_by('draw_month'))
+        self.stdout.write(f"Found {len(backlog)} draws waiting for winners")
+        if not backlog:
+            return
+
+        if not options['dry_run']:
+            # Snapshots and Merkle trees are the slow part and independent, so
+            # they are built in parallel. Selection stays sequential: with the
+            # cooldown each draw depends on the winners of the ones before it.
+            unprepared = [monthly_draw.pk for monthly_draw in backlog if not monthly_draw.snapshot_sha256]
+            if unprepared:
+                self.stdout.write(f"Snapshotting {len(unprepared)} draws")
+                # Forked children must not share the parent's database connections
+                connections.close_all()
+                strategy = options['strategy'] or settings.DRAW_STRATEGY
+                with ProcessPoolExecutor(
+                    max_workers=max(1, min(options['processes'], len(unprepared))),
+                    mp_context=multiprocessing.get_context('fork'),
+                ) as pool:
+                    list(pool.map(prepare_draw, unprepared, [None] * len(unprepared), [strategy] * len(unprepared)))
+
+        for monthly_draw in backlog:
+            self.stdout.write(f"\nProcessing draw for {monthly_draw.draw_month.strftime('%B %Y')}")
+            monthly_draw.refresh_from_db()
+            self.select(monthly_draw, options)
+
+    def select(self, monthly_draw, options):
+        """Draw and record the winners of one ready draw"""
+        # Snapshot the eligible participants (those who paid for this month) once;
+        # a rerun after an interrupted draw reuses the snapshot and seed
+        if options['dry_run'] and not monthly_draw.snapshot_sha256:
+            snapshot = eligible_snapshot(monthly_draw.draw_month)
+            snapshot_sha256 = snapshot_digest(snapshot)
+            seed = options['seed'] or new_seed()
+            strategy = options['strategy'] or settings.DRAW_STRATEGY
+        else:
+            monthly_draw = prepare_draw(monthly_draw.pk, options['seed'], options['strategy'] or settings.DRAW_STRATEGY)
+            if not monthly_draw.snapshot_sha256:
+                self.stdout.write(self.style.ERROR('No eligible participants found'))
+                return
+            snapshot = load_snapshot(monthly_draw.snapshot_file, monthly_draw.snapshot_sha256)
+            snapshot_sha256 = monthly_draw.snapshot_sha256
+            seed = monthly_draw.draw_seed
+            strategy = monthly_draw.draw_strategy or 'uniform'
+            # A draw is prepared once; its seed and strategy cannot change afterwards
+            if (options['seed'] or seed) != seed or (options['strategy'] or strategy) != strategy:
+                self.stdout.write(self.style.ERROR(
+                    f'This draw was prepared with seed {seed} and strategy {strategy}; '
+                    f'rerun without --seed and --strategy or with the same values'
+                ))
+                return
 
-        eligible_count = eligible_registrations.count()
+        eligible_count = len(snapshot)
         self.stdout.write(f"Found {eligible_count} eligible participants")
 
         if eligible_count == 0:
             self.stdout.write(self.style.ERROR('No eligible participants found'))
             return
 
-        # Get available jobs
-        available_jobs = JobListing.objects.filter(is_active=True)
-        job_count = available_jobs.count()
+        self.stdout.write(f"Snapshot SHA-256: {snapshot_sha256}")
+        self.stdout.write(f"Seed: {seed}")
+        self.stdout.write(f"Strategy: {strategy}")
+        if monthly_draw.merkle_root:
+            self.stdout.write(f"Merkle root: {monthly_draw.merkle_root}")
 
-        # Adjust winner counts based on availability
-        job_winners_count = min(options['job_winners'], job_count, eligible_count)
-        income_winners_count = min(options['income_winners'], eligible_count - job_winners_count)
+        cooldown = settings.WINNER_COOLDOWN_MONTHS
 
-        self.stdout.write(f"Selecting {job_winners_count} job winners and {income_winners_count} income winners")
+        with transaction.atomic():
+            # Lock this draw and its neighbours, then bar their winners
+            locked_draw, excluded = lock_for_selection(monthly_draw.pk, cooldown)
+            if locked_draw.winners_selected:
+                self.stdout.write(self.style.WARNING(f'Winners already selected for this draw'))
+                return
+            excluded = sorted(excluded)
+            excluded_count = len(blocked_positions(snapshot, excluded))
+            if excluded_count:
+                self.stdout.write(f"Excluding {excluded_count} participants who won within {cooldown} months")
+
+            # Get available jobs
+            available_jobs = JobListing.objects.filter(is_active=True)
+            job_count = available_jobs.count()
 
-        if options['dry_run']:
-            self.stdout.write(self.style.WARNING('DRY RUN - No changes will be made'))
+            # Adjust winner counts based on availability
+            eligible_count -= excluded_count
+            job_winners_count = min(options['job_winners'], job_count, eligible_count)
+            income_winners_count = min(options['income_winners'], eligible_count - job_winners_count)
 
-        # Convert to list for random selection
-        participants_list = list(eligible_registrations)
+            self.stdout.write(f"Selecting {job_winners_count} job winners and {income_winners_count} income winners")
 
-        # Select job winners
-        job_winners = []
-        if job_winners_count > 0 and job_count > 0:
-            selected_participants = random.sample(participants_list, job_winners_count)
-            selected_jobs = list(available_jobs.order_by('?')[:job_winners_count])
+            if options['dry_run']:
+                self.stdout.write(self.style.WARNING('DRY RUN - No changes will be made'))
 
-            for i, registration in enumerate(selected_participants):
-                job = selected_jobs[i % len(selected_jobs)]
+            # Job winners are drawn first, basic income winners from the entrants left
+            job_winner_ids, income_winner_ids = draw_winners(
+                snapshot, seed, snapshot_sha256, [job_winners_count, income_winners_count], strategy, excluded,
+            )
+            registrations = Registration.objects.in_bulk(job_winner_ids + income_winner_ids)
+            job_ids = assign_jobs(available_jobs.values_list('id', flat=True), seed, snapshot_sha256, job_winners_count)
+            jobs = JobListing.objects.in_bulk(job_ids)
+
+            # Select job winners
+            job_winners = []
+            for registration_id, job_id in zip(job_winner_ids, job_ids):
+                registration = registrations[registration_id]
+                job = jobs[job_id]
 
                 if not options['dry_run']:
                     winner = Winner.objects.create(
                         registration=registration,
-                        monthly_draw=monthly_draw,
+                        monthly_draw=locked_draw,
                         prize_type='job',
                         prize_details=f"{job.title} - {job.description[:200]}"
                     )
@@ -126,21 +238,20 @@ class Command(BaseCommand):
                 else:
                     self.stdout.write(f"[DRY RUN] Would select: {registration.full_name} for {job.title}")
 
-                # Remove from participants list
-                participants_list.remove(registration)
-
-        # Select basic income winners
-        income_winners = []
-        if income_winners_count > 0 and len(participants_list) > 0:
-            selected_participants = random.sample(participants_list, min(income_winners_count, len(participants_list)))
+            # Select basic income winners
+            income_winners = []
+            for registration_id in income_winner_ids:
+                registration = registrations[registration_id]
 
-            for registration in selected_participants:
                 if not options['dry_run']:
                     winner = Winner.objects.create(
                         registration=registration,
-                        monthly_draw=monthly_draw,
+                        monthly_draw=locked_draw,
                         prize_type='basic_income',
-                        prize_details="1 Year Basic Income Support - GHS 500 per month for 12 months"
+                        prize_details=(
+                            f"Basic Income Support - GHS {settings.BASIC_INCOME_MONTHLY_AMOUNT} per month "
+                            f"for {settings.BASIC_INCOME_MONTHS} months"
+                        )
                     )
                     income_winners.append(winner)
 
@@ -153,66 +264,25 @@ class Command(BaseCommand):
                 else:
                     self.stdout.write(f"[DRY RUN] Would select: {registration.full_name} for Basic Income")
 
-        # Mark draw as completed
-        if not options['dry_run']:
-            monthly_draw.winners_selected = True
-            monthly_draw.status = 'completed'
-            monthly_draw.save()
-
-            self.stdout.write(self.style.SUCCESS(
-                f'\n✓ Draw completed successfully!'
-                f'\n  Total Job Winners: {len(job_winners)}'
-                f'\n  Total Income Winners: {len(income_winners)}'
-            ))
-        else:
-            self.stdout.write(self.style.WARNING('\n[DRY RUN] Draw not marked as completed'))
-
-    def send_winner_notification(self, registration, prize_type, prize_name):
-        """Send email notification to winner"""
-        try:
-            subject = f"🎉 Congratulations! You've Won - Jobmarkt"
-
-            if prize_type == 'job':
-                message = f"""
-Dear {registration.full_name},
-
-Congratulations! You have been selected as a winner in this month's Jobmarkt draw!
-
-🎉 YOU WON: {prize_name}
-
-We will contact you within 48 hours with more details about your prize and next steps.
-
-Please log in to your dashboard to view your winning details and claim your prize.
-
-Dashboard: http://localhost:8000/user/dashboard/
-
-Best regards,
-The Jobmarkt Team
-                """
+            # Mark draw as completed
+            if not options['dry_run']:
+                locked_draw.winners_selected = True
+                locked_draw.status = 'completed'
+                locked_draw.excluded_registrations = excluded
+                locked_draw.winner_cooldown_months = cooldown
+                locked_draw.save()
+
+                # Schedule the monthly basic income installments
+                generate_payouts(Winner.objects.filter(monthly_draw=locked_draw))
+
+                self.stdout.write(self.style.SUCCESS(
+                    f'\n✓ Draw completed successfully!'
+                    f'\n  Total Job Winners: {len(job_winners)}'
+                    f'\n  Total Income Winners: {len(income_winners)}'
+                ))
             else:
-                message = f"""
-Dear {registration.full_name},
-
-Congratulations! You have been selected as a winner in this month's Jobmarkt draw!
-
-🎉 YOU WON: 1 Year Basic Income (GHS 500/month for 12 months)
-
-We will contact you within 48 hours with more details about your prize and payment setup.
+                self.stdout.write(self.style.WARNING('\n[DRY RUN] Draw not marked as completed'))
 
-Please log in to your dashboard to view your winning details and claim your prize.
-
-Dashboard: http://localhost:8000/user/dashboard/
-
-Best regards,
-The Jobmarkt Team
-                """
-
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                [registration.email],
-                fail_silently=True,
-            )
-        except Exception as e:
-            self.stdout.write(self.style.WARNING(f"Failed to send email to {registration.email}: {str(e)}"))
+    def send_winner_notification(self, registration, prize_type, prize_name):
+        """Queue the email notification to the winner"""
+        send_winner_notification.enqueue(registration.id, prize_type, prize_name)
@@ -0,0 +1,167 @@
+from django.core.management.base import BaseCommand
+import os
+import time
+
+from registrations.simulation import calibrate, default_parameters, simulate, summarize
+
+
+class Command(BaseCommand):
+    help = 'Simulate registration growth and draws to plan the participant minimum and prize counts'
+
+    def add_arguments(self, parser):
+        defaults = default_parameters()
+        parser.add_argument(
+            '--trials',
+            type=int,
+            default=1000000,
+            help='Simulated futures of the programme',
+        )
+        parser.add_argument(
+            '--months',
+            type=int,
+            default=defaults['months'],
+            help='Months each trial runs for',
+        )
+        parser.add_argument(
+            '--from-db',
+            action='store_true',
+            help='Start from the current subscribers, signups, conversion and churn in the database',
+        )
+        parser.add_argument(
+            '--subscribers',
+            type=int,
+            help=f"Paying subscribers at the start (default {defaults['subscribers']})",
+        )
+        parser.add_argument(
+            '--signups',
+            type=float,
+            help=f"New registrations per month at the start (default {defaults['signups']})",
+        )
+        parser.add_argument(
+            '--growth',
+            type=float,
+            default=defaults['growth'],
+            help='Mean monthly growth of signups',
+        )
+        parser.add_argument(
+            '--growth-sd',
+            type=float,
+            default=defaults['growth_sd'],
+            help='Spread of the monthly growth between trials',
+        )
+        parser.add_argument(
+            '--conversion',
+            type=float,
+            help=f"Share of new registrations that start paying (default {defaults['conversion']})",
+        )
+        parser.add_argument(
+            '--churn',
+            type=float,
+            help=f"Share of subscribers that stop paying each month (default {defaults['churn']})",
+        )
+        parser.add_argument(
+            '--minimum-participants',
+            type=int,
+            default=defaults['minimum_participants'],
+            help='Paid entrants a draw needs to be held',
+        )
+        parser.add_argument(
+            '--job-winners',
+            type=int,
+            default=defaults['job_winners'],
+            help='Job winners per draw',
+        )
+        parser.add_argument(
+            '--income-winners',
+            type=int,
+            default=defaults['income_winners'],
+            help='Basic income winners per draw',
+        )
+        parser.add_argument(
+            '--jobs',
+            type=int,
+            help='Job listings available per draw (defaults to --job-winners)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=65536,
+            help='Trials simulated together; arrays this size stay in the CPU cache',
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=1,
+            help='Worker processes (0 for one per CPU)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed; the same seed and batch size give the same report',
+        )
+
+    def handle(self, *args, **options):
+        params = default_parameters()
+        if options['from_db']:
+            observed = calibrate()
+            self.stdout.write(
+                f"Observed: {observed['subscribers']} subscribers, {observed['signups']} signups last month, "
+                f"conversion {self.share(observed['conversion'])}, churn {self.share(observed['churn'])}"
+            )
+            params.update({name: value for name, value in observed.items() if value is not None})
+
+        for name in ('months', 'subscribers', 'signups', 'growth', 'growth_sd', 'conversion', 'churn',
+                     'minimum_participants', 'job_winners', 'income_winners'):
+            if options[name] is not None:
+                params[name] = options[name]
+        params['jobs'] = options['jobs'] if options['jobs'] is not None else params['job_winners']
+
+        processes = options['processes'] or os.cpu_count()
+        self.stdout.write(
+            f"Simulating {options['trials']:,} trials of {params['months']} months "
+            f"({params['subscribers']:,} subscribers, {params['signups']:,.0f} signups/month growing "
+            f"{params['growth']:.1%} ± {params['growth_sd']:.1%}, conversion {params['conversion']:.1%}, "
+            f"churn {params['churn']:.1%})"
+        )
+        start = time.perf_counter()
+        result = simulate(params, options['trials'], options['batch_size'], processes, options['seed'])
+        elapsed = time.perf_counter() - start
+        report = summarize(params, result)
+
+        self.stdout.write(f"\nMinimum of {params['minimum_participants']:,} participants")
+        self.stdout.write(f"  Reached within {params['months']} months: {report['reach_probability']:.1%} of trials")
+        if report['threshold_mean'] is not None:
+            self.stdout.write(f"  Months until reached: {report['threshold_mean']:.1f} on average when reached, "
+                              f"median {self.months(report['threshold_median'])}, "
+                              f"90th percentile {self.months(report['threshold_p90'])}")
+        self.stdout.write(f"  Draws held: {report['draws_mean']:.1f} on average")
+
+        self.stdout.write(f"\nOdds per participant ({params['job_winners']} job and {params['income_winners']} income winners)")
+        self.stdout.write(f"{'Month':>7}{'Entrants':>12}{'Draw held':>12}{'Win odds':>14}")
+        for month in range(params['months']):
+            odds = report['odds_mean'][month]
+            self.stdout.write(
+                f"{month + 1:>7}{report['entrants_mean'][month]:>12,.0f}{report['draw_probability'][month]:>12.1%}"
+                f"{('1 in ' + format(1 / odds, ',.0f')) if odds else '-':>14}"
+            )
+        self.stdout.write(f"  A subscriber paying every month wins at least once: {report['win_any']:.2%}")
+
+        self.stdout.write(f"\nBasic income liabilities over {params['months']} months")
+        self.stdout.write(f"  Winners: {report['income_winners_mean']:.1f} on average")
+        self.stdout.write(f"  Committed: GHS {report['liability_mean']:,.0f} on average, "
+                          f"GHS {report['liability_p95']:,.0f} at the 95th and "
+                          f"GHS {report['liability_p99']:,.0f} at the 99th percentile")
+        self.stdout.write(f"  Subscription revenue: GHS {report['revenue_mean']:,.0f} on average")
+        self.stdout.write(f"  Committed more than collected: {report['shortfall_probability']:.1%} of trials")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\n{options['trials']:,} trials in {elapsed:.2f}s "
+            f"({options['trials'] * params['months'] / elapsed / 1e6:,.0f}M simulated months/s, {processes} processes)"
+        ))
+
+    def share(self, value):
+        return 'unknown' if value is None else f"{value:.1%}"
+
+    def months(self, value):
+        return 'never' if value is None else f"{value}"
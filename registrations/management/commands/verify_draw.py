@@ -0,0 +1,102 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from datetime import datetime
+import os
+import tempfile
+
+from registrations.archive import winner_registrations
+from registrations.draws import build_merkle_tree, draw_winners, load_snapshot, SnapshotMismatch
+from registrations.models import MonthlyDraw
+from registrations.payouts import add_months
+
+
+class Command(BaseCommand):
+    help = 'Re-derive a completed draw from its snapshot and seed and compare with the recorded winners'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--month',
+            type=str,
+            required=True,
+            help='Draw month (YYYY-MM format)',
+        )
+        parser.add_argument(
+            '--snapshot',
+            type=str,
+            help='Snapshot file to check instead of the stored one, e.g. a published copy',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            draw_month = datetime.strptime(options['month'], '%Y-%m').date()
+        except ValueError:
+            self.stdout.write(self.style.ERROR('Invalid month format. Use YYYY-MM'))
+            return
+
+        try:
+            monthly_draw = MonthlyDraw.objects.get(draw_month=draw_month)
+        except MonthlyDraw.DoesNotExist:
+            self.stdout.write(self.style.ERROR(f'No draw found for {draw_month.strftime("%B %Y")}'))
+            return
+
+        if not monthly_draw.snapshot_sha256:
+            self.stdout.write(self.style.ERROR('This draw has no snapshot to verify against'))
+            return
+
+        try:
+            snapshot = load_snapshot(options['snapshot'] or monthly_draw.snapshot_file, monthly_draw.snapshot_sha256)
+        except (OSError, SnapshotMismatch) as e:
+            self.stdout.write(self.style.ERROR(f'Snapshot check failed: {e}'))
+            return
+
+        self.stdout.write(f"Snapshot: {len(snapshot)} eligible participants, SHA-256 {monthly_draw.snapshot_sha256}")
+        self.stdout.write(f"Seed: {monthly_draw.draw_seed}")
+
+        if monthly_draw.merkle_root:
+            with tempfile.TemporaryDirectory() as directory:
+                root = build_merkle_tree(snapshot, os.path.join(directory, 'draw.merkle'))
+            if root != monthly_draw.merkle_root:
+                self.stdout.write(self.style.ERROR(f"✗ Merkle root {root} differs from the published {monthly_draw.merkle_root}"))
+                return
+            self.stdout.write(f"Merkle root: {root}")
+
+        recorded = {
+            prize_type: winner_registrations(monthly_draw=monthly_draw, prize_type=prize_type)
+            for prize_type in ('job', 'basic_income')
+        }
+
+        strategy = monthly_draw.draw_strategy or 'uniform'
+        self.stdout.write(f"Strategy: {strategy}")
+
+        # Every barred registration must have won a draw within the cooldown
+        excluded = monthly_draw.excluded_registrations
+        if excluded:
+            cooldown = monthly_draw.winner_cooldown_months or 0
+            barred = winner_registrations(
+                ~Q(monthly_draw=monthly_draw),
+                registration_id__in=excluded,
+                monthly_draw__draw_month__gt=add_months(draw_month, -cooldown),
+                monthly_draw__draw_month__lt=add_months(draw_month, cooldown),
+            )
+            unexplained = sorted(set(excluded) - barred)
+            if unexplained:
+                self.stdout.write(self.style.ERROR(
+                    f"✗ Registrations {unexplained} were excluded without winning within {cooldown} months"
+                ))
+                return
+            self.stdout.write(f"Excluded: {len(excluded)} winners of draws within {cooldown} months")
+
+        job_winners, income_winners = draw_winners(
+            snapshot, monthly_draw.draw_seed, monthly_draw.snapshot_sha256,
+            [len(recorded['job']), len(recorded['basic_income'])], strategy, excluded,
+        )
+
+        if set(job_winners) == recorded['job'] and set(income_winners) == recorded['basic_income']:
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ Verified: {len(job_winners)} job and {len(income_winners)} income winners match the draw"
+            ))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f"✗ Mismatch: the draw gives job winners {sorted(job_winners)} and income winners "
+                f"{sorted(income_winners)}, recorded {sorted(recorded['job'])} and {sorted(recorded['basic_income'])}"
+            ))
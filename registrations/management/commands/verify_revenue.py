@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+import time
+
+from registrations.ledger import differences, rebuild, replay, summary
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the monthly revenue totals from the payment ledger and compare them with the stored summary'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='Ledger entries read per query',
+        )
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Replace the stored summary with the rebuilt totals when they differ',
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        expected = replay(options['chunk_size'])
+        stored = summary()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"Replayed the ledger into {len(expected)} summary rows ({elapsed:.1f}s)")
+
+        diffs = differences(expected, stored)
+        if not diffs:
+            self.stdout.write(self.style.SUCCESS('✓ Monthly revenue matches the ledger'))
+            return
+
+        for (month, provider, status), (payments, pesewas), (stored_payments, stored_pesewas) in diffs:
+            self.stdout.write(self.style.ERROR(
+                f"✗ {month.strftime('%Y-%m')} {provider or '-'} {status}: ledger {payments} payments, "
+                f"GHS {pesewas / 100:,.2f}; summary {stored_payments} payments, GHS {stored_pesewas / 100:,.2f}"
+            ))
+        if options['fix']:
+            rebuild(expected)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt the summary from the ledger ({len(diffs)} rows corrected)"))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(diffs)} rows differ; rerun with --fix to rebuild the summary"))
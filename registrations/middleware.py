@@ -0,0 +1,350 @@
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.functional import SimpleLazyObject
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.utils.text import acompress_sequence, compress_sequence, compress_string
+from django.views.static import was_modified_since
+import mimetypes
+import os
+import random
+import threading
+import time
+
+from . import profiling, ratelimit
+from .models import Registration
+
+try:
+    import brotli
+except ImportError:  # Responses fall back to gzip when the package is missing
+    brotli = None
+
+# Preferred order when the client accepts several encodings
+STATIC_ENCODINGS = [
+    ('br', '.br'),
+    ('gzip', '.gz'),
+]
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def accepted_encodings(request):
+    """Content codings the client accepts, ignoring those refused with q=0"""
+    accepted = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = part.partition(';')
+        params = params.replace(' ', '')
+        if params.startswith('q='):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticMiddleware:
+    """
+    Serve files collected into STATIC_ROOT without touching the rest of the stack.
+
+    The ``.br``/``.gz`` variant written by collectstatic is picked according
+    to Accept-Encoding, and content-hashed names are marked immutable so
+    repeat visitors never download them again.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.static_url = settings.STATIC_URL
+        self.static_root = settings.STATIC_ROOT
+        self._hashed_names = None
+
+    def __call__(self, request):
+        if self.static_root and request.method in ('GET', 'HEAD') and request.path.startswith(self.static_url):
+            response = self.serve(request, request.path[len(self.static_url):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    @property
+    def hashed_names(self):
+        if self._hashed_names is None:
+            hashed_files = getattr(staticfiles_storage, 'hashed_files', {})
+            self._hashed_names = set(hashed_files.values())
+        return self._hashed_names
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(self.static_root, name)
+        except SuspiciousFileOperation:
+            return None
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        if not os.path.isfile(path):
+            return None
+
+        if not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime):
+            response = HttpResponseNotModified()
+            self.patch_headers(response, name)
+            return response
+
+        content_type, _ = mimetypes.guess_type(path)
+        encoding = None
+        accepted = accepted_encodings(request)
+        for coding, suffix in STATIC_ENCODINGS:
+            if coding in accepted and os.path.isfile(path + suffix):
+                path, encoding = path + suffix, coding
+                break
+
+        response = FileResponse(open(path, 'rb'), content_type=content_type or 'application/octet-stream')
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        self.patch_headers(response, name)
+        return response
+
+    def patch_headers(self, response, name):
+        if name in self.hashed_names:
+            response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        else:
+            response['Cache-Control'] = f'public, max-age={settings.STATIC_CACHE_MAX_AGE}'
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+
+# Content types worth compressing on the fly
+COMPRESSIBLE_CONTENT_TYPES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+)
+
+
+def brotli_compress_sequence(sequence, quality):
+    """Brotli counterpart of django.utils.text.compress_sequence"""
+    compressor = brotli.Compressor(quality=quality)
+    for item in sequence:
+        data = compressor.process(item) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def abrotli_compress_sequence(sequence, quality):
+    compressor = brotli.Compressor(quality=quality)
+    async for item in sequence:
+        data = compressor.process(item) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def reflects_secrets(request):
+    """
+    Whether the response may hold a secret next to attacker-controlled input
+    (BREACH): a CSRF token, or a logged-in user's own data
+    """
+    # get_token() and rotate_token() set this whenever a token is handed out
+    if 'CSRF_COOKIE_NEEDS_UPDATE' in request.META:
+        return True
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_authenticated
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with brotli or gzip, whichever the client prefers.
+
+    Works like Django's GZipMiddleware (including BREACH padding for gzip and
+    chunk-by-chunk compression of streaming responses) but adds brotli, a
+    configurable size threshold and a content type allow-list so images and
+    archives are not compressed twice.
+
+    Brotli has no equivalent of the padding, so responses that may reflect a
+    secret (see reflects_secrets) are always gzipped.
+    """
+
+    max_random_bytes = 100
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.compress(request, response)
+
+    def compress(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+
+        content_type = response.get('Content-Type', '')
+        if not content_type.startswith(COMPRESSIBLE_CONTENT_TYPES):
+            return response
+        # A compressor may hold back an event until more data arrives
+        if content_type.startswith('text/event-stream'):
+            return response
+
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        accepted = accepted_encodings(request)
+        if brotli is not None and 'br' in accepted and not reflects_secrets(request):
+            encoding = 'br'
+        elif 'gzip' in accepted:
+            encoding = 'gzip'
+        else:
+            return response
+
+        quality = settings.COMPRESSION_BROTLI_QUALITY
+        if response.streaming:
+            if encoding == 'br':
+                compressor = abrotli_compress_sequence if response.is_async else brotli_compress_sequence
+                response.streaming_content = compressor(response.streaming_content, quality)
+            else:
+                compressor = acompress_sequence if response.is_async else compress_sequence
+                response.streaming_content = compressor(
+                    response.streaming_content,
+                    max_random_bytes=self.max_random_bytes,
+                )
+            # The compressed size is only known once the stream is consumed
+            del response.headers['Content-Length']
+        else:
+            if encoding == 'br':
+                compressed_content = brotli.compress(response.content, quality=quality)
+            else:
+                compressed_content = compress_string(
+                    response.content,
+                    max_random_bytes=self.max_random_bytes,
+                )
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(response.content))
+
+        # A strong ETag must not match the compressed representation
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Sample the Python stacks of a fraction of requests and of slow ones
+    (registrations.profiling).
+
+    Removed from the stack at startup unless PROFILING_ENABLED, so it costs
+    nothing when off. Put it first to include the other middleware.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sampler = profiling.Sampler(settings.PROFILING_INTERVAL_MS / 1000)
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        if random.random() < settings.PROFILING_SAMPLE_RATE:
+            sample_from = start
+        else:
+            sample_from = start + settings.PROFILING_SLOW_REQUEST_MS / 1000
+        profile = profiling.Profile(threading.get_ident(), ProfilingMiddleware.__call__.__code__, sample_from)
+
+        self.sampler.watch(profile)
+        try:
+            return self.get_response(request)
+        finally:
+            self.sampler.unwatch(profile)
+            if profile.samples:
+                match = request.resolver_match
+                profiling.write_profile(profile, match.url_name if match else None, time.perf_counter() - start)
+
+
+class RateLimitMiddleware:
+    """
+    Refuse requests over their RATE_LIMITS with 429 and shed load with 503
+    (registrations.ratelimit), before anything reads the request body.
+
+    Requests are shed while LOAD_SHED_MAX_IN_FLIGHT are already being served
+    by this process, or once they waited LOAD_SHED_MAX_QUEUE_MS behind the
+    front proxy. Rate limits are checked in process_view, so this must come
+    before CsrfViewMiddleware, which parses POST bodies there. Removed from
+    the stack unless RATE_LIMIT_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        if not settings.RATE_LIMIT_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.limiter = ratelimit.RateLimiter(
+            settings.RATE_LIMITS, ratelimit.get_store(), settings.RATE_LIMIT_PROXY_COUNT,
+        )
+        self.max_in_flight = settings.LOAD_SHED_MAX_IN_FLIGHT
+        self.max_queue_time = settings.LOAD_SHED_MAX_QUEUE_MS / 1000
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        queued = ratelimit.queue_time(request, time.time())
+        if queued is not None and queued > self.max_queue_time:
+            # The client has most likely given up already
+            return ratelimit.overloaded()
+
+        with self.lock:
+            if self.in_flight >= self.max_in_flight:
+                return ratelimit.overloaded()
+            self.in_flight += 1
+        try:
+            return self.get_response(request)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        wait = self.limiter.check(request, request.resolver_match.url_name)
+        if wait:
+            return ratelimit.too_many_requests(wait)
+        return None
+
+
+def get_registration(request):
+    """The logged-in user's registration, or None, looked up once per request"""
+    if not hasattr(request, '_cached_registration'):
+        registration = None
+        if request.user.is_authenticated:
+            try:
+                # Already joined in by RegistrationModelBackend
+                registration = request.user.registration
+            except Registration.DoesNotExist:
+                pass
+        request._cached_registration = registration
+    return request._cached_registration
+
+
+class RegistrationMiddleware:
+    """
+    Attach a lazily loaded ``request.registration``.
+
+    Must come after AuthenticationMiddleware. The proxy is falsy when the
+    user is anonymous or has no registration record.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.registration = SimpleLazyObject(lambda: get_registration(request))
+        return self.get_response(request)
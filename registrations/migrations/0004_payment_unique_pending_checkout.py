@@ -0,0 +1,33 @@
+# Generated by Django 6.1.2 on 2026-10-19 05:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def cancel_duplicate_pending_payments(apps, schema_editor):
+    """Keep only the newest pending payment per registration and month"""
+    Payment = apps.get_model('registrations', 'Payment')
+    seen = set()
+    pending = Payment.objects.filter(status='pending').order_by('-created_date', '-id')
+    for payment_id, registration_id, month in pending.values_list('id', 'registration_id', 'month_paid_for'):
+        key = (registration_id, month)
+        if key in seen:
+            Payment.objects.filter(pk=payment_id).update(status='cancelled')
+        else:
+            seen.add(key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registrations', '0003_registration_updated_date'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_duplicate_pending_payments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('registration', 'month_paid_for'), name='unique_pending_payment_per_month'),
+        ),
+    ]
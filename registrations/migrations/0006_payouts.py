@@ -0,0 +1,44 @@
+# Generated by Django 6.1.2 on 2026-10-19 06:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registrations', '0005_payment_authorization_billing_run'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registration',
+            name='transfer_recipient_code',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.CreateModel(
+            name='Payout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('installment', models.PositiveSmallIntegerField()),
+                ('due_month', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('mobile_money_provider', models.CharField(choices=[('mtn', 'MTN Mobile Money'), ('vodafone', 'Vodafone Cash'), ('airteltigo', 'AirtelTigo Money')], max_length=20)),
+                ('status', models.CharField(choices=[('scheduled', 'Scheduled'), ('processing', 'Processing'), ('paid', 'Paid'), ('failed', 'Failed')], default='scheduled', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('reference', models.CharField(blank=True, max_length=100, null=True, unique=True)),
+                ('transfer_code', models.CharField(blank=True, max_length=100, null=True)),
+                ('failure_reason', models.CharField(blank=True, max_length=255, null=True)),
+                ('paid_at', models.DateTimeField(blank=True, null=True)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+                ('registration', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payouts', to='registrations.registration')),
+                ('winner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payouts', to='registrations.winner')),
+            ],
+            options={
+                'ordering': ['due_month', 'id'],
+                'indexes': [models.Index(fields=['status', 'mobile_money_provider', 'due_month'], name='registratio_status_76db9d_idx')],
+                'unique_together': {('winner', 'installment')},
+            },
+        ),
+    ]
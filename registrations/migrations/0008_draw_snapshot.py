@@ -0,0 +1,33 @@
+# Generated by Django 6.1.2 on 2026-10-19 06:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registrations', '0007_queued_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monthlydraw',
+            name='draw_seed',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='monthlydraw',
+            name='snapshot_file',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='monthlydraw',
+            name='snapshot_sha256',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='monthlydraw',
+            name='snapshot_size',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.1.2 on 2026-10-19 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registrations', '0008_draw_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monthlydraw',
+            name='merkle_root',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.1.2 on 2026-10-19 06:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registrations', '0009_draw_merkle_root'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monthlydraw',
+            name='draw_strategy',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+    ]
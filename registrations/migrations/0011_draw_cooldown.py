@@ -0,0 +1,23 @@
+# Generated by Django 6.1.2 on 2026-10-19 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registrations', '0010_draw_strategy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monthlydraw',
+            name='excluded_registrations',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='monthlydraw',
+            name='winner_cooldown_months',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
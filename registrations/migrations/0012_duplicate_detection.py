@@ -0,0 +1,44 @@
+# Generated by Django 6.1.2 on 2026-10-19 06:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registrations', '0011_draw_cooldown'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DuplicateCluster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('open', 'Open'), ('confirmed', 'Confirmed duplicates'), ('dismissed', 'Not duplicates')], db_index=True, default='open', max_length=20)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-updated_date'],
+            },
+        ),
+        migrations.AddField(
+            model_name='registration',
+            name='name_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='registration',
+            name='phone_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20),
+        ),
+        migrations.CreateModel(
+            name='DuplicateMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cluster', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='registrations.duplicatecluster')),
+                ('registration', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='duplicate_membership', to='registrations.registration')),
+            ],
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 6.1.2 on 2026-10-19 06:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registrations', '0012_duplicate_detection'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedWinner',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('prize_type', models.CharField(choices=[('job', 'Job Position'), ('basic_income', 'Basic Income')], max_length=20)),
+                ('prize_details', models.TextField()),
+                ('is_claimed', models.BooleanField(default=False)),
+                ('claim_date', models.DateTimeField(blank=True, null=True)),
+                ('created_date', models.DateTimeField()),
+                ('monthly_draw', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_winners', to='registrations.monthlydraw')),
+                ('registration', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_wins', to='registrations.registration')),
+            ],
+            options={
+                'unique_together': {('registration', 'monthly_draw')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedPayout',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('installment', models.PositiveSmallIntegerField()),
+                ('due_month', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('mobile_money_provider', models.CharField(choices=[('mtn', 'MTN Mobile Money'), ('vodafone', 'Vodafone Cash'), ('airteltigo', 'AirtelTigo Money')], max_length=20)),
+                ('status', models.CharField(choices=[('scheduled', 'Scheduled'), ('processing', 'Processing'), ('paid', 'Paid'), ('failed', 'Failed')], max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('reference', models.CharField(blank=True, max_length=100, null=True)),
+                ('transfer_code', models.CharField(blank=True, max_length=100, null=True)),
+                ('failure_reason', models.CharField(blank=True, max_length=255, null=True)),
+                ('paid_at', models.DateTimeField(blank=True, null=True)),
+                ('created_date', models.DateTimeField()),
+                ('updated_date', models.DateTimeField()),
+                ('registration', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_payouts', to='registrations.registration')),
+                ('winner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payouts', to='registrations.archivedwinner')),
+            ],
+            options={
+                'ordering': ['due_month', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedPayment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('payment_type', models.CharField(choices=[('registration', 'Registration Fee'), ('monthly', 'Monthly Subscription')], max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('success', 'Success'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('reference', models.CharField(max_length=100)),
+                ('paystack_reference', models.CharField(blank=True, max_length=100, null=True)),
+                ('authorization_url', models.URLField(blank=True, null=True)),
+                ('access_code', models.CharField(blank=True, max_length=100, null=True)),
+                ('email', models.EmailField(max_length=254)),
+                ('phone_number', models.CharField(blank=True, max_length=20, null=True)),
+                ('payment_method', models.CharField(blank=True, max_length=50, null=True)),
+                ('paid_at', models.DateTimeField(blank=True, null=True)),
+                ('month_paid_for', models.DateField(blank=True, null=True)),
+                ('created_date', models.DateTimeField()),
+                ('updated_date', models.DateTimeField()),
+                ('registration', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_payments', to='registrations.registration')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_date'],
+                'indexes': [models.Index(fields=['registration', 'created_date'], name='registratio_registr_e832bf_idx')],
+            },
+        ),
+    ]
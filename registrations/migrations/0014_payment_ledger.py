@@ -0,0 +1,96 @@
+# Generated by Django 6.1.2 on 2026-10-19 06:50
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+
+def open_ledger(apps, schema_editor):
+    """Copy payment providers from the registrations and open the ledger with every payment's current status"""
+    Registration = apps.get_model('registrations', 'Registration')
+    PaymentEvent = apps.get_model('registrations', 'PaymentEvent')
+    MonthlyRevenue = apps.get_model('registrations', 'MonthlyRevenue')
+    provider = Registration.objects.filter(pk=OuterRef('registration_id')).values('mobile_money_provider')[:1]
+
+    totals = {}
+    for name in ('Payment', 'ArchivedPayment'):
+        model = apps.get_model('registrations', name)
+        model.objects.update(mobile_money_provider=Subquery(provider))
+        rows = model.objects.order_by('id').values_list(
+            'id', 'reference', 'month_paid_for', 'created_date', 'mobile_money_provider', 'amount', 'status',
+        )
+        events = []
+        for pk, reference, month, created_date, mobile_money_provider, amount, status in rows.iterator(chunk_size=2000):
+            month = month or timezone.localdate(created_date).replace(day=1)
+            events.append(PaymentEvent(
+                payment_id=pk, reference=reference, month=month, mobile_money_provider=mobile_money_provider,
+                amount=amount, from_status='', to_status=status,
+            ))
+            count, pesewas = totals.get((month, mobile_money_provider, status), (0, 0))
+            totals[month, mobile_money_provider, status] = (count + 1, pesewas + int(Decimal(amount) * 100))
+            if len(events) == 2000:
+                PaymentEvent.objects.bulk_create(events)
+                events = []
+        PaymentEvent.objects.bulk_create(events)
+
+    MonthlyRevenue.objects.bulk_create([
+        MonthlyRevenue(month=month, mobile_money_provider=mobile_money_provider, status=status,
+                       payments=count, amount_pesewas=pesewas)
+        for (month, mobile_money_provider, status), (count, pesewas) in totals.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registrations', '0013_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_id', models.BigIntegerField(db_index=True)),
+                ('reference', models.CharField(max_length=100)),
+                ('month', models.DateField()),
+                ('mobile_money_provider', models.CharField(blank=True, choices=[('mtn', 'MTN Mobile Money'), ('vodafone', 'Vodafone Cash'), ('airteltigo', 'AirtelTigo Money')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('from_status', models.CharField(blank=True, choices=[('pending', 'Pending'), ('success', 'Success'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('to_status', models.CharField(blank=True, choices=[('pending', 'Pending'), ('success', 'Success'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='archivedpayment',
+            name='mobile_money_provider',
+            field=models.CharField(blank=True, choices=[('mtn', 'MTN Mobile Money'), ('vodafone', 'Vodafone Cash'), ('airteltigo', 'AirtelTigo Money')], default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='mobile_money_provider',
+            field=models.CharField(blank=True, choices=[('mtn', 'MTN Mobile Money'), ('vodafone', 'Vodafone Cash'), ('airteltigo', 'AirtelTigo Money')], default='', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='MonthlyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('mobile_money_provider', models.CharField(blank=True, choices=[('mtn', 'MTN Mobile Money'), ('vodafone', 'Vodafone Cash'), ('airteltigo', 'AirtelTigo Money')], max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('success', 'Success'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('payments', models.IntegerField(default=0)),
+                ('amount_pesewas', models.BigIntegerField(default=0)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-month', 'mobile_money_provider', 'status'],
+                'unique_together': {('month', 'mobile_money_provider', 'status')},
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 6.1.2 on 2026-10-19 07:25
+
+from django.db import migrations, models
+
+# SQLite FTS5 index over the listings' text, kept in sync by triggers so
+# bulk inserts and queryset updates are indexed too. Django rebuilds a
+# table to alter it on SQLite, which drops its triggers: a later migration
+# that alters JobListing must run CREATE_TRIGGERS again.
+CREATE_INDEX = [
+    """
+    CREATE VIRTUAL TABLE registrations_joblisting_fts USING fts5(
+        title, description, requirements,
+        content='registrations_joblisting', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    "INSERT INTO registrations_joblisting_fts(registrations_joblisting_fts) VALUES ('rebuild')",
+]
+
+CREATE_TRIGGERS = [
+    """
+    CREATE TRIGGER registrations_joblisting_fts_insert AFTER INSERT ON registrations_joblisting BEGIN
+        INSERT INTO registrations_joblisting_fts(rowid, title, description, requirements)
+        VALUES (new.id, new.title, new.description, new.requirements);
+    END
+    """,
+    """
+    CREATE TRIGGER registrations_joblisting_fts_delete AFTER DELETE ON registrations_joblisting BEGIN
+        INSERT INTO registrations_joblisting_fts(registrations_joblisting_fts, rowid, title, description, requirements)
+        VALUES ('delete', old.id, old.title, old.description, old.requirements);
+    END
+    """,
+    """
+    CREATE TRIGGER registrations_joblisting_fts_update AFTER UPDATE OF title, description, requirements
+    ON registrations_joblisting BEGIN
+        INSERT INTO registrations_joblisting_fts(registrations_joblisting_fts, rowid, title, description, requirements)
+        VALUES ('delete', old.id, old.title, old.description, old.requirements);
+        INSERT INTO registrations_joblisting_fts(rowid, title, description, requirements)
+        VALUES (new.id, new.title, new.description, new.requirements);
+    END
+    """,
+]
+
+DROP_INDEX = [
+    'DROP TRIGGER IF EXISTS registrations_joblisting_fts_insert',
+    'DROP TRIGGER IF EXISTS registrations_joblisting_fts_delete',
+    'DROP TRIGGER IF EXISTS registrations_joblisting_fts_update',
+    'DROP TABLE IF EXISTS registrations_joblisting_fts',
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        # Other databases search with icontains instead (registrations.search)
+        if schema_editor.connection.vendor == 'sqlite':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return operation
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registrations', '0014_payment_ledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='joblisting',
+            index=models.Index(fields=['is_active', '-created_date'], name='registratio_is_acti_47a2c5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='joblisting',
+            index=models.Index(fields=['is_active', 'job_type'], name='registratio_is_acti_06803e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='joblisting',
+            index=models.Index(fields=['is_active', 'salary_range'], name='registratio_is_acti_2c850f_idx'),
+        ),
+        migrations.RunPython(run(CREATE_INDEX + CREATE_TRIGGERS), run(DROP_INDEX)),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.1.2 on 2026-10-19 08:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registrations', '0015_job_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registration',
+            name='transfer_recipient_error',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import FileExtensionValidator
 from django.core.exceptions import ValidationError
+from decimal import Decimal
 import os
 
 def validate_cv_file(value):
@@ -62,9 +63,19 @@ class Registration(models.Model):
     
     # System Fields
     language = models.CharField(max_length=2, choices=LANGUAGE_CHOICES, default='en')
+
+    # Paystack transfer recipient for basic income payouts
+    transfer_recipient_code = models.CharField(max_length=100, blank=True, null=True)
+    # Why Paystack refused to create the recipient; payouts skip the registration until it is cleared
+    transfer_recipient_error = models.CharField(max_length=255, blank=True, null=True)
     registration_date = models.DateTimeField(auto_now_add=True)
+    updated_date = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     terms_accepted = models.BooleanField(default=False)
+
+    # Normalized blocking keys for duplicate detection (registrations.duplicates)
+    phone_key = models.CharField(max_length=20, blank=True, db_index=True, editable=False)
+    name_key = models.CharField(max_length=16, blank=True, db_index=True, editable=False)
     
     class Meta:
         ordering = ['-registration_date']
@@ -91,6 +102,31 @@ class Registration(models.Model):
     def get_absolute_url(self):
         return f"/registration/{self.id}/"
 
+class DuplicateCluster(models.Model):
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('confirmed', 'Confirmed duplicates'),
+        ('dismissed', 'Not duplicates'),
+    ]
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open', db_index=True)
+    created_date = models.DateTimeField(auto_now_add=True)
+    updated_date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-updated_date']
+
+    def __str__(self):
+        return f"Duplicate cluster #{self.pk}"
+
+class DuplicateMember(models.Model):
+    # Kept out of Registration so saving a stale registration never unflags it
+    cluster = models.ForeignKey(DuplicateCluster, on_delete=models.CASCADE, related_name='members')
+    registration = models.OneToOneField(Registration, on_delete=models.CASCADE, related_name='duplicate_membership')
+
+    def __str__(self):
+        return f"{self.registration} in {self.cluster}"
+
 class JobListing(models.Model):
     JOB_TYPE_CHOICES = [
         ('full_time', 'Full Time'),
@@ -109,6 +145,12 @@ class JobListing(models.Model):
     
     class Meta:
         ordering = ['-created_date']
+        # Title, description and requirements are also full-text indexed (registrations.search)
+        indexes = [
+            models.Index(fields=['is_active', '-created_date']),
+            models.Index(fields=['is_active', 'job_type']),
+            models.Index(fields=['is_active', 'salary_range']),
+        ]
     
     def __str__(self):
         return self.title
@@ -127,6 +169,18 @@ class MonthlyDraw(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     winners_selected = models.BooleanField(default=False)
     created_date = models.DateTimeField(auto_now_add=True)
+
+    # Eligible-set snapshot and seed the winners are derived from (registrations.draws)
+    snapshot_file = models.CharField(max_length=255, blank=True)
+    snapshot_sha256 = models.CharField(max_length=64, blank=True)
+    snapshot_size = models.PositiveIntegerField(null=True, blank=True)
+    draw_seed = models.CharField(max_length=64, blank=True)
+    draw_strategy = models.CharField(max_length=20, blank=True)
+    # Merkle root over the snapshot, for participants' inclusion proofs
+    merkle_root = models.CharField(max_length=64, blank=True)
+    # Recent winners barred from this draw, and the cooldown that barred them
+    excluded_registrations = models.JSONField(default=list, blank=True)
+    winner_cooldown_months = models.PositiveSmallIntegerField(null=True, blank=True)
     
     class Meta:
         ordering = ['-draw_month']
@@ -191,6 +245,8 @@ class Payment(models.Model):
 
     # Metadata
     month_paid_for = models.DateField(null=True, blank=True)
+    # Copied from the registration; revenue is reported per provider (registrations.ledger)
+    mobile_money_provider = models.CharField(max_length=20, choices=Registration.MOBILE_MONEY_CHOICES, blank=True, default='')
     created_date = models.DateTimeField(auto_now_add=True)
     updated_date = models.DateTimeField(auto_now=True)
 
@@ -201,6 +257,14 @@ class Payment(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['registration', 'month_paid_for']),
         ]
+        constraints = [
+            # At most one open checkout per registration and month
+            models.UniqueConstraint(
+                fields=['registration', 'month_paid_for'],
+                condition=models.Q(status='pending'),
+                name='unique_pending_payment_per_month',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.registration.full_name} - GHS {self.amount} - {self.status}"
@@ -208,3 +272,250 @@ class Payment(models.Model):
     @property
     def is_successful(self):
         return self.status == 'success'
+
+
+class PaymentAuthorization(models.Model):
+    """Reusable Paystack authorization saved from a successful charge"""
+    registration = models.OneToOneField(Registration, on_delete=models.CASCADE, related_name='payment_authorization')
+    authorization_code = models.CharField(max_length=100)
+    email = models.EmailField()
+    channel = models.CharField(max_length=50, blank=True, null=True)
+    last4 = models.CharField(max_length=4, blank=True, null=True)
+    is_active = models.BooleanField(default=True)
+    created_date = models.DateTimeField(auto_now_add=True)
+    updated_date = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.registration.full_name} - {self.channel or 'authorization'}"
+
+
+class BillingRun(models.Model):
+    """Progress of the recurring billing run for one month"""
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+    ]
+
+    month = models.DateField(unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+
+    # Checkpoint: subscribers are processed in registration id order
+    last_registration_id = models.IntegerField(default=0)
+
+    charged = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_date = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-month']
+
+    def __str__(self):
+        return f"Billing run for {self.month.strftime('%B %Y')} ({self.status})"
+
+
+class Payout(models.Model):
+    """One monthly basic income installment owed to a winner"""
+    STATUS_CHOICES = [
+        ('scheduled', 'Scheduled'),
+        ('processing', 'Processing'),
+        ('paid', 'Paid'),
+        ('failed', 'Failed'),
+    ]
+
+    winner = models.ForeignKey(Winner, on_delete=models.CASCADE, related_name='payouts')
+    registration = models.ForeignKey(Registration, on_delete=models.CASCADE, related_name='payouts')
+    installment = models.PositiveSmallIntegerField()
+    due_month = models.DateField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # Copied from the registration; transfers are batched per provider
+    mobile_money_provider = models.CharField(max_length=20, choices=Registration.MOBILE_MONEY_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='scheduled')
+
+    # Paystack transfer fields; the reference changes with every attempt
+    attempts = models.PositiveSmallIntegerField(default=0)
+    reference = models.CharField(max_length=100, unique=True, blank=True, null=True)
+    transfer_code = models.CharField(max_length=100, blank=True, null=True)
+    failure_reason = models.CharField(max_length=255, blank=True, null=True)
+
+    paid_at = models.DateTimeField(null=True, blank=True)
+    created_date = models.DateTimeField(auto_now_add=True)
+    updated_date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['due_month', 'id']
+        unique_together = ['winner', 'installment']
+        indexes = [
+            models.Index(fields=['status', 'mobile_money_provider', 'due_month']),
+        ]
+
+    def __str__(self):
+        return f"{self.registration.full_name} - GHS {self.amount} ({self.due_month.strftime('%B %Y')})"
+
+
+# Cold copies of old rows, moved by `manage.py archive_data` (registrations.archive).
+# Columns match the hot tables and rows keep their ids; timestamps are copied as-is.
+
+class ArchivedPayment(models.Model):
+    """A settled payment for a month more than ARCHIVE_AFTER_MONTHS ago"""
+    id = models.BigIntegerField(primary_key=True)
+    registration = models.ForeignKey(Registration, on_delete=models.CASCADE, related_name='archived_payments')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    payment_type = models.CharField(max_length=20, choices=Payment.PAYMENT_TYPE_CHOICES)
+    status = models.CharField(max_length=20, choices=Payment.PAYMENT_STATUS_CHOICES)
+    reference = models.CharField(max_length=100)
+    paystack_reference = models.CharField(max_length=100, blank=True, null=True)
+    authorization_url = models.URLField(blank=True, null=True)
+    access_code = models.CharField(max_length=100, blank=True, null=True)
+    email = models.EmailField()
+    phone_number = models.CharField(max_length=20, blank=True, null=True)
+    payment_method = models.CharField(max_length=50, blank=True, null=True)
+    paid_at = models.DateTimeField(null=True, blank=True)
+    month_paid_for = models.DateField(null=True, blank=True)
+    mobile_money_provider = models.CharField(max_length=20, choices=Registration.MOBILE_MONEY_CHOICES, blank=True, default='')
+    created_date = models.DateTimeField()
+    updated_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-created_date']
+        indexes = [
+            models.Index(fields=['registration', 'created_date']),
+        ]
+
+    def __str__(self):
+        return f"{self.reference} - GHS {self.amount} - {self.status}"
+
+
+class ArchivedWinner(models.Model):
+    """A winner of a draw more than ARCHIVE_AFTER_MONTHS ago whose payouts are all settled"""
+    id = models.BigIntegerField(primary_key=True)
+    registration = models.ForeignKey(Registration, on_delete=models.CASCADE, related_name='archived_wins')
+    monthly_draw = models.ForeignKey(MonthlyDraw, on_delete=models.CASCADE, related_name='archived_winners')
+    prize_type = models.CharField(max_length=20, choices=Winner.PRIZE_TYPE_CHOICES)
+    prize_details = models.TextField()
+    is_claimed = models.BooleanField(default=False)
+    claim_date = models.DateTimeField(null=True, blank=True)
+    created_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['registration', 'monthly_draw']
+
+    def __str__(self):
+        return f"{self.registration.full_name} - {self.prize_type}"
+
+
+class ArchivedPayout(models.Model):
+    """A basic income installment of an archived winner"""
+    id = models.BigIntegerField(primary_key=True)
+    winner = models.ForeignKey(ArchivedWinner, on_delete=models.CASCADE, related_name='payouts')
+    registration = models.ForeignKey(Registration, on_delete=models.CASCADE, related_name='archived_payouts')
+    installment = models.PositiveSmallIntegerField()
+    due_month = models.DateField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    mobile_money_provider = models.CharField(max_length=20, choices=Registration.MOBILE_MONEY_CHOICES)
+    status = models.CharField(max_length=20, choices=Payout.STATUS_CHOICES)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    reference = models.CharField(max_length=100, blank=True, null=True)
+    transfer_code = models.CharField(max_length=100, blank=True, null=True)
+    failure_reason = models.CharField(max_length=255, blank=True, null=True)
+    paid_at = models.DateTimeField(null=True, blank=True)
+    created_date = models.DateTimeField()
+    updated_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ['due_month', 'id']
+
+    def __str__(self):
+        return f"{self.registration.full_name} - GHS {self.amount} ({self.due_month.strftime('%B %Y')})"
+
+
+class PaymentEvent(models.Model):
+    """
+    One change of a payment's status, in the append-only payment ledger.
+
+    Rows are only ever inserted (registrations.ledger). The payment is
+    referenced by id only, so events outlive archived and deleted payments.
+    An empty status means the payment did not exist before, or no longer does.
+    """
+    payment_id = models.BigIntegerField(db_index=True)
+    reference = models.CharField(max_length=100)
+    # The month the payment counts towards and the payer's provider, fixed at creation
+    month = models.DateField()
+    mobile_money_provider = models.CharField(max_length=20, choices=Registration.MOBILE_MONEY_CHOICES, blank=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    from_status = models.CharField(max_length=20, choices=Payment.PAYMENT_STATUS_CHOICES, blank=True)
+    to_status = models.CharField(max_length=20, choices=Payment.PAYMENT_STATUS_CHOICES, blank=True)
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.reference}: {self.from_status or '-'} -> {self.to_status or '-'}"
+
+
+class MonthlyRevenue(models.Model):
+    """Payments and their total per month, provider and status, kept in step with the ledger"""
+    month = models.DateField()
+    mobile_money_provider = models.CharField(max_length=20, choices=Registration.MOBILE_MONEY_CHOICES, blank=True)
+    status = models.CharField(max_length=20, choices=Payment.PAYMENT_STATUS_CHOICES)
+    payments = models.IntegerField(default=0)
+    # In pesewas, so totals add up exactly
+    amount_pesewas = models.BigIntegerField(default=0)
+    updated_date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-month', 'mobile_money_provider', 'status']
+        unique_together = ['month', 'mobile_money_provider', 'status']
+
+    def __str__(self):
+        return f"{self.month.strftime('%B %Y')} {self.mobile_money_provider or '-'} {self.status}: {self.payments}"
+
+    @property
+    def amount(self):
+        return Decimal(self.amount_pesewas) / 100
+
+
+class QueuedTask(models.Model):
+    """A task enqueued through the database task backend (registrations.task_backend)"""
+    STATUS_CHOICES = [
+        ('READY', 'Ready'),
+        ('RUNNING', 'Running'),
+        ('FAILED', 'Failed'),
+        ('SUCCESSFUL', 'Successful'),
+    ]
+
+    task_path = models.CharField(max_length=255)
+    queue_name = models.CharField(max_length=32, default='default')
+    backend = models.CharField(max_length=32, default='default')
+    priority = models.SmallIntegerField(default=0)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='READY')
+
+    # Not claimed before this time; set to the enqueue time when not delayed
+    available_at = models.DateTimeField()
+    run_after = models.DateTimeField(null=True, blank=True)
+
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=1)
+    worker_ids = models.JSONField(default=list)
+    errors = models.JSONField(default=list)
+    return_value = models.JSONField(null=True, blank=True)
+
+    enqueued_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    last_attempted_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-enqueued_at']
+        indexes = [
+            # Claim order: highest priority first, then oldest available
+            models.Index(fields=['status', 'queue_name', '-priority', 'available_at'], name='queuedtask_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task_path} ({self.status})"
@@ -0,0 +1,156 @@
+"""
+Per-draw odds snapshot for the user dashboard.
+
+The snapshot is assembled from three cached pieces so that none of them has
+to be recomputed with an aggregate query on a dashboard load:
+
+* the draw row, refreshed by MonthlyDraw's post_save signal,
+* the number of paid entrants, incremented when a payment succeeds,
+* the number of active job listings, refreshed when a listing changes.
+
+A piece missing from the cache (cold start, eviction, timeout) is rebuilt
+from the database once and cached again.
+"""
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Registration, MonthlyDraw, JobListing, Payment
+
+ACTIVE_JOBS_KEY = 'odds:active_jobs'
+
+
+def _draw_key(draw_month):
+    return f"odds:{draw_month:%Y-%m}:draw"
+
+
+def _entrants_key(draw_month):
+    return f"odds:{draw_month:%Y-%m}:entrants"
+
+
+def current_draw_month():
+    return date.today().replace(day=1)
+
+
+def draw_state(monthly_draw):
+    """The draw fields the dashboard shows, as a plain dict"""
+    return {
+        'id': monthly_draw.id,
+        'draw_month': monthly_draw.draw_month,
+        'status': monthly_draw.status,
+        'minimum_participants': monthly_draw.minimum_participants,
+        'current_participants': monthly_draw.current_participants,
+        'winners_selected': monthly_draw.winners_selected,
+        'is_ready_for_draw': monthly_draw.is_ready_for_draw,
+    }
+
+
+def cache_draw(monthly_draw):
+    state = draw_state(monthly_draw)
+    cache.set(_draw_key(monthly_draw.draw_month), state, settings.ODDS_SNAPSHOT_TIMEOUT)
+    return state
+
+
+def get_or_create_draw(draw_month):
+    try:
+        return MonthlyDraw.objects.get(draw_month=draw_month)
+    except MonthlyDraw.DoesNotExist:
+        return MonthlyDraw.objects.create(
+            draw_month=draw_month,
+            status='active' if Registration.objects.count() >= 5000 else 'pending'
+        )
+
+
+def count_paid_entrants(draw_month):
+    """Registrations with a successful payment for the month"""
+    return Payment.objects.filter(
+        month_paid_for=draw_month,
+        status='success',
+    ).values('registration').distinct().count()
+
+
+def count_active_jobs():
+    count = JobListing.objects.filter(is_active=True).count()
+    cache.set(ACTIVE_JOBS_KEY, count, settings.ODDS_SNAPSHOT_TIMEOUT)
+    return count
+
+
+def record_paid_entrant(draw_month, count=1):
+    """Count newly paid entrants without touching the database"""
+    try:
+        cache.incr(_entrants_key(draw_month), count)
+    except ValueError:
+        # Not cached yet; the next read counts from the database
+        pass
+
+
+def compute_odds(entrants, active_jobs):
+    """
+    Exact per-entrant probabilities for one draw.
+
+    Job winners are drawn first, then income winners from the rest, each
+    uniformly without replacement. For N entrants and J job / I income
+    slots, that gives P(job) = J/N, P(income) = (1 - J/N) * I/(N - J) = I/N
+    and P(any prize) = (J + I)/N.
+    """
+    job_slots = min(settings.DRAW_JOB_WINNERS, active_jobs, entrants)
+    income_slots = max(0, min(settings.DRAW_INCOME_WINNERS, entrants - job_slots))
+    prize_slots = job_slots + income_slots
+
+    if entrants == 0:
+        return {
+            'paid_entrants': 0,
+            'job_slots': job_slots,
+            'income_slots': income_slots,
+            'prize_slots': prize_slots,
+            'job_probability': 0.0,
+            'income_probability': 0.0,
+            'win_probability': 0.0,
+            'one_in': None,
+        }
+
+    return {
+        'paid_entrants': entrants,
+        'job_slots': job_slots,
+        'income_slots': income_slots,
+        'prize_slots': prize_slots,
+        'job_probability': job_slots / entrants,
+        'income_probability': income_slots / entrants,
+        'win_probability': prize_slots / entrants,
+        'one_in': entrants / prize_slots if prize_slots else None,
+    }
+
+
+def get_odds_snapshot(draw_month=None):
+    """Draw state plus odds for the month, served from the cache when warm"""
+    draw_month = draw_month or current_draw_month()
+    draw_key = _draw_key(draw_month)
+    entrants_key = _entrants_key(draw_month)
+
+    cached = cache.get_many([draw_key, entrants_key, ACTIVE_JOBS_KEY])
+
+    draw = cached.get(draw_key)
+    if draw is None:
+        draw = cache_draw(get_or_create_draw(draw_month))
+
+    entrants = cached.get(entrants_key)
+    if entrants is None:
+        entrants = count_paid_entrants(draw_month)
+        # add() so a concurrent record_paid_entrant() increment is not overwritten
+        cache.add(entrants_key, entrants, settings.ODDS_SNAPSHOT_TIMEOUT)
+
+    active_jobs = cached.get(ACTIVE_JOBS_KEY)
+    if active_jobs is None:
+        active_jobs = count_active_jobs()
+
+    snapshot = compute_odds(entrants, active_jobs)
+    snapshot['draw'] = draw
+    return snapshot
+
+
+def format_odds(snapshot):
+    """Human readable "1 in N" chance of winning any prize"""
+    if snapshot['one_in'] is None:
+        return "0"
+    return f"1 in {snapshot['one_in']:,.0f}"
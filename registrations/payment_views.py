@@ -5,14 +5,19 @@ from django.conf import settings
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
-from datetime import date, datetime
+from django.db import IntegrityError, transaction as db_transaction
+from datetime import date, datetime, timedelta
 import uuid
 import hashlib
 import hmac
 import json
 
-from pypaystack2.sub_clients import TransactionClient
-from .models import Payment, Registration, MonthlyDraw
+from . import archive
+from .models import Payment
+from .paystack import get_gateway, PaystackError
+from .payments import cancel_payment, mark_payment_failed, mark_payment_successful, open_payments, save_authorization
+from .tasks import process_paystack_event, verify_payment_later
+from .conditional import conditional_page, payment_history_etag
 
 
 def generate_reference():
@@ -20,14 +25,37 @@ def generate_reference():
     return f"JM-{uuid.uuid4().hex[:12].upper()}"
 
 
+def get_pending_checkout(registration, month):
+    """
+    The registration's reusable pending payment for the month, if any.
+
+    Pending payments older than PAYMENT_CHECKOUT_TTL are cancelled so the
+    unique pending constraint lets a fresh checkout be created.
+    """
+    pending_payment = Payment.objects.filter(
+        registration=registration,
+        month_paid_for=month,
+        status='pending'
+    ).first()
+
+    if pending_payment is None:
+        return None
+
+    expires = pending_payment.created_date + timedelta(seconds=settings.PAYMENT_CHECKOUT_TTL)
+    if expires <= timezone.now():
+        cancel_payment(pending_payment)
+        return None
+
+    return pending_payment
+
+
 @login_required
 def initiate_payment(request):
     """Initialize Paystack payment"""
     language = request.session.get('language', 'en')
 
-    try:
-        registration = Registration.objects.get(user=request.user)
-    except Registration.DoesNotExist:
+    registration = request.registration
+    if not registration:
         messages.error(request, 'Registration record not found. Please complete registration first.')
         return redirect('user_register')
 
@@ -51,26 +79,45 @@ def initiate_payment(request):
                 messages.warning(request, 'Je hebt al betaald voor deze maand!')
             return redirect('user_dashboard')
 
+        # Reuse a still-valid checkout instead of starting a new one
+        pending_payment = get_pending_checkout(registration, current_month)
+        if pending_payment is not None:
+            if pending_payment.authorization_url:
+                return redirect(pending_payment.authorization_url)
+            if language == 'en':
+                messages.info(request, 'Your payment is being prepared. Please try again in a moment.')
+            else:
+                messages.info(request, 'Je betaling wordt voorbereid. Probeer het zo opnieuw.')
+            return redirect('payment_page')
+
         # Create payment record
         reference = generate_reference()
         amount = settings.MONTHLY_SUBSCRIPTION_AMOUNT  # Amount in pesewas
 
-        payment = Payment.objects.create(
-            registration=registration,
-            user=request.user,
-            amount=amount / 100,  # Convert to GHS for storage
-            payment_type=payment_type,
-            reference=reference,
-            email=registration.email,
-            phone_number=registration.phone_number,
-            month_paid_for=current_month
-        )
+        try:
+            with db_transaction.atomic():
+                payment = Payment.objects.create(
+                    registration=registration,
+                    user=request.user,
+                    amount=amount / 100,  # Convert to GHS for storage
+                    payment_type=payment_type,
+                    reference=reference,
+                    email=registration.email,
+                    phone_number=registration.phone_number,
+                    month_paid_for=current_month,
+                    mobile_money_provider=registration.mobile_money_provider,
+                )
+                open_payments([payment])
+        except IntegrityError:
+            # A concurrent request (double click) created the pending payment first
+            pending_payment = get_pending_checkout(registration, current_month)
+            if pending_payment is not None and pending_payment.authorization_url:
+                return redirect(pending_payment.authorization_url)
+            return redirect('payment_page')
 
         try:
             # Initialize Paystack transaction
-            transaction = TransactionClient(secret_key=settings.PAYSTACK_SECRET_KEY)
-
-            response = transaction.initialize(
+            response = get_gateway().initialize_transaction(
                 email=registration.email,
                 amount=amount,  # Amount in pesewas
                 reference=reference,
@@ -93,14 +140,20 @@ def initiate_payment(request):
                 # Redirect to Paystack payment page
                 return redirect(response['data']['authorization_url'])
             else:
-                payment.status = 'failed'
-                payment.save()
+                mark_payment_failed(payment)
                 messages.error(request, 'Failed to initialize payment. Please try again.')
                 return redirect('payment_page')
 
+        except PaystackError:
+            mark_payment_failed(payment)
+            if language == 'en':
+                messages.error(request, 'The payment service is temporarily unavailable. Please try again in a few minutes.')
+            else:
+                messages.error(request, 'De betaaldienst is tijdelijk niet beschikbaar. Probeer het over een paar minuten opnieuw.')
+            return redirect('payment_page')
+
         except Exception as e:
-            payment.status = 'failed'
-            payment.save()
+            mark_payment_failed(payment)
             messages.error(request, f'Payment initialization error: {str(e)}')
             return redirect('payment_page')
 
@@ -131,36 +184,18 @@ def verify_payment(request):
 
         # Verify with Paystack
         try:
-            transaction = TransactionClient(secret_key=settings.PAYSTACK_SECRET_KEY)
-            response = transaction.verify(reference=reference)
+            response = get_gateway().verify_transaction(reference)
 
             if response['status'] and response['data']['status'] == 'success':
                 # Payment successful
-                payment.status = 'success'
-                payment.paid_at = timezone.now()
-                payment.payment_method = response['data']['channel']
-                payment.paystack_reference = response['data']['reference']
-                payment.save()
-
-                # Update monthly draw participant count
-                current_month = payment.month_paid_for
-                monthly_draw, created = MonthlyDraw.objects.get_or_create(
-                    draw_month=current_month,
-                    defaults={
-                        'minimum_participants': 5000,
-                        'current_participants': 0,
-                        'status': 'pending'
-                    }
+                mark_payment_successful(
+                    payment,
+                    channel=response['data']['channel'],
+                    paystack_reference=response['data']['reference'],
                 )
-
-                # Increment participant count
-                monthly_draw.current_participants += 1
-
-                # Check if threshold reached
-                if monthly_draw.current_participants >= monthly_draw.minimum_participants and monthly_draw.status == 'pending':
-                    monthly_draw.status = 'active'
-
-                monthly_draw.save()
+                # Keep the authorization for recurring monthly billing
+                save_authorization(payment.registration_id, response['data'])
+                current_month = payment.month_paid_for
 
                 language = request.session.get('language', 'en')
                 if language == 'en':
@@ -171,14 +206,19 @@ def verify_payment(request):
                 return redirect('user_dashboard')
             else:
                 # Payment failed
-                payment.status = 'failed'
-                payment.save()
+                mark_payment_failed(payment)
                 messages.error(request, 'Payment verification failed. Please contact support.')
                 return redirect('payment_page')
 
+        except PaystackError:
+            # Paystack is unreachable; the charge may still have gone through,
+            # so leave the payment pending and check again in the background
+            verify_payment_later(payment)
+            messages.warning(request, 'We could not confirm your payment yet. It will appear in your payment history once Paystack confirms it.')
+            return redirect('user_dashboard')
+
         except Exception as e:
-            payment.status = 'failed'
-            payment.save()
+            mark_payment_failed(payment)
             messages.error(request, f'Payment verification error: {str(e)}')
             return redirect('payment_page')
 
@@ -205,69 +245,38 @@ def paystack_webhook(request):
         if hash_value != signature:
             return HttpResponse('Invalid signature', status=400)
 
-        # Process webhook
+        # Process webhook in the background so Paystack gets its answer immediately
         try:
-            data = json.loads(request.body)
-            event = data.get('event')
-
-            if event == 'charge.success':
-                reference = data['data']['reference']
-
-                try:
-                    payment = Payment.objects.get(reference=reference)
-
-                    if payment.status != 'success':
-                        payment.status = 'success'
-                        payment.paid_at = timezone.now()
-                        payment.payment_method = data['data']['channel']
-                        payment.save()
-
-                        # Update monthly draw
-                        current_month = payment.month_paid_for
-                        monthly_draw, created = MonthlyDraw.objects.get_or_create(
-                            draw_month=current_month,
-                            defaults={
-                                'minimum_participants': 5000,
-                                'current_participants': 0,
-                                'status': 'pending'
-                            }
-                        )
-
-                        monthly_draw.current_participants += 1
-
-                        if monthly_draw.current_participants >= monthly_draw.minimum_participants and monthly_draw.status == 'pending':
-                            monthly_draw.status = 'active'
+            payload = json.loads(request.body)
+        except ValueError:
+            return HttpResponse('Invalid payload', status=400)
 
-                        monthly_draw.save()
-
-                except Payment.DoesNotExist:
-                    pass
-
-            return HttpResponse('Webhook processed', status=200)
-
-        except Exception as e:
-            return HttpResponse(f'Error: {str(e)}', status=500)
+        process_paystack_event.enqueue(payload)
+        return HttpResponse('Webhook processed', status=200)
 
     return HttpResponse('Invalid request method', status=405)
 
 
 @login_required
+@conditional_page(etag_func=payment_history_etag)
 def payment_history(request):
     """View user's payment history"""
     language = request.session.get('language', 'en')
 
-    try:
-        registration = Registration.objects.get(user=request.user)
-        payments = Payment.objects.filter(registration=registration).order_by('-created_date')
+    registration = request.registration
+    if not registration:
+        messages.error(request, 'Registration record not found.')
+        return redirect('user_dashboard')
 
-        context = {
-            'registration': registration,
-            'payments': payments,
-            'language': language,
-        }
+    # Payments for months past ARCHIVE_AFTER_MONTHS are in the archive
+    show_archived = request.GET.get('archived') == '1'
+    payments = archive.payment_history(registration, archived=show_archived)
 
-        return render(request, 'registrations/payment_history.html', context)
+    context = {
+        'registration': registration,
+        'payments': payments,
+        'show_archived': show_archived,
+        'language': language,
+    }
 
-    except Registration.DoesNotExist:
-        messages.error(request, 'Registration record not found.')
-        return redirect('user_dashboard')
+    return render(request, 'registrations/payment_history.html', context)
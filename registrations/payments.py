@@ -0,0 +1,161 @@
+from django.db import transaction
+from django.utils import timezone
+
+from . import ledger, odds
+from .models import Payment, MonthlyDraw, PaymentAuthorization
+
+
+def _enter_draw(draw_month, count=1):
+    """Count paid entrants into the month's draw; call inside a transaction"""
+    # Update monthly draw participant count
+    monthly_draw, created = MonthlyDraw.objects.get_or_create(
+        draw_month=draw_month,
+        defaults={
+            'minimum_participants': 5000,
+            'current_participants': 0,
+            'status': 'pending'
+        }
+    )
+    monthly_draw = MonthlyDraw.objects.select_for_update().get(pk=monthly_draw.pk)
+    monthly_draw.current_participants += count
+
+    # Check if threshold reached
+    if monthly_draw.current_participants >= monthly_draw.minimum_participants and monthly_draw.status == 'pending':
+        monthly_draw.status = 'active'
+
+    monthly_draw.save()
+
+    transaction.on_commit(lambda: odds.record_paid_entrant(draw_month, count))
+
+
+def open_payments(payments):
+    """Record newly created pending payments in the ledger; call in the transaction that created them"""
+    ledger.record([ledger.event(payment, '', payment.status) for payment in payments])
+
+
+def mark_payment_successful(payment, channel=None, paystack_reference=None):
+    """
+    Record a successful charge and enter the payer into the month's draw.
+
+    Safe to call from both the verify callback and the webhook: the status
+    is read and changed under the write lock, so the entrant is counted once.
+    Returns True when this call made the transition.
+    """
+    now = timezone.now()
+    fields = {
+        'status': 'success',
+        'paid_at': now,
+        'payment_method': channel,
+        'updated_date': now,
+    }
+    if paystack_reference:
+        fields['paystack_reference'] = paystack_reference
+
+    with transaction.atomic():
+        previous = Payment.objects.select_for_update().filter(pk=payment.pk).exclude(
+            status='success',
+        ).values_list('status', flat=True).first()
+        if previous is None:
+            return False
+        Payment.objects.filter(pk=payment.pk).update(**fields)
+
+        for name, value in fields.items():
+            setattr(payment, name, value)
+
+        ledger.record([ledger.event(payment, previous, 'success')])
+        _enter_draw(payment.month_paid_for)
+
+    return True
+
+
+def mark_payment_failed(payment):
+    """Fail a pending payment; returns True when this call made the transition"""
+    now = timezone.now()
+    with transaction.atomic():
+        if not Payment.objects.filter(pk=payment.pk, status='pending').update(status='failed', updated_date=now):
+            return False
+        payment.status = 'failed'
+        payment.updated_date = now
+        ledger.record([ledger.event(payment, 'pending', 'failed')])
+    return True
+
+
+def cancel_payment(payment):
+    """Cancel an expired pending checkout; returns True when this call made the transition"""
+    now = timezone.now()
+    with transaction.atomic():
+        if not Payment.objects.filter(pk=payment.pk, status='pending').update(status='cancelled', updated_date=now):
+            return False
+        payment.status = 'cancelled'
+        payment.updated_date = now
+        ledger.record([ledger.event(payment, 'pending', 'cancelled')])
+    return True
+
+
+def discard_pending_payments(payment_ids):
+    """Delete pending payments that were never charged; returns the number deleted"""
+    with transaction.atomic():
+        payments = list(Payment.objects.select_for_update().filter(pk__in=payment_ids, status='pending'))
+        Payment.objects.filter(pk__in=[payment.pk for payment in payments]).delete()
+        ledger.record([ledger.event(payment, 'pending', '') for payment in payments])
+    return len(payments)
+
+
+def settle_payments(draw_month, outcomes):
+    """
+    Apply a batch of charge results for one month in a single transaction.
+
+    ``outcomes`` maps payment id to ``(status, channel, paystack_reference)``.
+    Rows that are already successful are left alone, so a batch can be
+    replayed. Returns the number of payments that became successful.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        payments = list(
+            Payment.objects.select_for_update()
+            .filter(pk__in=outcomes)
+            .exclude(status='success')
+            .only('id', 'reference', 'month_paid_for', 'mobile_money_provider', 'amount', 'status', 'created_date')
+        )
+        succeeded = 0
+        events = []
+        for payment in payments:
+            status, channel, paystack_reference = outcomes[payment.pk]
+            events.append(ledger.event(payment, payment.status, status))
+            payment.status = status
+            payment.payment_method = channel
+            payment.paystack_reference = paystack_reference
+            payment.updated_date = now
+            payment.paid_at = now if status == 'success' else None
+            if status == 'success':
+                succeeded += 1
+
+        Payment.objects.bulk_update(
+            payments,
+            ['status', 'payment_method', 'paystack_reference', 'paid_at', 'updated_date'],
+        )
+        ledger.record(events)
+        if succeeded:
+            _enter_draw(draw_month, succeeded)
+
+    return succeeded
+
+
+def save_authorization(registration_id, data):
+    """Keep the reusable authorization from a successful Paystack charge"""
+    authorization = data.get('authorization') or {}
+    if not authorization.get('reusable') or not authorization.get('authorization_code'):
+        return None
+
+    customer = data.get('customer') or {}
+    saved, created = PaymentAuthorization.objects.update_or_create(
+        registration_id=registration_id,
+        defaults={
+            'authorization_code': authorization['authorization_code'],
+            'email': customer.get('email') or authorization.get('email') or '',
+            'channel': authorization.get('channel'),
+            'last4': authorization.get('last4'),
+            'is_active': True,
+        }
+    )
+    return saved
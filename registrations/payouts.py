@@ -0,0 +1,346 @@
+"""
+Basic income payout ledger and scheduler.
+
+Every basic income winner gets one Payout row per month of the prize. The
+scheduler pays all due installments with Paystack bulk transfers, one
+request per mobile money provider and PAYOUT_BATCH_SIZE payouts:
+
+    scheduled  -> processing   claimed right before the transfer request
+    processing -> paid/failed  from the bulk response or the transfer webhook
+
+Each transition is a conditional UPDATE on the expected current status, so
+replaying a response, a webhook or a whole run never applies it twice. The
+first paid installment marks the prize as claimed.
+"""
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import CharField, Count, F, Value
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
+
+from .backends import user_cache_key
+from .models import Payout, Registration, Winner
+from .paystack import get_gateway, PaystackError, PaystackUnavailable
+
+# Paystack bank codes for Ghana mobile money wallets
+PROVIDER_BANK_CODES = {
+    'mtn': 'MTN',
+    'vodafone': 'VOD',
+    'airteltigo': 'ATL',
+}
+
+# Paystack transfer status -> payout status; anything else is still in flight
+TRANSFER_STATUSES = {
+    'success': 'paid',
+    'failed': 'failed',
+    'reversed': 'failed',
+}
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def generate_payouts(winners=None, chunk_size=500):
+    """
+    Create the missing installments of basic income winners.
+
+    Winners are read in id order, ``chunk_size`` at a time, and each chunk's
+    installments are inserted with one bulk_create. Returns the number of
+    winners whose installments were created.
+    """
+    months = settings.BASIC_INCOME_MONTHS
+    amount = settings.BASIC_INCOME_MONTHLY_AMOUNT
+    winners = winners if winners is not None else Winner.objects.all()
+    pending = winners.filter(prize_type='basic_income').annotate(
+        payout_count=Count('payouts'),
+    ).filter(payout_count__lt=months).order_by('id').values_list(
+        'id', 'registration_id', 'registration__mobile_money_provider', 'monthly_draw__draw_month',
+    )
+
+    generated = 0
+    last_id = 0
+    while True:
+        chunk = list(pending.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return generated
+        last_id = chunk[-1][0]
+
+        Payout.objects.bulk_create([
+            Payout(
+                winner_id=winner_id,
+                registration_id=registration_id,
+                installment=installment,
+                # Draws close at month end, so the first installment is due the month after
+                due_month=add_months(draw_month, installment),
+                amount=amount,
+                mobile_money_provider=provider,
+            )
+            for winner_id, registration_id, provider, draw_month in chunk
+            for installment in range(1, months + 1)
+        ], batch_size=1000, ignore_conflicts=True)
+        generated += len(chunk)
+
+
+def due_payouts(month):
+    return Payout.objects.filter(status='scheduled', due_month__lte=month)
+
+
+def _invalidate_cached_users(registration_ids):
+    user_ids = Registration.objects.filter(pk__in=registration_ids).values_list('user_id', flat=True)
+    cache.delete_many([user_cache_key(user_id) for user_id in user_ids if user_id is not None])
+
+
+def ensure_recipients(month, gateway=None, batch_size=None):
+    """
+    Create Paystack transfer recipients, in bulk, for payees that have none yet.
+
+    A payee Paystack refuses gets the reason in transfer_recipient_error and
+    is skipped from then on, so one bad wallet number cannot hold up the
+    others. Returns the number of recipients created.
+    """
+    gateway = gateway or get_gateway()
+    batch_size = batch_size or settings.PAYOUT_BATCH_SIZE
+    created = 0
+
+    while True:
+        payees = list(
+            Registration.objects.filter(
+                transfer_recipient_code__isnull=True,
+                transfer_recipient_error__isnull=True,
+                pk__in=due_payouts(month).values('registration_id'),
+            ).order_by('pk').values(
+                'id', 'first_name', 'last_name', 'phone_number', 'mobile_money_provider',
+            )[:batch_size]
+        )
+        if not payees:
+            return created
+
+        response = gateway.create_transfer_recipients([
+            {
+                'type': 'mobile_money',
+                'name': f"{payee['first_name']} {payee['last_name']}",
+                'account_number': payee['phone_number'],
+                'bank_code': PROVIDER_BANK_CODES[payee['mobile_money_provider']],
+                'currency': 'GHS',
+            }
+            for payee in payees
+        ])
+        if not response.get('status'):
+            raise PaystackError(response.get('message') or 'No transfer recipients were created')
+
+        data = response.get('data') or {}
+        codes = {
+            (recipient['details']['account_number'], recipient['details']['bank_code']): recipient['recipient_code']
+            for recipient in data.get('success', [])
+        }
+        errors = {
+            (error['record'].get('account_number'), error['record'].get('bank_code')): error.get('error')
+            for error in data.get('errors', []) if error.get('record')
+        }
+
+        registrations = []
+        for payee in payees:
+            key = (payee['phone_number'], PROVIDER_BANK_CODES[payee['mobile_money_provider']])
+            if key in codes:
+                registrations.append(Registration(
+                    pk=payee['id'], transfer_recipient_code=codes[key], transfer_recipient_error=None,
+                ))
+            else:
+                # Recorded so the next batch moves on to other payees
+                error = errors.get(key) or 'Paystack did not create the transfer recipient'
+                registrations.append(Registration(
+                    pk=payee['id'], transfer_recipient_code=None, transfer_recipient_error=error[:255],
+                ))
+
+        Registration.objects.bulk_update(registrations, ['transfer_recipient_code', 'transfer_recipient_error'])
+        # Cached registrations would otherwise write the old value back on save()
+        _invalidate_cached_users([registration.pk for registration in registrations])
+        created += sum(1 for registration in registrations if registration.transfer_recipient_code)
+
+
+def apply_transfer_results(results):
+    """
+    Apply final transfer statuses, given as ``{reference: (paystack_status, reason)}``.
+
+    Returns the number of payouts that changed state.
+    """
+    now = timezone.now()
+    paid = [reference for reference, (status, _) in results.items() if TRANSFER_STATUSES.get(status) == 'paid']
+    failed = {reference: reason for reference, (status, reason) in results.items() if TRANSFER_STATUSES.get(status) == 'failed'}
+    changed = 0
+
+    with transaction.atomic():
+        if paid:
+            changed += Payout.objects.filter(reference__in=paid, status='processing').update(
+                status='paid', paid_at=now, updated_date=now,
+            )
+        for reference, reason in failed.items():
+            # A reversal can follow a success
+            changed += Payout.objects.filter(reference=reference, status__in=['processing', 'paid']).update(
+                status='failed', failure_reason=(reason or '')[:255], updated_date=now,
+            )
+
+        if paid:
+            # The first installment received claims the prize
+            winners = Winner.objects.filter(is_claimed=False, payouts__reference__in=paid)
+            registration_ids = list(winners.values_list('registration_id', flat=True))
+            if registration_ids:
+                Winner.objects.filter(pk__in=winners.values('pk')).update(is_claimed=True, claim_date=now)
+                Registration.objects.filter(pk__in=registration_ids).update(updated_date=now)
+                transaction.on_commit(lambda: _invalidate_cached_users(registration_ids))
+
+    return changed
+
+
+def _claim(provider, month, batch_size):
+    """Move the next batch of a provider's due payouts to processing"""
+    with transaction.atomic():
+        ids = list(
+            due_payouts(month).select_for_update(skip_locked=True).filter(
+                mobile_money_provider=provider,
+                registration__transfer_recipient_code__isnull=False,
+            ).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+
+        # The claim time tells this run's rows apart from any concurrent claim
+        claimed_at = timezone.now()
+        Payout.objects.filter(pk__in=ids, status='scheduled').update(
+            status='processing',
+            attempts=F('attempts') + 1,
+            reference=Concat(
+                Value('JM-PAY-'), Cast('id', CharField()), Value('-'), Cast(F('attempts') + 1, CharField()),
+                output_field=CharField(),
+            ),
+            transfer_code=None,
+            updated_date=claimed_at,
+        )
+        return list(
+            Payout.objects.filter(pk__in=ids, status='processing', updated_date=claimed_at).values(
+                'pk', 'reference', 'amount', 'due_month', 'registration__transfer_recipient_code',
+            )
+        )
+
+
+def _release(payout_ids):
+    """Hand claimed payouts back when their transfer request was never accepted"""
+    return Payout.objects.filter(pk__in=payout_ids, status='processing', transfer_code__isnull=True).update(
+        status='scheduled', updated_date=timezone.now(),
+    )
+
+
+def submit_transfers(provider, payouts, gateway):
+    """Send one bulk transfer request; returns False if Paystack refused it"""
+    response = gateway.initiate_bulk_transfer([
+        {
+            'amount': int(payout['amount'] * 100),  # Amount in pesewas
+            'recipient': payout['registration__transfer_recipient_code'],
+            'reference': payout['reference'],
+            'reason': f"Jobmarkt basic income - {payout['due_month'].strftime('%B %Y')}",
+        }
+        for payout in payouts
+    ])
+    if not response.get('status'):
+        return False
+
+    transfers = response.get('data') or []
+    ids = {payout['reference']: payout['pk'] for payout in payouts}
+    # One prepared statement for the whole batch; bulk_update's CASE WHEN
+    # costs more to build than to run at this size
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {Payout._meta.db_table} SET transfer_code = %s WHERE id = %s",
+            [
+                (transfer.get('transfer_code'), ids[transfer['reference']])
+                for transfer in transfers if transfer.get('reference') in ids
+            ],
+        )
+    apply_transfer_results({
+        transfer['reference']: (transfer.get('status'), transfer.get('reason'))
+        for transfer in transfers
+        if transfer.get('reference') in ids
+    })
+    return True
+
+
+def recover_processing(gateway):
+    """Settle payouts left claimed without a transfer code by an interrupted run"""
+    stuck = list(
+        Payout.objects.filter(status='processing', transfer_code__isnull=True).values_list('pk', 'reference')
+    )
+    results = {}
+    release = []
+    for pk, reference in stuck:
+        response = gateway.verify_transfer(reference)
+        if not response.get('status'):
+            # Paystack never received this transfer
+            release.append(pk)
+            continue
+        data = response.get('data') or {}
+        Payout.objects.filter(pk=pk, transfer_code__isnull=True).update(transfer_code=data.get('transfer_code'))
+        results[reference] = (data.get('status'), data.get('reason'))
+
+    _release(release)
+    apply_transfer_results(results)
+    return len(stuck)
+
+
+def retry_failed_payouts(month):
+    """Schedule failed payouts due by the month again; they get a new reference"""
+    return Payout.objects.filter(status='failed', due_month__lte=month).update(
+        status='scheduled', failure_reason=None, updated_date=timezone.now(),
+    )
+
+
+def process_payouts(month, gateway=None, batch_size=None, log=None):
+    """Generate, then pay, every payout due by the month; safe to rerun"""
+    gateway = gateway or get_gateway()
+    batch_size = batch_size or settings.PAYOUT_BATCH_SIZE
+    log = log or (lambda message: None)
+    stats = {'generated': 0, 'recipients': 0, 'recovered': 0, 'submitted': 0, 'requests': 0}
+
+    stats['generated'] = generate_payouts()
+    log(f"Generated installments for {stats['generated']} winners")
+
+    try:
+        stats['recovered'] = recover_processing(gateway)
+        try:
+            stats['recipients'] = ensure_recipients(month, gateway, batch_size)
+            log(f"Created {stats['recipients']} transfer recipients")
+        except PaystackError as e:
+            # Payees that already have a recipient are still paid
+            log(f"Could not create transfer recipients: {e}")
+            stats['error'] = str(e)
+
+        for provider in PROVIDER_BANK_CODES:
+            while True:
+                payouts = _claim(provider, month, batch_size)
+                if not payouts:
+                    break
+                try:
+                    accepted = submit_transfers(provider, payouts, gateway)
+                except PaystackUnavailable:
+                    _release([payout['pk'] for payout in payouts])
+                    raise
+                except PaystackError:
+                    # Outcome unknown; the next run verifies these references
+                    log(f"{provider}: no response for {len(payouts)} transfers, will verify on the next run")
+                    continue
+                if not accepted:
+                    _release([payout['pk'] for payout in payouts])
+                    raise PaystackError(f"Paystack refused the {provider} bulk transfer")
+
+                stats['requests'] += 1
+                stats['submitted'] += len(payouts)
+                log(f"{provider}: submitted {len(payouts)} transfers")
+    except PaystackError as e:
+        log(f"Stopping: {e}. Rerun to resume.")
+        stats['error'] = str(e)
+
+    return stats
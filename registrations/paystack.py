@@ -0,0 +1,252 @@
+"""
+Process-wide Paystack API gateway.
+
+Every payment path goes through ``get_gateway()`` so that all calls share
+one pooled HTTP session, the same timeouts and retry policy, and a single
+circuit breaker that fails fast while Paystack is degraded.
+"""
+from collections import defaultdict
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class PaystackError(Exception):
+    """Paystack could not be reached or kept failing"""
+
+
+class PaystackUnavailable(PaystackError):
+    """The circuit breaker is open; the call was not attempted"""
+
+
+class CircuitBreaker:
+    """
+    Trip after ``failure_threshold`` consecutive failures.
+
+    While open every call fails immediately. After ``reset_timeout`` seconds
+    one trial call is let through (half-open): success closes the circuit,
+    failure opens it for another period.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning("Paystack circuit opened after %d consecutive failures", self.failures)
+                self.opened_at = time.monotonic()
+
+
+class LatencyStats:
+    """Per-operation call counts, errors and latency, kept in memory"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {'calls': 0, 'errors': 0, 'total': 0.0, 'max': 0.0})
+
+    def record(self, operation, seconds, ok):
+        with self._lock:
+            stats = self._stats[operation]
+            stats['calls'] += 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            if not ok:
+                stats['errors'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                operation: dict(stats, mean=stats['total'] / stats['calls'] if stats['calls'] else 0.0)
+                for operation, stats in self._stats.items()
+            }
+
+
+class PaystackGateway:
+    """Thin client over the Paystack REST API"""
+
+    def __init__(self, secret_key, base_url, connect_timeout, read_timeout,
+                 max_retries, backoff, pool_size, breaker):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker
+        self.stats = LatencyStats()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Authorization': f'Bearer {secret_key}',
+            'Content-Type': 'application/json',
+        })
+
+    def _sleep_before_retry(self, attempt):
+        # Exponential backoff with full jitter
+        time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def request(self, method, path, operation, idempotent, **kwargs):
+        """
+        Make one API call and return the decoded JSON body.
+
+        Idempotent calls are retried on timeouts, connection errors, 429 and
+        5xx responses. Other calls are only retried when the connection was
+        never established, so a charge can't be submitted twice. 4xx
+        responses are returned to the caller; they are not gateway failures.
+        """
+        if not self.breaker.allow():
+            raise PaystackUnavailable('Paystack is temporarily unavailable')
+
+        url = f"{self.base_url}{path}"
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except requests.ConnectTimeout as e:
+                retryable, last_error = True, e
+            except (requests.ConnectionError, requests.Timeout) as e:
+                retryable, last_error = idempotent, e
+            except requests.RequestException as e:
+                # Redirect loops, broken bodies and the like; a half-open
+                # trial must still be settled
+                retryable, last_error = False, e
+            else:
+                if response.status_code == 429 or response.status_code >= 500:
+                    retryable = idempotent
+                    last_error = PaystackError(f'{operation} returned HTTP {response.status_code}')
+                else:
+                    self.stats.record(operation, time.perf_counter() - start, ok=True)
+                    self.breaker.record_success()
+                    try:
+                        return response.json()
+                    except ValueError:
+                        return {'status': False, 'message': f'Invalid response (HTTP {response.status_code})'}
+
+            elapsed = time.perf_counter() - start
+            self.stats.record(operation, elapsed, ok=False)
+            logger.warning("Paystack %s attempt %d failed after %.3fs: %s", operation, attempt + 1, elapsed, last_error)
+
+            if not retryable or attempt == self.max_retries:
+                break
+            self._sleep_before_retry(attempt)
+
+        self.breaker.record_failure()
+        raise PaystackError(str(last_error)) from last_error
+
+    # API operations
+
+    def initialize_transaction(self, email, amount, reference, callback_url, metadata=None):
+        return self.request('POST', '/transaction/initialize', 'initialize', idempotent=False, json={
+            'email': email,
+            'amount': amount,
+            'reference': reference,
+            'callback_url': callback_url,
+            'metadata': metadata or {},
+        })
+
+    def verify_transaction(self, reference):
+        return self.request('GET', f'/transaction/verify/{reference}', 'verify', idempotent=True)
+
+    def charge_authorization(self, email, amount, authorization_code, reference, metadata=None):
+        return self.request('POST', '/transaction/charge_authorization', 'charge_authorization', idempotent=False, json={
+            'email': email,
+            'amount': amount,
+            'authorization_code': authorization_code,
+            'reference': reference,
+            'metadata': metadata or {},
+        })
+
+    def create_transfer_recipients(self, recipients):
+        return self.request('POST', '/transferrecipient/bulk', 'create_transfer_recipients', idempotent=False, json={
+            'batch': recipients,
+        })
+
+    def initiate_bulk_transfer(self, transfers, currency='GHS'):
+        return self.request('POST', '/transfer/bulk', 'initiate_bulk_transfer', idempotent=False, json={
+            'currency': currency,
+            'source': 'balance',
+            'transfers': transfers,
+        })
+
+    def verify_transfer(self, reference):
+        return self.request('GET', f'/transfer/verify/{reference}', 'verify_transfer', idempotent=True)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def build_gateway():
+    return PaystackGateway(
+        secret_key=settings.PAYSTACK_SECRET_KEY,
+        base_url=settings.PAYSTACK_BASE_URL,
+        connect_timeout=settings.PAYSTACK_CONNECT_TIMEOUT,
+        read_timeout=settings.PAYSTACK_READ_TIMEOUT,
+        max_retries=settings.PAYSTACK_MAX_RETRIES,
+        backoff=settings.PAYSTACK_RETRY_BACKOFF,
+        pool_size=settings.PAYSTACK_POOL_SIZE,
+        breaker=CircuitBreaker(
+            failure_threshold=settings.PAYSTACK_CIRCUIT_FAILURES,
+            reset_timeout=settings.PAYSTACK_CIRCUIT_RESET,
+        ),
+    )
+
+
+def get_gateway():
+    """The gateway shared by every payment path in this process"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = build_gateway()
+    return _gateway
+
+
+def reset_gateway():
+    """Drop the shared gateway so the next call rebuilds it from settings"""
+    global _gateway
+    with _gateway_lock:
+        _gateway = None
@@ -0,0 +1,302 @@
+"""
+Local stand-ins for the Paystack API.
+
+``PaystackStubServer`` implements just enough of the HTTP endpoints the
+gateway calls to exercise it without network access. ``FakePaystackGateway``
+replaces the gateway itself in-process for bulk runs. Both can inject
+latency and errors to check timeout, retry and failure handling.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import threading
+import time
+import uuid
+
+from .paystack import PaystackError
+
+
+def fake_authorization(reference):
+    return {
+        'authorization_code': f'AUTH_{reference.lower()}',
+        'channel': 'mobile_money',
+        'last4': None,
+        'reusable': True,
+    }
+
+
+class PaystackStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes; without this keep-alive calls stall on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def inject_faults(self):
+        """Sleep and/or fail as configured; returns True when the request was answered"""
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+        if server.latency:
+            time.sleep(random.uniform(0, server.jitter) + server.latency)
+        if server.error_rate and random.random() < server.error_rate:
+            self.send_json(503, {'status': False, 'message': 'Injected failure'})
+            return True
+        return False
+
+    def do_POST(self):
+        payload = self.read_json()
+        if self.inject_faults():
+            return
+
+        if self.path == '/transaction/initialize':
+            reference = payload.get('reference') or uuid.uuid4().hex
+            with self.server.lock:
+                if reference in self.server.transactions:
+                    return self.send_json(400, {'status': False, 'message': 'Duplicate Transaction Reference'})
+                self.server.transactions[reference] = payload
+            return self.send_json(200, {
+                'status': True,
+                'message': 'Authorization URL created',
+                'data': {
+                    'authorization_url': f'https://checkout.paystack.com/{reference}',
+                    'access_code': uuid.uuid4().hex[:15],
+                    'reference': reference,
+                },
+            })
+
+        if self.path == '/transaction/charge_authorization':
+            reference = payload.get('reference') or uuid.uuid4().hex
+            with self.server.lock:
+                if reference in self.server.transactions:
+                    return self.send_json(400, {'status': False, 'message': 'Duplicate Transaction Reference'})
+                self.server.transactions[reference] = payload
+            return self.send_json(200, {
+                'status': True,
+                'message': 'Charge attempted',
+                'data': {
+                    'status': 'success',
+                    'reference': reference,
+                    'amount': payload.get('amount'),
+                    'channel': 'mobile_money',
+                    'authorization': fake_authorization(reference),
+                    'customer': {'email': payload.get('email')},
+                },
+            })
+
+        self.send_json(404, {'status': False, 'message': 'Not found'})
+
+    def do_GET(self):
+        if self.inject_faults():
+            return
+
+        if self.path.startswith('/transaction/verify/'):
+            reference = self.path.rsplit('/', 1)[-1]
+            with self.server.lock:
+                transaction = self.server.transactions.get(reference)
+            if transaction is None:
+                return self.send_json(400, {'status': False, 'message': 'Transaction reference not found'})
+            return self.send_json(200, {
+                'status': True,
+                'message': 'Verification successful',
+                'data': {
+                    'status': 'success',
+                    'reference': reference,
+                    'amount': transaction.get('amount'),
+                    'channel': 'mobile_money',
+                    'authorization': fake_authorization(reference),
+                    'customer': {'email': transaction.get('email')},
+                },
+            })
+
+        self.send_json(404, {'status': False, 'message': 'Not found'})
+
+
+class PaystackStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, jitter=0.0, error_rate=0.0, verbose=False):
+        super().__init__(address, PaystackStubHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.verbose = verbose
+        self.transactions = {}
+        self.request_count = 0
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # Clients that hit their read timeout hang up before the delayed reply
+        pass
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        """Serve from a background thread"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class FakePaystackGateway:
+    """
+    In-process gateway with the same interface as PaystackGateway.
+
+    ``decline_rate`` answers charges with a failed status. ``error_rate``
+    charges successfully but raises PaystackError, as when the response is
+    lost, so the caller has to verify the outcome. A reference is only ever
+    charged once, like Paystack's duplicate reference check. Transfer
+    recipients are refused for the account numbers in ``invalid_accounts``.
+    """
+
+    def __init__(self, latency=0.0, decline_rate=0.0, error_rate=0.0, seed=None, invalid_accounts=()):
+        self.latency = latency
+        self.decline_rate = decline_rate
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.invalid_accounts = set(invalid_accounts)
+        self.checkouts = {}
+        self.charges = {}
+        self.transfers = {}
+        self.bulk_requests = 0
+        self.lock = threading.Lock()
+
+    def _roll(self):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            return self.random.random()
+
+    def initialize_transaction(self, email, amount, reference, callback_url, metadata=None):
+        self._roll()
+        with self.lock:
+            if reference in self.checkouts:
+                return {'status': False, 'message': 'Duplicate Transaction Reference'}
+            self.checkouts[reference] = amount
+        return {
+            'status': True,
+            'message': 'Authorization URL created',
+            'data': {
+                'authorization_url': f'https://checkout.paystack.com/{reference}',
+                'access_code': reference.lower(),
+                'reference': reference,
+            },
+        }
+
+    def charge_authorization(self, email, amount, authorization_code, reference, metadata=None):
+        roll = self._roll()
+        status = 'failed' if self.error_rate <= roll < self.error_rate + self.decline_rate else 'success'
+        with self.lock:
+            if reference in self.charges:
+                return {'status': False, 'message': 'Duplicate Transaction Reference'}
+            self.charges[reference] = status
+
+        if roll < self.error_rate:
+            # The charge went through but the response never arrived
+            raise PaystackError('Injected gateway error')
+
+        return {
+            'status': True,
+            'message': 'Charge attempted',
+            'data': {
+                'status': status,
+                'reference': reference,
+                'amount': amount,
+                'channel': 'mobile_money',
+                'authorization': {'authorization_code': authorization_code, 'reusable': True},
+                'customer': {'email': email},
+            },
+        }
+
+    def verify_transaction(self, reference):
+        self._roll()
+        with self.lock:
+            status = self.charges.get(reference)
+        if status is None:
+            return {'status': False, 'message': 'Transaction reference not found'}
+        return {
+            'status': True,
+            'message': 'Verification successful',
+            'data': {'status': status, 'reference': reference, 'channel': 'mobile_money'},
+        }
+
+    def create_transfer_recipients(self, recipients):
+        self._roll()
+        return {
+            'status': True,
+            'message': 'Recipients added successfully',
+            'data': {
+                'success': [
+                    {
+                        'recipient_code': f"RCP_{recipient['bank_code']}_{recipient['account_number']}",
+                        'details': {
+                            'account_number': recipient['account_number'],
+                            'bank_code': recipient['bank_code'],
+                        },
+                    }
+                    for recipient in recipients if recipient['account_number'] not in self.invalid_accounts
+                ],
+                'errors': [
+                    {'error': 'Account number is invalid', 'record': recipient}
+                    for recipient in recipients if recipient['account_number'] in self.invalid_accounts
+                ],
+            },
+        }
+
+    def initiate_bulk_transfer(self, transfers, currency='GHS'):
+        roll = self._roll()
+        with self.lock:
+            if any(transfer['reference'] in self.transfers for transfer in transfers):
+                return {'status': False, 'message': 'Duplicate Transfer Reference'}
+            for transfer in transfers:
+                self.transfers[transfer['reference']] = transfer
+            self.bulk_requests += 1
+
+        if roll < self.error_rate:
+            raise PaystackError('Injected gateway error')
+
+        # Mobile money transfers are settled later through the webhook
+        return {
+            'status': True,
+            'message': f'{len(transfers)} transfers queued.',
+            'data': [
+                {
+                    'reference': transfer['reference'],
+                    'recipient': transfer['recipient'],
+                    'amount': transfer['amount'],
+                    'transfer_code': f"TRF_{transfer['reference'].lower()}",
+                    'currency': currency,
+                    'status': 'pending',
+                }
+                for transfer in transfers
+            ],
+        }
+
+    def verify_transfer(self, reference):
+        self._roll()
+        with self.lock:
+            transfer = self.transfers.get(reference)
+        if transfer is None:
+            return {'status': False, 'message': 'Transfer not found'}
+        return {
+            'status': True,
+            'message': 'Transfer retrieved',
+            'data': {'status': 'pending', 'reference': reference, 'transfer_code': f"TRF_{reference.lower()}"},
+        }
@@ -0,0 +1,209 @@
+"""
+Sampling profiler for production requests.
+
+ProfilingMiddleware hands requests to one shared sampler thread, which
+reads the request thread's Python stack every PROFILING_INTERVAL_MS with
+sys._current_frames(). The request itself runs untraced, so a profiled
+request is only slowed by the sampler holding the GIL for a few
+microseconds per sample:
+
+    PROFILING_SAMPLE_RATE      share of requests sampled from the start
+    PROFILING_SLOW_REQUEST_MS  every other request is sampled once it has
+                               run this long, and kept if it was sampled
+
+The sampler sleeps until the next request is due, so fast requests that are
+not picked cost a dict insert and removal.
+
+Samples are wall-clock: time spent waiting on the database shows up under
+the query that waited. Each profile is written to PROFILING_DIR twice,
+named after the URL and its duration:
+
+    .folded  collapsed stacks ("frame;frame;frame count"), for flame graph tools
+    .pstats  the same samples as pstats data (calls are sample counts), for
+             ``python -m pstats`` or snakeviz
+
+Only the newest PROFILING_MAX_FILES profiles are kept.
+"""
+from collections import Counter
+from datetime import datetime
+import marshal
+import os
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+PROFILE_NAME = re.compile(r'^(?P<stamp>\d{8}-\d{6}-\d{6})-(?P<url_name>[\w-]+)-(?P<ms>\d+)ms$')
+PROFILE_FORMATS = ('.folded', '.pstats')
+
+
+class Profile:
+    """Stack samples of one request's thread"""
+
+    def __init__(self, thread_id, root_code, sample_from):
+        self.thread_id = thread_id
+        # Frames above the middleware belong to the server, not the request
+        self.root_code = root_code
+        self.sample_from = sample_from
+        self.samples = Counter()
+
+    def sample(self, frame):
+        stack = []
+        while frame is not None and frame.f_code is not self.root_code:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        if stack:
+            stack.reverse()
+            self.samples[tuple(stack)] += 1
+
+
+class Sampler:
+    """One daemon thread sampling every watched request that is due"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.profiles = {}
+        self.condition = threading.Condition()
+        self.next_wake = None
+        self.thread = None
+
+    def watch(self, profile):
+        with self.condition:
+            self.profiles[profile.thread_id] = profile
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='request-sampler', daemon=True)
+                self.thread.start()
+            if self.next_wake is None or profile.sample_from < self.next_wake:
+                self.condition.notify()
+
+    def unwatch(self, profile):
+        with self.condition:
+            self.profiles.pop(profile.thread_id, None)
+
+    def run(self):
+        with self.condition:
+            while True:
+                now = time.perf_counter()
+                due = [profile for profile in self.profiles.values() if profile.sample_from <= now]
+                if due:
+                    frames = sys._current_frames()
+                    for profile in due:
+                        profile.sample(frames.get(profile.thread_id))
+                    del frames
+                    self.next_wake = now + self.interval
+                else:
+                    self.next_wake = min((profile.sample_from for profile in self.profiles.values()), default=None)
+                # Waiting releases the lock, so requests come and go meanwhile
+                self.condition.wait(None if self.next_wake is None else max(self.next_wake - now, 0))
+
+
+def _short_path(filename):
+    """File paths relative to the project or site-packages"""
+    base = str(settings.BASE_DIR) + os.sep
+    if filename.startswith(base):
+        return filename[len(base):]
+    _, found, rest = filename.rpartition('site-packages' + os.sep)
+    return rest if found else filename
+
+
+def _label(code):
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapsed_stacks(samples):
+    """Brendan Gregg's folded format, heaviest stacks first"""
+    return ''.join(
+        ';'.join(_label(code) for code in stack) + f" {count}\n"
+        for stack, count in samples.most_common()
+    )
+
+
+def pstats_data(samples, interval):
+    """
+    Samples as the dict pstats loads: function -> (calls, calls, own time,
+    cumulative time, callers). Each sample counts as one call lasting the
+    sampling interval.
+    """
+    stats = {}
+    for stack, count in samples.items():
+        seconds = count * interval
+        keys = [(code.co_filename, code.co_firstlineno, code.co_name) for code in stack]
+        counted = set()
+        for depth, key in enumerate(keys):
+            entry = stats.setdefault(key, [0, 0, 0.0, 0.0, {}])
+            leaf = depth == len(keys) - 1
+            if leaf:
+                entry[2] += seconds
+            # Recursive functions count once per stack
+            if key not in counted:
+                counted.add(key)
+                entry[0] += count
+                entry[1] += count
+                entry[3] += seconds
+            if depth:
+                calls, primitive, own, cumulative = entry[4].get(keys[depth - 1], (0, 0, 0.0, 0.0))
+                entry[4][keys[depth - 1]] = (
+                    calls + count, primitive + count, own + (seconds if leaf else 0.0), cumulative + seconds,
+                )
+    return {key: tuple(entry) for key, entry in stats.items()}
+
+
+def write_profile(profile, url_name, elapsed):
+    """Write the profile's files and drop the oldest beyond PROFILING_MAX_FILES; returns the profile name"""
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    url_name = re.sub(r'[^\w-]', '_', url_name or 'unresolved')
+    name = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{url_name}-{elapsed * 1000:.0f}ms"
+
+    with open(os.path.join(directory, name + '.folded'), 'w') as f:
+        f.write(collapsed_stacks(profile.samples))
+    with open(os.path.join(directory, name + '.pstats'), 'wb') as f:
+        marshal.dump(pstats_data(profile.samples, settings.PROFILING_INTERVAL_MS / 1000), f)
+
+    for old in _profile_names()[settings.PROFILING_MAX_FILES:]:
+        for extension in PROFILE_FORMATS:
+            try:
+                os.remove(os.path.join(directory, old + extension))
+            except FileNotFoundError:
+                pass
+    return name
+
+
+def _profile_names():
+    """Names of the profiles on disk, newest first"""
+    try:
+        filenames = os.listdir(settings.PROFILING_DIR)
+    except FileNotFoundError:
+        return []
+    names = {os.path.splitext(filename)[0] for filename in filenames if filename.endswith(PROFILE_FORMATS)}
+    return sorted((name for name in names if PROFILE_NAME.match(name)), reverse=True)
+
+
+def list_profiles():
+    """Profiles on disk, newest first"""
+    profiles = []
+    for name in _profile_names():
+        match = PROFILE_NAME.match(name)
+        try:
+            size = sum(os.path.getsize(os.path.join(settings.PROFILING_DIR, name + extension)) for extension in PROFILE_FORMATS)
+        except OSError:
+            # Dropped from the ring meanwhile
+            continue
+        profiles.append({
+            'name': name,
+            'url_name': match['url_name'],
+            'duration_ms': int(match['ms']),
+            'created': datetime.strptime(match['stamp'], '%Y%m%d-%H%M%S-%f'),
+            'size': size,
+        })
+    return profiles
+
+
+def profile_path(name, extension):
+    """Path of a listed profile's file, or None for anything else"""
+    if extension not in PROFILE_FORMATS or not PROFILE_NAME.match(name):
+        return None
+    path = os.path.join(settings.PROFILING_DIR, name + extension)
+    return path if os.path.isfile(path) else None
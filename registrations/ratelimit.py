@@ -0,0 +1,180 @@
+"""
+Token bucket rate limits per client and endpoint, and load shedding.
+
+RATE_LIMITS maps URL names to a list of rules such as
+
+    {'key': 'ip', 'rate': '10/m', 'burst': 5, 'methods': ['POST']}
+
+key is 'ip' (the client's address), 'user' (logged-in users only) or
+'endpoint' (one bucket shared by every client). Each rule has its own
+bucket per client, holding up to burst tokens (by default the rate's count)
+and refilling at rate. A request takes a token from the bucket of every
+rule that applies to its method and is refused when one is empty.
+
+Buckets are kept in the RATE_LIMIT_CACHE cache, shared by every worker when
+that cache is, or in each process's memory. Cached buckets are read and
+written without a lock, so concurrent requests may slip a few over a limit.
+"""
+from collections import OrderedDict
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+KEYS = ('ip', 'user', 'endpoint')
+
+
+def parse_rate(rate):
+    """(count, tokens per second) of a rate such as '10/m'"""
+    count, _, period = rate.partition('/')
+    try:
+        count = int(count)
+        return count, count / PERIODS[period]
+    except (KeyError, ValueError):
+        raise ImproperlyConfigured(f"Invalid rate {rate!r}, expected a count per s, m, h or d such as '10/m'")
+
+
+def parse_rules(limits):
+    """{url name: [(key, tokens per second, burst, methods or None), ...]} of RATE_LIMITS"""
+    rules = {}
+    for name, entries in limits.items():
+        rules[name] = []
+        for entry in entries:
+            if entry['key'] not in KEYS:
+                raise ImproperlyConfigured(f"Rate limit key of {name!r} must be one of {', '.join(KEYS)}")
+            count, rate = parse_rate(entry['rate'])
+            methods = entry.get('methods')
+            rules[name].append((
+                entry['key'],
+                rate,
+                entry.get('burst', count),
+                frozenset(method.upper() for method in methods) if methods else None,
+            ))
+    return rules
+
+
+def take_token(bucket, rate, burst, now):
+    """
+    (bucket, wait) after taking a token from a (tokens, updated) bucket, or
+    from a full one when it is None. wait is how many seconds until a token
+    is available, 0 when one was taken.
+    """
+    tokens, updated = bucket or (burst, now)
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / rate
+
+
+class MemoryBuckets:
+    """Buckets in this process's memory; the least recently used are forgotten past max_keys"""
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, rate, burst, now):
+        with self.lock:
+            bucket, wait = take_token(self.buckets.pop(key, None), rate, burst, now)
+            self.buckets[key] = bucket
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return wait
+
+
+class CacheBuckets:
+    """Buckets in a Django cache, shared by the workers using it"""
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def take(self, key, rate, burst, now):
+        key = f'ratelimit:{key}'
+        bucket, wait = take_token(self.cache.get(key), rate, burst, now)
+        # An expired bucket would have refilled by then anyway
+        self.cache.set(key, bucket, math.ceil(burst / rate))
+        return wait
+
+
+def get_store():
+    if settings.RATE_LIMIT_CACHE:
+        return CacheBuckets(settings.RATE_LIMIT_CACHE)
+    return MemoryBuckets(settings.RATE_LIMIT_MEMORY_MAX_KEYS)
+
+
+def client_ip(request, proxy_count):
+    """The client's address, as seen by the first of proxy_count trusted proxies"""
+    if proxy_count:
+        # Each proxy appends the address it received the request from
+        forwarded = [address.strip() for address in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+        if len(forwarded) >= proxy_count and forwarded[-proxy_count]:
+            return forwarded[-proxy_count]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class RateLimiter:
+    """The RATE_LIMITS rules and the buckets they take tokens from"""
+
+    def __init__(self, limits, store, proxy_count=0):
+        self.rules = parse_rules(limits)
+        self.store = store
+        self.proxy_count = proxy_count
+
+    def client(self, request, key):
+        if key == 'ip':
+            return client_ip(request, self.proxy_count)
+        if key == 'user':
+            return request.user.pk if request.user.is_authenticated else None
+        return ''
+
+    def check(self, request, name):
+        """Seconds the client must wait before retrying, 0 when the request may go ahead"""
+        rules = self.rules.get(name)
+        if not rules:
+            return 0
+        now = time.time()
+        for index, (key, rate, burst, methods) in enumerate(rules):
+            if methods is not None and request.method not in methods:
+                continue
+            client = self.client(request, key)
+            if client is None:
+                continue
+            wait = self.store.take(f'{name}:{index}:{client}', rate, burst, now)
+            if wait:
+                return wait
+        return 0
+
+
+def queue_time(request, now):
+    """Seconds since the front proxy received the request (X-Request-Start), or None"""
+    value = request.META.get('HTTP_X_REQUEST_START')
+    if not value:
+        return None
+    try:
+        start = float(value.removeprefix('t='))
+    except ValueError:
+        return None
+    # Proxies send seconds, milliseconds or microseconds since the epoch
+    if start > 1e14:
+        start /= 1e6
+    elif start > 1e11:
+        start /= 1e3
+    return max(0, now - start)
+
+
+def too_many_requests(wait):
+    response = HttpResponse('Too many requests, please try again later.', status=429, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def overloaded():
+    response = HttpResponse('The server is busy, please try again shortly.', status=503, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(settings.LOAD_SHED_RETRY_AFTER)
+    return response
@@ -0,0 +1,160 @@
+"""
+Public job board search.
+
+Listings' title, description and requirements are indexed with SQLite FTS5
+(migration 0015), kept in sync by triggers. A search runs one ranked FTS
+query for the matching listings' ids and facets, then reads the page of
+listings with values(). On other databases the text is matched with
+icontains.
+
+Facet counts over all active listings are precomputed and refreshed by the
+JobListing signal; facets of a text search are counted over its matches.
+Every result page is cached per query under the JOB_LISTINGS page cache
+group, so any listing change makes all of them stale at once. Queries are
+keyed by their FTS expression, so texts without words share the unfiltered
+listing, and pages past the last are served the last page. Text searches
+matching nothing are not cached at all, since anyone can make up more.
+"""
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Q
+
+from .cache import JOB_LISTINGS, get_group_version
+from .models import JobListing
+
+FTS_TABLE = 'registrations_joblisting_fts'
+FACETS_KEY = 'jobs:facets'
+FACET_FIELDS = ['job_type', 'salary_range']
+RESULT_FIELDS = ['id', 'title', 'description', 'job_type', 'salary_range', 'requirements', 'created_date']
+
+
+def match_expression(text):
+    """FTS5 query requiring every word of the text, each as a prefix"""
+    # Quoting the words keeps FTS5 operators and punctuation in the text inert
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text.lower()))
+
+
+def count_facets(rows):
+    """{field: [(value, count), ...]} of (job_type, salary_range) rows, most common first"""
+    counts = {field: {} for field in FACET_FIELDS}
+    for row in rows:
+        for field, value in zip(FACET_FIELDS, row):
+            counts[field][value] = counts[field].get(value, 0) + 1
+    return {
+        field: sorted(values.items(), key=lambda item: (-item[1], item[0]))
+        for field, values in counts.items()
+    }
+
+
+def refresh_facets():
+    """Count the active listings per facet value and cache the counts"""
+    active = JobListing.objects.filter(is_active=True).order_by()
+    facets = {
+        field: [
+            (row[field], row['count'])
+            for row in active.values(field).annotate(count=Count('id')).order_by('-count', field)
+        ]
+        for field in FACET_FIELDS
+    }
+    cache.set(FACETS_KEY, facets, settings.JOB_SEARCH_CACHE_TIMEOUT)
+    return facets
+
+
+def get_facets():
+    facets = cache.get(FACETS_KEY)
+    if facets is None:
+        facets = refresh_facets()
+    return facets
+
+
+def _filters(job_type, salary_range):
+    filters = {}
+    if job_type:
+        filters['job_type'] = job_type
+    if salary_range:
+        filters['salary_range'] = salary_range
+    return filters
+
+
+def _ranked_matches(text):
+    """(id, job_type, salary_range) of the active listings matching the text, best first"""
+    if connection.vendor != 'sqlite':
+        return list(
+            JobListing.objects.filter(is_active=True).filter(
+                Q(title__icontains=text) | Q(description__icontains=text) | Q(requirements__icontains=text)
+            ).order_by('-created_date', '-id').values_list('id', *FACET_FIELDS)
+        )
+
+    table = connection.ops.quote_name(JobListing._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT j.id, j.job_type, j.salary_range FROM {FTS_TABLE} f "
+            f"JOIN {table} j ON j.id = f.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s AND j.is_active "
+            f"ORDER BY f.rank, j.id DESC",
+            [match_expression(text)],
+        )
+        return cursor.fetchall()
+
+
+def _search(text, job_type, salary_range, page):
+    size = settings.JOB_SEARCH_PAGE_SIZE
+    filters = _filters(job_type, salary_range)
+
+    if match_expression(text):
+        matches = _ranked_matches(text)
+        facets = count_facets(row[1:] for row in matches)
+        ids = [
+            pk for pk, row_job_type, row_salary_range in matches
+            if filters.get('job_type', row_job_type) == row_job_type
+            and filters.get('salary_range', row_salary_range) == row_salary_range
+        ]
+        count = len(ids)
+        pages = max(1, -(-count // size))
+        page = min(page, pages)
+        page_ids = ids[(page - 1) * size:page * size]
+        rows = {row['id']: row for row in JobListing.objects.filter(id__in=page_ids).values(*RESULT_FIELDS)}
+        results = [rows[pk] for pk in page_ids if pk in rows]
+    else:
+        facets = get_facets()
+        listings = JobListing.objects.filter(is_active=True, **filters).order_by('-created_date', '-id')
+        count = listings.count()
+        pages = max(1, -(-count // size))
+        page = min(page, pages)
+        results = list(listings.values(*RESULT_FIELDS)[(page - 1) * size:page * size])
+
+    return {
+        'count': count,
+        'page': page,
+        'pages': pages,
+        'facets': facets,
+        'results': results,
+    }
+
+
+def search_jobs(text='', job_type='', salary_range='', page=1):
+    """
+    A page of active listings matching the text and filters, with facet
+    counts; past the last page, the last one
+    """
+    text = ' '.join(text.split())
+    expression = match_expression(text)
+    query = '\n'.join([expression, job_type, salary_range])
+    prefix = f"jobs:search:{JOB_LISTINGS}{get_group_version(JOB_LISTINGS)}:{hashlib.md5(query.encode('utf-8')).hexdigest()}"
+    # Clamped before the page goes into a key, so made-up pages cannot flood the cache
+    pages = cache.get(f'{prefix}:pages')
+    if pages is not None:
+        page = min(page, pages)
+    result = cache.get(f'{prefix}:{page}')
+    if result is None:
+        result = _search(text, job_type, salary_range, page)
+        if result['count'] or not expression:
+            cache.set_many({
+                f'{prefix}:pages': result['pages'],
+                f"{prefix}:{result['page']}": result,
+            }, settings.JOB_SEARCH_CACHE_TIMEOUT)
+    return result
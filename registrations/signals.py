@@ -0,0 +1,65 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import duplicates, live, odds, search
+from .backends import invalidate_cached_user
+from .cache import DRAW_STATS, JOB_LISTINGS, invalidate_page_cache
+from .models import Registration, MonthlyDraw, Winner, JobListing
+
+
+@receiver([post_save, post_delete], sender=Registration)
+@receiver([post_save, post_delete], sender=MonthlyDraw)
+def invalidate_draw_stats_pages(sender, **kwargs):
+    """Participant counts and draw status are shown on cached public pages"""
+    invalidate_page_cache(DRAW_STATS)
+    live.invalidate_progress()
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Registration)
+def invalidate_registration_user(sender, instance, **kwargs):
+    invalidate_cached_user(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Winner)
+def touch_winner_registration(sender, instance, **kwargs):
+    """A new or claimed prize changes the registration's dashboard version"""
+    Registration.objects.filter(pk=instance.registration_id).update(updated_date=timezone.now())
+    user_id = Registration.objects.filter(pk=instance.registration_id).values_list('user_id', flat=True).first()
+    invalidate_cached_user(user_id)
+
+
+@receiver(post_save, sender=MonthlyDraw)
+def refresh_cached_draw(sender, instance, **kwargs):
+    odds.cache_draw(instance)
+
+
+@receiver([post_save, post_delete], sender=JobListing)
+def refresh_active_jobs(sender, **kwargs):
+    """Job prize slots are limited by the number of active listings"""
+    odds.count_active_jobs()
+    search.refresh_facets()
+    invalidate_page_cache(JOB_LISTINGS)
+
+
+@receiver(pre_save, sender=Registration)
+def set_blocking_keys(sender, instance, raw, update_fields=None, **kwargs):
+    if raw or update_fields is not None:
+        return
+    keys = duplicates.blocking_keys(instance.first_name, instance.last_name, instance.phone_number, instance.date_of_birth)
+    instance._blocking_keys_changed = keys != (instance.phone_key, instance.name_key)
+    instance.phone_key, instance.name_key = keys
+
+
+@receiver(post_save, sender=Registration)
+def check_duplicate_registration(sender, instance, raw, **kwargs):
+    """Flag a new or edited registration that matches existing ones"""
+    if not raw and getattr(instance, '_blocking_keys_changed', False):
+        instance._blocking_keys_changed = False
+        duplicates.check_registration(instance)
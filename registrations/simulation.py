@@ -0,0 +1,212 @@
+"""
+Monte Carlo simulation of the draw programme, for capacity planning.
+
+Each trial follows the programme for ``months`` months from its current
+size. Per month, with S paying subscribers and L expected signups:
+
+    signups      L = signups * (1 + growth) ** month, growth drawn per trial
+    subscribers  S += L * conversion - S * churn, plus normal noise of the
+                 same variance as the Poisson joins and binomial churn
+    draw         held once S reaches minimum_participants; prizes as in
+                 select_winners (jobs first, basic income from the rest)
+
+Counts are in the hundreds or more, where the normal approximation is close
+and costs one float32 normal per trial-month instead of a Poisson and a
+binomial sample. All trials of a batch advance together as NumPy arrays.
+
+Batches only return sums and integer histograms, so results merge by
+addition and a batch's random stream depends on its index only: the same
+seed and batch size give the same report for any number of processes.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+from django.conf import settings
+import numpy as np
+
+from .models import Payment, Registration
+from .odds import current_draw_month
+from .payouts import add_months
+
+
+def default_parameters():
+    return {
+        'months': 24,
+        'subscribers': 0,
+        'signups': 1000,
+        'growth': 0.05,
+        'growth_sd': 0.03,
+        'conversion': 0.6,
+        'churn': 0.1,
+        'minimum_participants': 5000,
+        'job_winners': settings.DRAW_JOB_WINNERS,
+        'income_winners': settings.DRAW_INCOME_WINNERS,
+        'jobs': settings.DRAW_JOB_WINNERS,
+        'subscription': settings.MONTHLY_SUBSCRIPTION_AMOUNT / 100,
+        'income_amount': settings.BASIC_INCOME_MONTHLY_AMOUNT,
+        'income_months': settings.BASIC_INCOME_MONTHS,
+    }
+
+
+def calibrate(month=None):
+    """Starting subscribers, signups, conversion and churn observed in the database"""
+    month = month or current_draw_month()
+    previous = add_months(month, -1)
+    paid = Payment.objects.filter(status='success')
+    payers = set(paid.filter(month_paid_for=previous).values_list('registration_id', flat=True))
+    stayed = paid.filter(month_paid_for=month, registration_id__in=payers).values('registration_id').distinct().count()
+    registrations = Registration.objects.filter(is_active=True)
+    total = registrations.count()
+    ever_paid = registrations.filter(payments__status='success').distinct().count()
+    return {
+        'subscribers': paid.filter(month_paid_for=month).values('registration_id').distinct().count(),
+        'signups': registrations.filter(
+            registration_date__date__gte=previous, registration_date__date__lt=month,
+        ).count(),
+        'conversion': ever_paid / total if total else None,
+        'churn': 1 - stayed / len(payers) if payers else None,
+    }
+
+
+def simulate_batch(params, trials, seed, batch):
+    """Run one batch of trials; returns its sums and histograms"""
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(batch,)))
+    months = params['months']
+    f32 = np.float32
+
+    growth = 1 + f32(params['growth']) + f32(params['growth_sd']) * rng.standard_normal(trials, dtype=f32)
+    subscribers = np.full(trials, params['subscribers'], dtype=f32)
+    joins = np.full(trials, params['signups'] * params['conversion'], dtype=f32)
+    churn = f32(params['churn'])
+    minimum = f32(params['minimum_participants'])
+    job_slots = f32(min(params['job_winners'], params['jobs']))
+    prize_slots = job_slots + f32(params['income_winners'])
+
+    # Per trial: months before the first draw (months means never), draws and
+    # income winners so far, and log of the chance a subscriber never won
+    waiting = np.zeros(trials, dtype=np.int16)
+    reached = np.zeros(trials, dtype=bool)
+    income_winners = np.zeros(trials, dtype=f32)
+    revenue = np.zeros(trials, dtype=f32)
+    log_miss = np.zeros(trials, dtype=f32)
+    odds_sum = np.zeros(months)
+    draws_held = np.zeros(months, dtype=np.int64)
+    entrants_sum = np.zeros(months)
+
+    # Scratch arrays reused every month
+    leaves = np.empty(trials, dtype=f32)
+    noise = np.empty(trials, dtype=f32)
+    held = np.empty(trials, dtype=bool)
+    prizes = np.empty(trials, dtype=f32)
+    odds = np.empty(trials, dtype=f32)
+
+    for month in range(months):
+        np.multiply(subscribers, churn, out=leaves)
+        # Variance of Poisson joins plus binomial churn
+        np.multiply(leaves, 1 - churn, out=noise)
+        noise += joins
+        np.sqrt(noise, out=noise)
+        noise *= rng.standard_normal(trials, dtype=f32)
+        subscribers += joins
+        subscribers -= leaves
+        subscribers += noise
+        np.rint(subscribers, out=subscribers)
+        np.maximum(subscribers, 0, out=subscribers)
+        joins *= growth
+
+        np.greater_equal(subscribers, minimum, out=held)
+        reached |= held
+        waiting += ~reached
+        draws_held[month] = np.count_nonzero(held)
+        entrants_sum[month] = subscribers.sum(dtype=np.float64)
+        revenue += subscribers
+
+        # Jobs first, basic income from the rest; nothing without a draw
+        np.minimum(subscribers, prize_slots, out=prizes)
+        prizes *= held
+        np.divide(prizes, np.maximum(subscribers, 1), out=odds)
+        odds_sum[month] = odds.sum(dtype=np.float64)
+        income_winners += prizes
+        income_winners -= np.minimum(prizes, job_slots)
+        np.negative(odds, out=odds)
+        log_miss += np.log1p(odds, out=odds)
+
+    revenue *= f32(params['subscription'])
+    liabilities = income_winners * f32(params['income_amount'] * params['income_months'])
+    return {
+        'trials': trials,
+        'threshold': np.bincount(waiting, minlength=months + 1),
+        'income_winners': np.bincount(income_winners.astype(np.int64)),
+        'shortfall': int(np.count_nonzero(liabilities > revenue)),
+        'revenue': revenue.sum(dtype=np.float64),
+        'win_any': (-np.expm1(log_miss)).sum(dtype=np.float64),
+        'odds_sum': odds_sum,
+        'draws_held': draws_held,
+        'entrants_sum': entrants_sum,
+    }
+
+
+def merge(results):
+    """Add up batch results"""
+    total = {}
+    for result in results:
+        for name, value in result.items():
+            if name not in total:
+                total[name] = value
+            elif isinstance(value, np.ndarray) and len(value) != len(total[name]):
+                size = max(len(value), len(total[name]))
+                total[name] = np.pad(total[name], (0, size - len(total[name]))) + np.pad(value, (0, size - len(value)))
+            else:
+                total[name] = total[name] + value
+    return total
+
+
+def simulate(params, trials, batch_size=65536, processes=1, seed=0):
+    """Run ``trials`` trials in batches, over a process pool when ``processes`` > 1"""
+    sizes = [min(batch_size, trials - start) for start in range(0, trials, batch_size)]
+    arguments = ([params] * len(sizes), sizes, [seed] * len(sizes), range(len(sizes)))
+    if processes <= 1:
+        return merge(map(simulate_batch, *arguments))
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('fork')) as pool:
+        return merge(pool.map(simulate_batch, *arguments))
+
+
+def quantile(histogram, q):
+    """Smallest value with at least a ``q`` share of the histogram at or below it"""
+    return int(np.searchsorted(np.cumsum(histogram), q * histogram.sum()))
+
+
+def months_until(threshold, q):
+    month = quantile(threshold, q)
+    return month + 1 if month < len(threshold) - 1 else None
+
+
+def summarize(params, result):
+    """Report figures from merged results"""
+    trials = result['trials']
+    months = params['months']
+    threshold = result['threshold']
+    reached = threshold[:months]
+    liability = params['income_amount'] * params['income_months']
+    income_winners = result['income_winners']
+    winner_counts = np.arange(len(income_winners))
+    held = result['draws_held']
+    return {
+        'trials': trials,
+        'reach_probability': reached.sum() / trials,
+        # In months from now; None when most trials never get there
+        'threshold_mean': (np.arange(1, months + 1) * reached).sum() / reached.sum() if reached.sum() else None,
+        'threshold_median': months_until(threshold, 0.5),
+        'threshold_p90': months_until(threshold, 0.9),
+        'draws_mean': held.sum() / trials,
+        'entrants_mean': result['entrants_sum'] / trials,
+        'draw_probability': held / trials,
+        'odds_mean': np.divide(result['odds_sum'], held, out=np.zeros(months), where=held > 0),
+        'win_any': result['win_any'] / trials,
+        'income_winners_mean': (winner_counts * income_winners).sum() / trials,
+        'liability_mean': (winner_counts * income_winners).sum() / trials * liability,
+        'liability_p95': quantile(income_winners, 0.95) * liability,
+        'liability_p99': quantile(income_winners, 0.99) * liability,
+        'revenue_mean': result['revenue'] / trials,
+        'shortfall_probability': result['shortfall'] / trials,
+    }
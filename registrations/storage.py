@@ -0,0 +1,128 @@
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+import gzip
+import os
+import re
+
+try:
+    import brotli
+except ImportError:  # Brotli variants are skipped when the package is missing
+    brotli = None
+
+# Text assets worth shipping precompressed
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map', '.xml')
+
+# Compressed variants smaller than this fraction of the original are kept
+MIN_COMPRESSION_RATIO = 0.95
+
+# Strings and comments are matched first so whitespace inside them survives
+_CSS_TOKENS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|(/\*.*?\*/)|(\s+)', re.S)
+_CSS_PUNCTUATION = re.compile(r'\s*([{};,])\s*')
+
+
+def minify_css(source):
+    """Drop comments and collapse whitespace, leaving strings and url()s untouched"""
+    def replace(match):
+        string, comment, whitespace = match.groups()
+        if string:
+            return string
+        if comment:
+            return ''
+        return ' '
+
+    collapsed = _CSS_TOKENS.sub(replace, source)
+
+    # Tighten punctuation outside strings only
+    parts = re.split(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')', collapsed)
+    for i in range(0, len(parts), 2):
+        parts[i] = _CSS_PUNCTUATION.sub(r'\1', parts[i]).replace(';}', '}')
+    return ''.join(parts).strip()
+
+
+def minify_js(source):
+    """
+    Conservative JavaScript minification.
+
+    Only indentation, blank lines and whole-line ``//`` comments are removed.
+    Line breaks are kept so automatic semicolon insertion behaves exactly as
+    in the original file, and lines inside multi-line template literals are
+    left alone.
+    """
+    lines = []
+    in_template = False
+    for line in source.splitlines():
+        if in_template:
+            lines.append(line)
+        else:
+            stripped = line.strip()
+            if not stripped or stripped.startswith('//'):
+                continue
+            lines.append(stripped)
+        if (line.count('`') - line.count('\\`')) % 2:
+            in_template = not in_template
+    return '\n'.join(lines) + '\n'
+
+
+MINIFIERS = {
+    '.css': minify_css,
+    '.js': minify_js,
+}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Static files storage used by collectstatic.
+
+    CSS and JavaScript are minified before they are content-hashed, and every
+    text asset gets ``.gz`` and ``.br`` siblings so the static middleware can
+    serve precompressed bytes without doing any work per request.
+    """
+
+    def stored_name(self, name):
+        # Before collectstatic has run (development, tests) there is no
+        # manifest to look names up in, so the source files are used as-is.
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+
+        # Minify the collected copies and hash those instead of the sources
+        paths = dict(paths)
+        for path in paths:
+            minifier = MINIFIERS.get(os.path.splitext(path)[1].lower())
+            if minifier is None or '.min.' in path:
+                continue
+            with self.open(path) as original:
+                source = original.read().decode('utf-8')
+            self.delete(path)
+            self._save(path, ContentFile(minifier(source).encode('utf-8')))
+            paths[path] = (self, path)
+
+        for name, hashed_name, processed in super().post_process(paths, dry_run=dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                self.compress(name)
+                self.compress(hashed_name)
+            yield name, hashed_name, processed
+
+    def compress(self, name):
+        """Write gzip and brotli variants next to a collected file"""
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS) or not self.exists(name):
+            return
+
+        with self.open(name) as original:
+            content = original.read()
+
+        variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['.br'] = brotli.compress(content, quality=11)
+
+        for suffix, compressed in variants.items():
+            if len(compressed) >= len(content) * MIN_COMPRESSION_RATIO:
+                continue
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(compressed))
+
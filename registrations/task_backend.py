@@ -0,0 +1,177 @@
+"""
+Database backend for Django's task framework (``django.tasks``).
+
+Tasks are rows in the QueuedTask table, so no broker is needed. Workers
+(``manage.py run_tasks``) claim batches of ready rows in priority order.
+Where the database supports it the candidates are locked with
+``SELECT ... FOR UPDATE SKIP LOCKED`` so concurrent workers never wait on
+each other; everywhere else a conditional UPDATE on status='READY' makes the
+claim atomic. Failed tasks are retried with exponential backoff until
+MAX_ATTEMPTS, and tasks stuck RUNNING past LEASE_TIMEOUT (a killed worker)
+are made ready again.
+"""
+from datetime import timedelta
+import random
+from traceback import format_exception
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.tasks import TaskContext, TaskResult, TaskResultStatus
+from django.tasks.backends.base import BaseTaskBackend
+from django.tasks.base import TaskError
+from django.tasks.exceptions import TaskResultDoesNotExist
+from django.tasks.signals import task_enqueued, task_finished, task_started
+from django.utils import timezone
+from django.utils.json import normalize_json
+from django.utils.module_loading import import_string
+
+from .models import QueuedTask
+
+
+class DatabaseBackend(BaseTaskBackend):
+    supports_defer = True
+    supports_priority = True
+    supports_get_result = True
+
+    def __init__(self, alias, params):
+        super().__init__(alias, params)
+        self.max_attempts = self.options.get('MAX_ATTEMPTS', 3)
+        self.retry_delay = self.options.get('RETRY_DELAY', 30)
+        self.lease_timeout = self.options.get('LEASE_TIMEOUT', 600)
+
+    def enqueue(self, task, args, kwargs):
+        self.validate_task(task)
+
+        now = timezone.now()
+        record = QueuedTask.objects.create(
+            task_path=task.module_path,
+            queue_name=task.queue_name,
+            backend=self.alias,
+            priority=task.priority,
+            args=normalize_json(args),
+            kwargs=normalize_json(kwargs),
+            available_at=task.run_after or now,
+            run_after=task.run_after,
+            max_attempts=self.max_attempts,
+        )
+        result = self.to_result(record, task)
+        task_enqueued.send(type(self), task_result=result)
+        return result
+
+    def get_result(self, result_id):
+        try:
+            record = QueuedTask.objects.get(pk=result_id, backend=self.alias)
+        except (QueuedTask.DoesNotExist, ValueError):
+            raise TaskResultDoesNotExist(result_id) from None
+        return self.to_result(record)
+
+    def to_result(self, record, task=None):
+        """The TaskResult view of a QueuedTask row"""
+        task = task or import_string(record.task_path)
+        if record.run_after is not None:
+            task = task.using(run_after=record.run_after)
+        result = TaskResult(
+            task=task,
+            id=str(record.pk),
+            status=TaskResultStatus(record.status),
+            enqueued_at=record.enqueued_at,
+            started_at=record.started_at,
+            last_attempted_at=record.last_attempted_at,
+            finished_at=record.finished_at,
+            args=record.args,
+            kwargs=record.kwargs,
+            backend=record.backend,
+            errors=[TaskError(**error) for error in record.errors],
+            worker_ids=list(record.worker_ids),
+        )
+        object.__setattr__(result, '_return_value', record.return_value)
+        return result
+
+    # Worker side
+
+    def claim(self, worker_id, queues=None, limit=1):
+        """Atomically mark up to ``limit`` ready tasks as RUNNING for this worker"""
+        now = timezone.now()
+        candidates = QueuedTask.objects.filter(
+            backend=self.alias,
+            status='READY',
+            queue_name__in=queues or self.queues,
+            available_at__lte=now,
+        ).order_by('-priority', 'available_at', 'pk')
+
+        with transaction.atomic():
+            if connection.features.has_select_for_update_skip_locked:
+                candidates = candidates.select_for_update(skip_locked=True)
+            ids = list(candidates.values_list('pk', flat=True)[:limit])
+            if not ids:
+                return []
+
+            # The claim time tells this worker's rows apart from a concurrent claim
+            QueuedTask.objects.filter(pk__in=ids, status='READY').update(
+                status='RUNNING',
+                attempts=F('attempts') + 1,
+                started_at=now,
+                last_attempted_at=now,
+            )
+            claimed = list(QueuedTask.objects.filter(pk__in=ids, status='RUNNING', last_attempted_at=now))
+
+        # Saved with the outcome, saving a write per claim
+        for record in claimed:
+            record.worker_ids.append(worker_id)
+        return claimed
+
+    def execute(self, record):
+        """Run a claimed task and store its outcome"""
+        task = import_string(record.task_path)
+        result = self.to_result(record, task)
+        task_started.send(type(self), task_result=result)
+
+        try:
+            if task.takes_context:
+                value = task.call(TaskContext(task_result=result), *record.args, **record.kwargs)
+            else:
+                value = task.call(*record.args, **record.kwargs)
+            record.return_value = normalize_json(value)
+        except KeyboardInterrupt:
+            raise
+        except BaseException as e:
+            exception_type = type(e)
+            record.errors.append({
+                'exception_class_path': f"{exception_type.__module__}.{exception_type.__qualname__}",
+                'traceback': ''.join(format_exception(e)),
+            })
+            if record.attempts < record.max_attempts:
+                # Exponential backoff with jitter
+                delay = self.retry_delay * 2 ** (record.attempts - 1) * random.uniform(0.5, 1.5)
+                record.status = 'READY'
+                record.available_at = timezone.now() + timedelta(seconds=delay)
+            else:
+                record.status = 'FAILED'
+                record.finished_at = timezone.now()
+        else:
+            record.status = 'SUCCESSFUL'
+            record.finished_at = timezone.now()
+
+        # Only the worker holding the claim may record the outcome
+        QueuedTask.objects.filter(pk=record.pk, status='RUNNING', last_attempted_at=record.last_attempted_at).update(
+            status=record.status,
+            available_at=record.available_at,
+            return_value=record.return_value,
+            errors=record.errors,
+            worker_ids=record.worker_ids,
+            finished_at=record.finished_at,
+        )
+        if record.status != 'READY':
+            task_finished.send(type(self), task_result=self.to_result(record, task))
+        return record
+
+    def requeue_stale(self):
+        """Make tasks claimed by a worker that died ready again, or fail them when out of attempts"""
+        now = timezone.now()
+        stale = QueuedTask.objects.filter(
+            backend=self.alias,
+            status='RUNNING',
+            last_attempted_at__lt=now - timedelta(seconds=self.lease_timeout),
+        )
+        failed = stale.filter(attempts__gte=F('max_attempts')).update(status='FAILED', finished_at=now)
+        return stale.update(status='READY', available_at=now) + failed
@@ -0,0 +1,116 @@
+"""
+Background tasks, run by ``manage.py run_tasks`` through the database task backend.
+
+Views and commands enqueue these instead of doing slow or external work
+inline, e.g. ``send_winner_notification.enqueue(registration.id, 'job', title)``.
+A task that raises is retried with backoff (TASKS OPTIONS MAX_ATTEMPTS).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.tasks import task
+from django.utils import timezone
+
+from .models import Registration, Payment
+from .payments import mark_payment_failed, mark_payment_successful, save_authorization
+from .payouts import apply_transfer_results
+from .paystack import get_gateway
+
+
+@task(priority=10)
+def process_paystack_event(payload):
+    """Apply a verified Paystack webhook event"""
+    event = payload.get('event')
+    data = payload.get('data') or {}
+
+    if event == 'charge.success':
+        try:
+            payment = Payment.objects.get(reference=data['reference'])
+        except Payment.DoesNotExist:
+            return 'unknown reference'
+        mark_payment_successful(payment, channel=data.get('channel'))
+        save_authorization(payment.registration_id, data)
+
+    elif event in ('transfer.success', 'transfer.failed', 'transfer.reversed'):
+        # Basic income payout settled
+        apply_transfer_results({data['reference']: (data['status'], data.get('reason'))})
+
+    return event
+
+
+@task(priority=5)
+def verify_pending_payment(payment_id):
+    """Re-check a payment Paystack could not confirm during the callback"""
+    payment = Payment.objects.get(pk=payment_id)
+    if payment.status != 'pending':
+        return payment.status
+
+    # Raises PaystackError while Paystack is unreachable, so the task is retried
+    response = get_gateway().verify_transaction(payment.reference)
+    data = response.get('data') or {}
+    if response.get('status') and data.get('status') == 'success':
+        mark_payment_successful(payment, channel=data.get('channel'), paystack_reference=data.get('reference'))
+        save_authorization(payment.registration_id, data)
+        return 'success'
+    if response.get('status') and data.get('status') in ('failed', 'abandoned'):
+        mark_payment_failed(payment)
+        return 'failed'
+    return payment.status
+
+
+def verify_payment_later(payment, delay=60):
+    """Enqueue verify_pending_payment to run after ``delay`` seconds"""
+    return verify_pending_payment.using(run_after=timezone.now() + timedelta(seconds=delay)).enqueue(payment.pk)
+
+
+@task
+def send_winner_notification(registration_id, prize_type, prize_name):
+    """Send email notification to winner"""
+    registration = Registration.objects.get(pk=registration_id)
+
+    subject = f"🎉 Congratulations! You've Won - Jobmarkt"
+
+    if prize_type == 'job':
+        message = f"""
+Dear {registration.full_name},
+
+Congratulations! You have been selected as a winner in this month's Jobmarkt draw!
+
+🎉 YOU WON: {prize_name}
+
+We will contact you within 48 hours with more details about your prize and next steps.
+
+Please log in to your dashboard to view your winning details and claim your prize.
+
+Dashboard: http://localhost:8000/user/dashboard/
+
+Best regards,
+The Jobmarkt Team
+        """
+    else:
+        message = f"""
+Dear {registration.full_name},
+
+Congratulations! You have been selected as a winner in this month's Jobmarkt draw!
+
+🎉 YOU WON: Basic Income (GHS {settings.BASIC_INCOME_MONTHLY_AMOUNT}/month for {settings.BASIC_INCOME_MONTHS} months)
+
+We will contact you within 48 hours with more details about your prize and payment setup.
+
+Please log in to your dashboard to view your winning details and claim your prize.
+
+Dashboard: http://localhost:8000/user/dashboard/
+
+Best regards,
+The Jobmarkt Team
+        """
+
+    # Raise on failure so the task is retried
+    send_mail(
+        subject,
+        message,
+        settings.DEFAULT_FROM_EMAIL,
+        [registration.email],
+    )
+    return registration.email
@@ -1,3 +1,1403 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.db.models import Count, Sum
+from django.http import HttpResponse
+from django.tasks import default_task_backend, task
+from django.core.exceptions import ImproperlyConfigured
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock, skipIf
+import asyncio
+import numpy as np
+import os
+import pstats
+import requests
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from . import archive, ledger, live, odds, profiling, ratelimit
+from .budgets import BUDGET_SCALES, UNBUDGETED, UNPAGINATED, VIEW_BUDGETS
+from .cache import DRAW_STATS, invalidate_page_cache
+from .draws import (
+    REGIONS, SNAPSHOT_DTYPE, STRATEGIES, build_merkle_tree, draw_winners, inclusion_proof, prepare_draw,
+    snapshot_digest, verify_inclusion,
+)
+from .backends import RegistrationModelBackend
+from .billing import run_billing
+from .management.commands import run_tasks
+from .management.commands.benchmark import Command as BenchmarkCommand
+from .middleware import PrecompressedStaticMiddleware, ProfilingMiddleware, RateLimitMiddleware, brotli
+from .models import (
+    ArchivedPayment, ArchivedPayout, ArchivedWinner, DuplicateCluster, JobListing, MonthlyDraw, Payment,
+    PaymentAuthorization, Payout, QueuedTask, Registration, Winner,
+)
+from .payment_views import get_pending_checkout
+from .paystack_stub import FakePaystackGateway, PaystackStubServer
+from .payments import mark_payment_successful, open_payments
+from .payouts import _release, add_months, apply_transfer_results, process_payouts, retry_failed_payouts
+from .paystack import CircuitBreaker, PaystackError, PaystackGateway, PaystackUnavailable
+from .search import get_facets, search_jobs
+from .simulation import default_parameters, simulate, summarize
+from .tasks import process_paystack_event
+from .urls import urlpatterns
+
+
+@task
+def echo_task(value):
+    return value
+
+
+@task
+def failing_task():
+    raise RuntimeError('Always fails')
+
+
+def create_member(username, **fields):
+    """A user with a linked registration; log in with force_login"""
+    # No password, so no PBKDF2 hash per member
+    user = User.objects.create_user(username, f'{username}@example.com')
+    defaults = {
+        'first_name': username.title(),
+        'last_name': 'Member',
+        'email': user.email,
+        'phone_number': f'024{user.pk:07d}',
+        'date_of_birth': date(1995, 1, 1),
+        'region': 'accra',
+        'mobile_money_provider': 'mtn',
+        'cv_file': 'cv_files/test.pdf',
+        'terms_accepted': True,
+        'user': user,
+    }
+    defaults.update(fields)
+    return Registration.objects.create(**defaults)
+
+
+class ViewBudgetTests(TestCase):
+    """Every page stays within its budget in registrations.budgets as the tables grow"""
+
+    # Response times depend on the machine, so they are only checked on request
+    check_timings = os.environ.get('BUDGET_TIMINGS') == '1'
+    # Best of a few runs, so one slow run on a busy machine does not fail the build
+    timing_runs = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('budget-staff', 'staff@example.com', 'budget-password', is_staff=True)
+        cls.registration = create_member('budget-member')
+
+    def grow(self, rows):
+        """
+        Top every table up to ``rows`` rows. The member paid for and won
+        every draw, so their own pages grow with the data as well.
+        """
+        start = Registration.objects.count()
+        User.objects.bulk_create([
+            User(username=f'budget{index}', email=f'budget{index}@example.com', password='!')
+            for index in range(start, rows)
+        ], batch_size=1000)
+        Registration.objects.bulk_create([
+            Registration(
+                first_name=f'Budget{user.id}',
+                last_name='User',
+                email=user.email,
+                phone_number=f'020{user.id:07d}',
+                date_of_birth=date(1995, 1, 1),
+                region='accra',
+                mobile_money_provider='mtn',
+                cv_file='cv_files/budget.pdf',
+                terms_accepted=True,
+                user=user,
+            )
+            for user in User.objects.filter(username__startswith='budget', registration__isnull=True)
+            .exclude(pk=self.staff.pk)
+        ], batch_size=1000)
+
+        this_month = timezone.localdate().replace(day=1)
+        start = MonthlyDraw.objects.count()
+        MonthlyDraw.objects.bulk_create([
+            MonthlyDraw(draw_month=add_months(this_month, -1 - index), current_participants=rows,
+                        status='completed', winners_selected=True)
+            for index in range(start, rows)
+        ], batch_size=1000)
+        Winner.objects.bulk_create([
+            Winner(registration=self.registration, monthly_draw=draw,
+                   prize_type='job' if draw.pk % 2 else 'basic_income', prize_details='Budget prize')
+            for draw in MonthlyDraw.objects.filter(winner__isnull=True)
+        ], batch_size=1000)
+        start = Payment.objects.count()
+        Payment.objects.bulk_create([
+            Payment(
+                registration=self.registration,
+                user=self.registration.user,
+                amount=15,
+                payment_type='monthly',
+                status='success',
+                reference=f'JM-BUDGET{index:06d}',
+                email=self.registration.email,
+                month_paid_for=add_months(this_month, -1 - index),
+                mobile_money_provider='mtn',
+                paid_at=timezone.now(),
+            )
+            for index in range(start, rows)
+        ], batch_size=1000)
+
+        start = JobListing.objects.count()
+        JobListing.objects.bulk_create([
+            JobListing(title=f'Budget job {index}', description='Budget description', job_type='full_time',
+                       salary_range='GHS 1000 - 2000', requirements='Budget requirements')
+            for index in range(start, rows)
+        ], batch_size=1000)
+
+    def url(self, name):
+        if name == 'admin_registration_detail':
+            return reverse(name, kwargs={'registration_id': self.registration.id})
+        return reverse(name)
+
+    def measure(self, name, budget, runs, within=None):
+        """
+        (queries, fastest ms) of cold-cache GETs of the page, stopping early
+        once a run after the first took at most ``within`` ms
+        """
+        if budget['user'] == 'staff':
+            self.client.force_login(self.staff)
+        elif budget['user'] == 'member':
+            self.client.force_login(self.registration.user)
+        else:
+            self.client.logout()
+
+        url = self.url(name)
+        fastest = None
+        for run in range(runs):
+            cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = self.client.get(url)
+                elapsed = (time.perf_counter() - start) * 1000
+            self.assertEqual(response.status_code, 200, f"{url} answered {response.status_code}")
+            # The first request of a session also loads it
+            queries = len(captured)
+            fastest = elapsed if fastest is None else min(fastest, elapsed)
+            if within is not None and run and fastest <= within:
+                break
+        return queries, fastest
+
+    def test_views_stay_within_budget(self):
+        first_counts = {}
+        for rows in BUDGET_SCALES:
+            self.grow(rows)
+            for name, budget in VIEW_BUDGETS.items():
+                with self.subTest(view=name, rows=rows):
+                    timed = self.check_timings and rows == BUDGET_SCALES[-1] and 'ms' in budget
+                    if timed:
+                        queries, elapsed = self.measure(name, budget, self.timing_runs, within=budget['ms'])
+                    else:
+                        queries, elapsed = self.measure(name, budget, 2)
+                    first_counts.setdefault(name, queries)
+                    self.assertLessEqual(queries, budget['queries'], f"{name} made {queries} queries")
+                    self.assertEqual(queries, first_counts[name],
+                                     f"{name} made {queries} queries with {rows} rows, "
+                                     f"{first_counts[name]} with {BUDGET_SCALES[0]}")
+                    if timed:
+                        self.assertLessEqual(elapsed, budget['ms'], f"{name} took {elapsed:.0f} ms")
+
+    def test_every_page_has_a_budget(self):
+        names = {pattern.name for pattern in urlpatterns}
+        self.assertEqual(names - VIEW_BUDGETS.keys() - UNBUDGETED.keys(), set())
+        self.assertEqual((VIEW_BUDGETS.keys() | UNBUDGETED.keys()) - names, set())
+        # A page has a time budget or is flagged as listing a whole table, not both
+        timed = {name for name, budget in VIEW_BUDGETS.items() if 'ms' in budget}
+        self.assertEqual(timed & UNPAGINATED.keys(), set())
+        self.assertEqual(VIEW_BUDGETS.keys() - timed - UNPAGINATED.keys(), set())
+
+
+class PaymentLedgerTests(TestCase):
+    """The revenue summary follows every change of payment status"""
+
+    def setUp(self):
+        self.registration = create_member('ledger-member')
+        self.month = timezone.localdate().replace(day=1)
+
+    def open_checkout(self, reference):
+        with transaction.atomic():
+            payment = Payment.objects.create(
+                registration=self.registration,
+                user=self.registration.user,
+                amount=15,
+                payment_type='monthly',
+                reference=reference,
+                email=self.registration.email,
+                month_paid_for=self.month,
+                mobile_money_provider='mtn',
+            )
+            open_payments([payment])
+        return payment
+
+    def assertSummaryMatchesPayments(self):
+        stored = {}
+        for (month, provider, status), (payments, pesewas) in ledger.summary().items():
+            row = stored.setdefault(status, [0, 0])
+            row[0] += payments
+            row[1] += pesewas
+        actual = {
+            row['status']: [row['payments'], ledger.to_pesewas(row['amount'])]
+            for row in Payment.objects.values('status').annotate(payments=Count('id'), amount=Sum('amount'))
+        }
+        self.assertEqual(stored, actual)
+        self.assertEqual(ledger.differences(ledger.replay(), ledger.summary()), [])
+
+    def test_expired_checkout_is_cancelled_in_the_ledger(self):
+        expired = self.open_checkout('JM-LEDGER1')
+        Payment.objects.filter(pk=expired.pk).update(
+            created_date=timezone.now() - timedelta(seconds=settings.PAYMENT_CHECKOUT_TTL + 1),
+        )
+
+        self.assertIsNone(get_pending_checkout(self.registration, self.month))
+        expired.refresh_from_db()
+        self.assertEqual(expired.status, 'cancelled')
+        self.open_checkout('JM-LEDGER2')
+        self.assertSummaryMatchesPayments()
+
+        # A late webhook for the cancelled checkout still collected the money
+        self.assertTrue(mark_payment_successful(expired))
+        self.assertSummaryMatchesPayments()
+
+
+class ProgressBroadcasterTests(SimpleTestCase):
+
+    async def test_disconnecting_listener_leaves_the_others_waiting(self):
+        progress = {'participants': 1}
+        cache.set(live.PROGRESS_KEY, progress, 60)
+        broadcaster = live.ProgressBroadcaster(0.01)
+        leaving = asyncio.ensure_future(anext(broadcaster.listen(60)))
+        staying = asyncio.ensure_future(anext(broadcaster.listen(60)))
+        await asyncio.sleep(0)
+
+        leaving.cancel()
+        self.assertEqual(await asyncio.wait_for(staying, 5), progress)
+        self.assertIsNotNone(broadcaster.poller)
+        broadcaster.poller.cancel()
+
+
+class PaystackGatewayTests(SimpleTestCase):
+
+    def test_any_request_error_settles_a_half_open_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        gateway = PaystackGateway('sk_test', 'http://paystack.invalid', 1, 1, 0, 0, 1, breaker)
+        breaker.record_failure()
+
+        def fail(*args, **kwargs):
+            raise requests.TooManyRedirects('redirect loop')
+
+        gateway.session.request = fail
+        with self.assertLogs('registrations.paystack', 'WARNING'), self.assertRaises(PaystackError):
+            gateway.verify_transaction('JM-TRIAL')
+        self.assertFalse(breaker.trial_in_flight)
+        self.assertTrue(breaker.allow())
+
+
+class PaystackStubGatewayTests(SimpleTestCase):
+    """Timeouts, retries and the circuit breaker against the local Paystack stub"""
+
+    def setUp(self):
+        self.server = PaystackStubServer(('127.0.0.1', 0))
+        self.server.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def gateway(self, read_timeout=2, max_retries=0, breaker=None):
+        breaker = breaker or CircuitBreaker(failure_threshold=5, reset_timeout=60)
+        return PaystackGateway('sk_test', self.server.base_url, 1, read_timeout, max_retries, 0, 2, breaker)
+
+    def test_round_trip(self):
+        gateway = self.gateway()
+        gateway.initialize_transaction('ama@example.com', 1500, 'JM-STUB1', 'http://testserver/verify/')
+        response = gateway.verify_transaction('JM-STUB1')
+        self.assertEqual(response['data']['status'], 'success')
+        self.assertEqual(gateway.stats.snapshot()['verify']['errors'], 0)
+
+    def test_server_errors_are_retried_for_idempotent_calls_only(self):
+        self.server.error_rate = 1
+        gateway = self.gateway(max_retries=2)
+        with self.assertLogs('registrations.paystack', 'WARNING'), self.assertRaises(PaystackError):
+            gateway.verify_transaction('JM-STUB1')
+        self.assertEqual(self.server.request_count, 3)
+
+        # A retried initialize could open a second checkout
+        with self.assertLogs('registrations.paystack', 'WARNING'), self.assertRaises(PaystackError):
+            gateway.initialize_transaction('ama@example.com', 1500, 'JM-STUB2', 'http://testserver/verify/')
+        self.assertEqual(self.server.request_count, 4)
+
+    def test_read_timeout(self):
+        self.server.latency = 0.5
+        gateway = self.gateway(read_timeout=0.05, max_retries=1)
+        start = time.perf_counter()
+        with self.assertLogs('registrations.paystack', 'WARNING'), self.assertRaises(PaystackError):
+            gateway.verify_transaction('JM-STUB1')
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(self.server.request_count, 2)
+
+        # The charge may have gone through, so it is not sent again
+        with self.assertLogs('registrations.paystack', 'WARNING'), self.assertRaises(PaystackError):
+            gateway.charge_authorization('ama@example.com', 1500, 'AUTH_1', 'JM-STUB2')
+        self.assertEqual(self.server.request_count, 3)
+
+    def test_circuit_opens_then_recovers_half_open(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+        gateway = self.gateway(breaker=breaker)
+        self.server.error_rate = 1
+        with self.assertLogs('registrations.paystack', 'WARNING'):
+            for _ in range(2):
+                with self.assertRaises(PaystackError):
+                    gateway.verify_transaction('JM-STUB1')
+        self.assertEqual(breaker.state, 'open')
+
+        # Fails fast without reaching Paystack
+        with self.assertRaises(PaystackUnavailable):
+            gateway.verify_transaction('JM-STUB1')
+        self.assertEqual(self.server.request_count, 2)
+
+        # A failed half-open trial opens the circuit again
+        time.sleep(0.2)
+        self.assertEqual(breaker.state, 'half-open')
+        with self.assertLogs('registrations.paystack', 'WARNING'), self.assertRaises(PaystackError):
+            gateway.verify_transaction('JM-STUB1')
+        self.assertEqual(breaker.state, 'open')
+
+        # A successful one closes it
+        self.server.error_rate = 0
+        time.sleep(0.2)
+        gateway.verify_transaction('JM-STUB1')
+        self.assertEqual(breaker.state, 'closed')
+        self.assertEqual(self.server.request_count, 4)
+
+
+class PaymentCheckoutTests(TestCase):
+    """initiate_payment opens one checkout per member and month"""
+
+    def setUp(self):
+        # Rate limit buckets outlive each test
+        cache.clear()
+        self.registration = create_member('checkout-member')
+        self.client.force_login(self.registration.user)
+        self.gateway = FakePaystackGateway()
+        patcher = mock.patch('registrations.payment_views.get_gateway', return_value=self.gateway)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_double_post_reuses_the_checkout(self):
+        first = self.client.post(reverse('payment_page'))
+        second = self.client.post(reverse('payment_page'))
+
+        payment = Payment.objects.get()
+        self.assertEqual(payment.status, 'pending')
+        self.assertEqual(first.url, payment.authorization_url)
+        self.assertEqual(second.url, payment.authorization_url)
+        self.assertEqual(list(self.gateway.checkouts), [payment.reference])
+
+    def test_expired_checkout_is_cancelled_and_replaced(self):
+        self.client.post(reverse('payment_page'))
+        expired = Payment.objects.get()
+        Payment.objects.filter(pk=expired.pk).update(
+            created_date=timezone.now() - timedelta(seconds=settings.PAYMENT_CHECKOUT_TTL + 1),
+        )
+
+        response = self.client.post(reverse('payment_page'))
+
+        expired.refresh_from_db()
+        replacement = Payment.objects.get(status='pending')
+        self.assertEqual(expired.status, 'cancelled')
+        self.assertEqual(response.url, replacement.authorization_url)
+        self.assertEqual(list(self.gateway.checkouts), [expired.reference, replacement.reference])
+
+    def test_concurrent_create_falls_back_to_the_first_checkout(self):
+        self.client.post(reverse('payment_page'))
+        payment = Payment.objects.get()
+        lookups = []
+
+        def racing(registration, month):
+            # The racing request looked before the first one committed
+            lookups.append(month)
+            return None if len(lookups) == 1 else get_pending_checkout(registration, month)
+
+        with mock.patch('registrations.payment_views.get_pending_checkout', side_effect=racing):
+            response = self.client.post(reverse('payment_page'))
+
+        self.assertEqual(len(lookups), 2)
+        self.assertEqual(response.url, payment.authorization_url)
+        self.assertEqual(Payment.objects.count(), 1)
+        self.assertEqual(len(self.gateway.checkouts), 1)
+
+
+def make_snapshot(size, seed=0):
+    """A draw snapshot of ``size`` entrants with random regions and months paid"""
+    rng = np.random.default_rng(seed)
+    snapshot = np.zeros(size, dtype=SNAPSHOT_DTYPE)
+    snapshot['id'] = np.arange(1, size + 1) * 3
+    snapshot['region'] = rng.integers(0, len(REGIONS), size)
+    snapshot['months_paid'] = rng.integers(1, 24, size)
+    return snapshot
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0, PROFILING_SLOW_REQUEST_MS=50,
+                   PROFILING_INTERVAL_MS=1, PROFILING_MAX_FILES=2)
+class ProfilingTests(SimpleTestCase):
+    """Requests past the threshold are profiled into a ring of files"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(PROFILING_DIR=directory.name))
+
+    def get(self, view):
+        request = RequestFactory().get('/jobs/')
+        request.resolver_match = resolve('/jobs/')
+        ProfilingMiddleware(view)(request)
+
+    def test_only_slow_requests_are_profiled(self):
+        self.get(lambda request: HttpResponse())
+        self.assertEqual(profiling.list_profiles(), [])
+
+        def slow_view(request):
+            time.sleep(0.2)
+            return HttpResponse()
+
+        self.get(slow_view)
+        [profile] = profiling.list_profiles()
+        self.assertEqual(profile['url_name'], 'jobs')
+        self.assertGreaterEqual(profile['duration_ms'], 200)
+        with open(profiling.profile_path(profile['name'], '.folded')) as f:
+            self.assertIn('slow_view', f.read())
+        stats = pstats.Stats(profiling.profile_path(profile['name'], '.pstats'))
+        self.assertIn('slow_view', {name for _, _, name in stats.stats})
+
+    def test_keeps_the_newest_files(self):
+        profile = profiling.Profile(threading.get_ident(), None, 0)
+        profile.sample(sys._getframe())
+        names = [profiling.write_profile(profile, f'page{index}', 1) for index in range(3)]
+        self.assertEqual([listed['name'] for listed in profiling.list_profiles()], names[:0:-1])
+        self.assertEqual(len(os.listdir(settings.PROFILING_DIR)), 4)
+        self.assertIsNone(profiling.profile_path(names[0], '.folded'))
+        self.assertIsNone(profiling.profile_path('../settings', '.folded'))
+
+
+class PrecompressedStaticTests(SimpleTestCase):
+    """Collected files are served in the best variant the client accepts"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(STATIC_ROOT=directory.name))
+        os.makedirs(os.path.join(directory.name, 'css'))
+        for suffix, content in (('', b'plain'), ('.gz', b'gzipped'), ('.br', b'brotli')):
+            with open(os.path.join(directory.name, 'css', 'site.css' + suffix), 'wb') as f:
+                f.write(content)
+        with open(os.path.join(directory.name, 'robots.txt'), 'wb') as f:
+            f.write(b'robots')
+        self.middleware = PrecompressedStaticMiddleware(lambda request: HttpResponse('view', status=404))
+
+    def get(self, path, **headers):
+        response = self.middleware(RequestFactory().get(settings.STATIC_URL + path, **headers))
+        response.body = b''.join(response) if response.streaming else response.content
+        response.close()
+        return response
+
+    def test_negotiates_encoding(self):
+        for accept, body, encoding in (
+            ('gzip, deflate, br', b'brotli', 'br'),
+            ('gzip', b'gzipped', 'gzip'),
+            ('br;q=0, gzip', b'gzipped', 'gzip'),
+            ('', b'plain', None),
+        ):
+            with self.subTest(accept=accept):
+                response = self.get('css/site.css', HTTP_ACCEPT_ENCODING=accept)
+                self.assertEqual(response.body, body)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertEqual(response['Content-Type'], 'text/css')
+                self.assertIn('Accept-Encoding', response['Vary'])
+
+        # Files without variants are served as they are
+        response = self.get('robots.txt', HTTP_ACCEPT_ENCODING='br')
+        self.assertEqual(response.body, b'robots')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_not_modified_and_missing(self):
+        last_modified = self.get('css/site.css')['Last-Modified']
+        self.assertEqual(self.get('css/site.css', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(self.get('css/missing.css').body, b'view')
+        self.assertEqual(self.get('../settings.py').body, b'view')
+
+
+@override_settings(
+    RATE_LIMIT_CACHE=None,
+    RATE_LIMITS={'jobs': [{'key': 'ip', 'rate': '2/m', 'burst': 3, 'methods': ['GET']}]},
+)
+class RateLimitTests(SimpleTestCase):
+    """Rules, token buckets and the middleware refusing or shedding requests"""
+
+    def request(self, path='/jobs/', method='get', **headers):
+        request = getattr(RequestFactory(), method)(path, **headers)
+        request.resolver_match = resolve(path)
+        return request
+
+    def test_invalid_rules(self):
+        for rate in ('10', '10/w', 'ten/m'):
+            with self.subTest(rate=rate), self.assertRaises(ImproperlyConfigured):
+                ratelimit.parse_rate(rate)
+        with self.assertRaises(ImproperlyConfigured):
+            ratelimit.parse_rules({'jobs': [{'key': 'session', 'rate': '1/s'}]})
+        self.assertEqual(
+            ratelimit.parse_rules({'jobs': [{'key': 'ip', 'rate': '6/m', 'methods': ['post']}]}),
+            {'jobs': [('ip', 0.1, 6, frozenset({'POST'}))]},
+        )
+
+    def test_take_token_bursts_then_refills(self):
+        bucket = None
+        for _ in range(3):
+            bucket, wait = ratelimit.take_token(bucket, 0.5, 3, 100)
+            self.assertEqual(wait, 0)
+        bucket, wait = ratelimit.take_token(bucket, 0.5, 3, 100)
+        self.assertEqual(wait, 2)
+        bucket, wait = ratelimit.take_token(bucket, 0.5, 3, 102)
+        self.assertEqual(wait, 0)
+        # Never refills past the burst
+        bucket, wait = ratelimit.take_token(bucket, 0.5, 3, 10000)
+        self.assertEqual(bucket, (2, 10000))
+
+    def test_refuses_with_retry_after(self):
+        middleware = RateLimitMiddleware(lambda request: HttpResponse())
+        for _ in range(3):
+            self.assertIsNone(middleware.process_view(self.request(), None, (), {}))
+        response = middleware.process_view(self.request(), None, (), {})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        # Other clients and methods outside the rule have their own allowance
+        self.assertIsNone(middleware.process_view(self.request(REMOTE_ADDR='10.0.0.2'), None, (), {}))
+        self.assertIsNone(middleware.process_view(self.request(method='post'), None, (), {}))
+
+    def test_client_ip_behind_proxies(self):
+        request = self.request(REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='6.6.6.6, 1.2.3.4, 10.0.0.9')
+        self.assertEqual(ratelimit.client_ip(request, 0), '10.0.0.1')
+        self.assertEqual(ratelimit.client_ip(request, 1), '10.0.0.9')
+        # The client's own X-Forwarded-For entries are not trusted
+        self.assertEqual(ratelimit.client_ip(request, 2), '1.2.3.4')
+        self.assertEqual(ratelimit.client_ip(self.request(REMOTE_ADDR='10.0.0.1'), 2), '10.0.0.1')
+        with override_settings(RATE_LIMIT_PROXY_COUNT=1):
+            middleware = RateLimitMiddleware(lambda request: HttpResponse())
+        # All from the same proxy address, more than its burst
+        for address in ('1.1.1.1', '2.2.2.2', '3.3.3.3', '4.4.4.4'):
+            self.assertIsNone(middleware.process_view(self.request(HTTP_X_FORWARDED_FOR=address), None, (), {}))
+
+    @override_settings(LOAD_SHED_MAX_IN_FLIGHT=1)
+    def test_sheds_load(self):
+        # The view runs while its own request is in flight, so a second one is shed
+        middleware = RateLimitMiddleware(lambda request: middleware(self.request()))
+        response = middleware(self.request())
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(settings.LOAD_SHED_RETRY_AFTER))
+        self.assertEqual(middleware.in_flight, 0)
+
+        middleware = RateLimitMiddleware(lambda request: HttpResponse())
+        self.assertEqual(middleware(self.request()).status_code, 200)
+        stale = self.request(HTTP_X_REQUEST_START=f't={int((time.time() - 60) * 1000)}')
+        self.assertEqual(middleware(stale).status_code, 503)
+
+
+class DrawEngineTests(SimpleTestCase):
+    """Winners are derived from the snapshot and seed alone"""
+
+    def setUp(self):
+        self.snapshot = make_snapshot(500)
+        self.digest = snapshot_digest(self.snapshot)
+
+    def test_same_seed_and_snapshot_draw_the_same_winners(self):
+        for strategy in STRATEGIES:
+            with self.subTest(strategy=strategy):
+                winners = draw_winners(self.snapshot, 'seed', self.digest, [10, 20], strategy)
+                self.assertEqual(draw_winners(self.snapshot, 'seed', self.digest, [10, 20], strategy), winners)
+                self.assertNotEqual(draw_winners(self.snapshot, 'other seed', self.digest, [10, 20], strategy), winners)
+
+    def test_winners_are_distinct_entrants(self):
+        entrants = set(self.snapshot['id'].tolist())
+        for strategy in STRATEGIES:
+            with self.subTest(strategy=strategy):
+                jobs, income = draw_winners(self.snapshot, 'seed', self.digest, [100, 200], strategy)
+                self.assertEqual((len(jobs), len(income)), (100, 200))
+                self.assertEqual(len(set(jobs + income)), 300)
+                self.assertLessEqual(set(jobs + income), entrants)
+
+    def test_inclusion_proofs_verify_against_the_root(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'draw.merkle')
+        # Odd level sizes move a node up unpaired; a small chunk pairs across chunks
+        for size in [1, 2, 3, 5, 7, 12, 33]:
+            with self.subTest(entrants=size):
+                snapshot = make_snapshot(size)
+                root = build_merkle_tree(snapshot, path, chunk_size=4)
+                for index, registration_id in enumerate(snapshot['id'].tolist()):
+                    proof = inclusion_proof(path, size, index)
+                    self.assertTrue(verify_inclusion(registration_id, proof, root))
+                    self.assertFalse(verify_inclusion(registration_id + 1, proof, root))
+
+                if size > 1:
+                    proof = inclusion_proof(path, size, 0)
+                    proof[0]['hash'] = '00' * 32
+                    self.assertFalse(verify_inclusion(int(snapshot['id'][0]), proof, root))
+
+    def test_every_strategy_respects_the_capped_counts(self):
+        snapshot = make_snapshot(12)
+        digest = snapshot_digest(snapshot)
+        excluded = snapshot['id'][::3].tolist()
+        cases = [
+            ([3, 2], excluded, [3, 2]),
+            ([6, 6], excluded, [6, 2]),
+            ([10, 5], snapshot['id'].tolist(), [0, 0]),
+        ]
+        for strategy in STRATEGIES:
+            for counts, barred, expected in cases:
+                with self.subTest(strategy=strategy, counts=counts, barred=len(barred)), np.errstate(all='raise'):
+                    winners = draw_winners(snapshot, 'seed', digest, counts, strategy, excluded=barred)
+                    self.assertEqual([len(ids) for ids in winners], expected)
+                    self.assertFalse(set(barred) & set(sum(winners, [])))
+                    self.assertEqual(len(set(sum(winners, []))), sum(expected))
+
+    def test_excluded_entrants_never_win(self):
+        excluded = self.snapshot['id'][::2].tolist()
+        for strategy in STRATEGIES:
+            with self.subTest(strategy=strategy):
+                jobs, income = draw_winners(self.snapshot, 'seed', self.digest, [100, 100], strategy, excluded=excluded)
+                self.assertFalse(set(excluded) & set(jobs + income))
+
+
+class OutageGateway(FakePaystackGateway):
+    """Fake gateway that goes down after ``outage_after`` charges and counts every charge attempt"""
+
+    outage_after = 0
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.attempts = {}
+
+    def charge_authorization(self, *args, reference, **kwargs):
+        with self.lock:
+            if 0 < self.outage_after <= len(self.charges):
+                raise PaystackUnavailable('Injected outage')
+            self.attempts[reference] = self.attempts.get(reference, 0) + 1
+        return super().charge_authorization(*args, reference=reference, **kwargs)
+
+
+class BillingRunTests(TestCase):
+    """Recurring billing charges every subscriber once, however often it is run"""
+
+    subscribers = 30
+
+    def setUp(self):
+        self.month = timezone.localdate().replace(day=1)
+        for index in range(self.subscribers):
+            registration = create_member(f'subscriber{index}')
+            PaymentAuthorization.objects.create(
+                registration=registration, authorization_code=f'AUTH_{index}', email=registration.email,
+            )
+
+    def bill(self, gateway):
+        return run_billing(self.month, gateway=gateway, batch_size=7, workers=3, rate=10000)
+
+    def test_interrupted_run_resumes_without_charging_twice(self):
+        # Some charges go through without a response and have to be verified
+        gateway = OutageGateway(decline_rate=0.1, error_rate=0.2, seed=3)
+        gateway.outage_after = 12
+        interrupted = self.bill(gateway)
+        self.assertNotEqual(interrupted.status, 'completed')
+        self.assertEqual(len(gateway.charges), 12)
+
+        gateway.outage_after = 0
+        resumed = self.bill(gateway)
+        self.assertEqual(resumed.status, 'completed')
+        self.assertEqual(len(gateway.attempts), self.subscribers)
+        self.assertEqual(set(gateway.attempts.values()), {1})
+
+        paid = sum(1 for status in gateway.charges.values() if status == 'success')
+        payments = Payment.objects.filter(month_paid_for=self.month)
+        self.assertEqual(payments.filter(status='success').count(), paid)
+        self.assertEqual(payments.filter(status='failed').count(), self.subscribers - paid)
+        self.assertEqual(resumed.charged, paid)
+        self.assertEqual(MonthlyDraw.objects.get(draw_month=self.month).current_participants, paid)
+        self.assertEqual(ledger.differences(ledger.replay(), ledger.summary()), [])
+
+        # A completed run is not billed again
+        self.bill(gateway)
+        self.assertEqual(set(gateway.attempts.values()), {1})
+
+
+class PayoutTests(TestCase):
+    """Basic income installments are paid once, whatever Paystack sends back"""
+
+    def setUp(self):
+        cache.clear()
+        self.month = timezone.localdate().replace(day=1)
+        draw = MonthlyDraw.objects.create(draw_month=add_months(self.month, -1), status='completed', winners_selected=True)
+        self.winners = [
+            Winner.objects.create(registration=create_member(f'payee{index}'), monthly_draw=draw,
+                                  prize_type='basic_income', prize_details='Basic income')
+            for index in range(3)
+        ]
+        self.gateway = FakePaystackGateway()
+        process_payouts(self.month, gateway=self.gateway)
+
+    def transfer_event(self, payout, status):
+        return {'event': f'transfer.{status}', 'data': {'reference': payout.reference, 'status': status}}
+
+    def test_first_installments_are_submitted_once(self):
+        submitted = Payout.objects.filter(status='processing')
+        self.assertEqual(submitted.count(), len(self.winners))
+        self.assertEqual(set(self.gateway.transfers), set(submitted.values_list('reference', flat=True)))
+
+        stats = process_payouts(self.month, gateway=self.gateway)
+        self.assertEqual(stats['submitted'], 0)
+        self.assertEqual(self.gateway.bulk_requests, 1)
+
+    def test_replayed_transfer_webhook_pays_once(self):
+        payout = Payout.objects.filter(status='processing').first()
+        process_paystack_event.call(self.transfer_event(payout, 'success'))
+        payout.refresh_from_db()
+        paid_at = payout.paid_at
+        self.assertEqual(payout.status, 'paid')
+        self.assertTrue(Winner.objects.get(pk=payout.winner_id).is_claimed)
+
+        process_paystack_event.call(self.transfer_event(payout, 'success'))
+        self.assertEqual(apply_transfer_results({payout.reference: ('success', None)}), 0)
+        payout.refresh_from_db()
+        self.assertEqual((payout.status, payout.paid_at), ('paid', paid_at))
+        self.assertEqual(Payout.objects.filter(status='paid').count(), 1)
+
+    def test_invalid_transitions_are_rejected(self):
+        paid, failed, accepted = Payout.objects.filter(status='processing').order_by('pk')
+        apply_transfer_results({paid.reference: ('success', None), failed.reference: ('failed', 'Wallet closed')})
+
+        # A failed payout is only paid again after it was rescheduled and resubmitted
+        self.assertEqual(apply_transfer_results({failed.reference: ('success', None)}), 0)
+        retry_failed_payouts(self.month)
+        self.assertEqual(apply_transfer_results({failed.reference: ('success', None)}), 0)
+        failed.refresh_from_db()
+        self.assertEqual(failed.status, 'scheduled')
+
+        # Unknown statuses change nothing, and a transfer Paystack accepted is never handed back
+        self.assertEqual(apply_transfer_results({accepted.reference: ('pending', None)}), 0)
+        self.assertEqual(_release([accepted.pk]), 0)
+        accepted.refresh_from_db()
+        self.assertEqual(accepted.status, 'processing')
+
+        # A reversal after a success fails the payout
+        self.assertEqual(apply_transfer_results({paid.reference: ('reversed', 'Reversed')}), 1)
+        self.assertEqual(apply_transfer_results({paid.reference: ('success', None)}), 0)
+        paid.refresh_from_db()
+        self.assertEqual(paid.status, 'failed')
+
+
+    def test_refused_recipient_does_not_block_other_payees(self):
+        month = add_months(self.month, 1)
+        refused, *others = [winner.registration for winner in self.winners]
+        Registration.objects.update(transfer_recipient_code=None)
+        gateway = FakePaystackGateway(invalid_accounts=[refused.phone_number])
+
+        # One payee per batch, so a batch holds only the refused payee at first
+        stats = process_payouts(month, gateway=gateway, batch_size=1)
+        self.assertNotIn('error', stats)
+        self.assertEqual(stats['recipients'], len(others))
+        refused.refresh_from_db()
+        self.assertIsNone(refused.transfer_recipient_code)
+        self.assertEqual(refused.transfer_recipient_error, 'Account number is invalid')
+        submitted = Payout.objects.filter(due_month=month, status='processing')
+        self.assertEqual(set(submitted.values_list('registration_id', flat=True)), {other.pk for other in others})
+
+        # Skipped on later runs instead of being asked for again
+        stats = process_payouts(month, gateway=gateway, batch_size=1)
+        self.assertEqual((stats['recipients'], stats['submitted']), (0, 0))
+
+
+class DrawSimulationTests(SimpleTestCase):
+    """A seed gives the same report however many processes run the batches"""
+
+    def setUp(self):
+        self.params = {**default_parameters(), 'months': 12, 'minimum_participants': 2000}
+
+    def run_simulation(self, processes, seed=7):
+        return simulate(self.params, 1900, batch_size=500, processes=processes, seed=seed)
+
+    def assertSameResults(self, a, b):
+        self.assertEqual(a.keys(), b.keys())
+        for name in a:
+            np.testing.assert_array_equal(a[name], b[name], err_msg=name)
+
+    def test_same_report_for_any_process_count(self):
+        single = self.run_simulation(1)
+        for processes in (2, 3):
+            with self.subTest(processes=processes):
+                self.assertSameResults(single, self.run_simulation(processes))
+
+        report = summarize(self.params, single)
+        self.assertEqual(report['trials'], 1900)
+        self.assertEqual(single['threshold'].sum(), 1900)
+        self.assertTrue(0 < report['reach_probability'] <= 1)
+
+    def test_seed_changes_the_trials(self):
+        self.assertNotEqual(self.run_simulation(1)['revenue'], self.run_simulation(1, seed=8)['revenue'])
+
+
+class BenchmarkCommandTests(SimpleTestCase):
+    """Every benchmark suite runs, one after the other, at tiny sizes"""
+
+    def test_all_suites(self):
+        # The command sets up its own test database, so it cannot run inside this test run
+        result = subprocess.run(
+            [sys.executable, 'manage.py', 'benchmark', '--iterations', '2', '--subscribers', '20', '--winners', '10',
+             '--tasks', '20', '--entrants', '200', '--registrations', '200', '--listings', '50'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=300,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        for suite in BenchmarkCommand.suites:
+            self.assertIn(f'== {suite} ==', result.stdout)
+
+
+class CompressionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pages_with_secrets_get_padded_gzip(self):
+        # The login form carries a CSRF token
+        response = self.client.get(reverse('user_login'), headers={'Accept-Encoding': 'br, gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_logged_in_pages_get_padded_gzip(self):
+        self.client.force_login(create_member('ama').user)
+        response = self.client.get(reverse('user_dashboard'), headers={'Accept-Encoding': 'br, gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    @skipIf(brotli is None, 'brotli is not installed')
+    def test_public_pages_get_brotli(self):
+        response = self.client.get(reverse('faq'), headers={'Accept-Encoding': 'br, gzip'})
+        self.assertEqual(response['Content-Encoding'], 'br')
+
+
+@override_settings(REGISTRATION_CACHE_TIMEOUT=60)
+class CachedUserTests(TestCase):
+    """The cached user, password hash included, is dropped when the user or registration changes"""
+
+    def setUp(self):
+        cache.clear()
+        self.backend = RegistrationModelBackend()
+        self.user = create_member('cacheduser').user
+
+    def test_cached_until_changed(self):
+        self.assertEqual(self.backend.get_user(self.user.pk).registration.first_name, 'Cacheduser')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+
+        self.user.registration.first_name = 'Renamed'
+        self.user.registration.save()
+        self.assertEqual(self.backend.get_user(self.user.pk).registration.first_name, 'Renamed')
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+        self.user.delete()
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    def test_password_change_ends_sessions(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('user_dashboard')).status_code, 200)
+        self.user.set_password('a new password')
+        self.user.save()
+        # The session's hash of the old password no longer matches
+        self.assertEqual(self.client.get(reverse('user_dashboard')).status_code, 302)
+        self.assertEqual(self.backend.get_user(self.user.pk).password, self.user.password)
+
+
+class OddsSnapshotTests(TestCase):
+    """Dashboard odds come from counters kept current without aggregate queries"""
+
+    def setUp(self):
+        cache.clear()
+        self.month = odds.current_draw_month()
+
+    def pay(self, username):
+        registration = create_member(username)
+        payment = Payment.objects.create(
+            registration=registration, user=registration.user, amount=15, payment_type='monthly',
+            status='pending', reference=f'JM-ODDS-{username}', email=registration.email,
+            month_paid_for=self.month, mobile_money_provider='mtn',
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_payment_successful(payment)
+
+    @override_settings(DRAW_JOB_WINNERS=10, DRAW_INCOME_WINNERS=5)
+    def test_compute_odds(self):
+        self.assertEqual(odds.compute_odds(100, 3), {
+            'paid_entrants': 100, 'job_slots': 3, 'income_slots': 5, 'prize_slots': 8,
+            'job_probability': 0.03, 'income_probability': 0.05, 'win_probability': 0.08, 'one_in': 12.5,
+        })
+        self.assertEqual(odds.compute_odds(4, 10)['income_slots'], 0)
+        self.assertEqual(odds.compute_odds(4, 10)['win_probability'], 1)
+        self.assertIsNone(odds.compute_odds(0, 10)['one_in'])
+
+    def test_counters_follow_payments_and_listings(self):
+        self.pay('oddsone')
+        snapshot = odds.get_odds_snapshot()
+        self.assertEqual(snapshot['paid_entrants'], 1)
+        self.assertEqual(snapshot['draw']['current_participants'], 1)
+        self.assertEqual(snapshot['job_slots'], 0)
+
+        self.pay('oddstwo')
+        JobListing.objects.create(
+            title='Odds job', description='Work', job_type='full_time',
+            salary_range='GHS 1000 - 2000', requirements='None',
+        )
+        with self.assertNumQueries(0):
+            snapshot = odds.get_odds_snapshot()
+        self.assertEqual(snapshot['paid_entrants'], 2)
+        self.assertEqual(snapshot['draw']['current_participants'], 2)
+        self.assertEqual(snapshot['job_slots'], 1)
+
+        # A cold cache counts from the database again
+        cache.clear()
+        self.assertEqual(odds.get_odds_snapshot()['paid_entrants'], 2)
+
+
+class PageCacheTests(TestCase):
+    """Public pages are served from the cache until a group they depend on changes"""
+
+    def setUp(self):
+        cache.clear()
+        self.listing = JobListing.objects.create(
+            title='Cached carpenter', description='Roofing', job_type='contract',
+            salary_range='GHS 1000 - 2000', requirements='Tools',
+        )
+
+    def test_served_from_cache_until_invalidated(self):
+        self.assertContains(self.client.get(reverse('jobs')), 'Cached carpenter')
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(reverse('jobs')), 'Cached carpenter')
+
+        self.listing.title = 'Renamed carpenter'
+        self.listing.save()
+        response = self.client.get(reverse('jobs'))
+        self.assertContains(response, 'Renamed carpenter')
+        self.assertNotContains(response, 'Cached carpenter')
+
+    def test_other_groups_are_kept(self):
+        self.client.get(reverse('jobs'))
+        invalidate_page_cache(DRAW_STATS)
+        with self.assertNumQueries(0):
+            self.client.get(reverse('jobs'))
+
+    def test_logged_in_users_bypass_the_cache(self):
+        def page_keys():
+            return {key for key in cache._cache if ':page_cache:' in key and ':version:' not in key}
+
+        self.client.force_login(create_member('cachebypass').user)
+        self.client.get(reverse('how_it_works'))
+        self.assertEqual(page_keys(), set())
+        self.client.logout()
+        self.client.get(reverse('how_it_works'))
+        self.assertEqual(len(page_keys()), 1)
+
+
+@override_settings(API_JOBS_PAGE_SIZE=2)
+class ApiJobsTests(TestCase):
+    """Pages past the last are refused before they reach the cache"""
+
+    def setUp(self):
+        cache.clear()
+        JobListing.objects.bulk_create([
+            JobListing(title=f'Api job {index}', description='Api description', job_type='full_time',
+                       salary_range='GHS 1000 - 2000', requirements='Api requirements')
+            for index in range(3)
+        ])
+
+    def test_last_page(self):
+        response = self.client.get(reverse('api_jobs'), {'page': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['pages'], 2)
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_pages_past_the_last_are_not_cached(self):
+        self.client.get(reverse('api_jobs'))
+        keys = set(cache._cache)
+        for page in (3, 10 ** 9):
+            response = self.client.get(reverse('api_jobs'), {'page': page})
+            self.assertEqual(response.status_code, 404)
+        self.assertEqual(set(cache._cache), keys)
+
+
+@override_settings(JOB_SEARCH_PAGE_SIZE=2)
+class JobSearchTests(TestCase):
+    """FTS matching and facets, kept in sync with the listings and their cache"""
+
+    def setUp(self):
+        cache.clear()
+        self.python = JobListing.objects.create(
+            title='Python developer', description='Build web services', job_type='full_time',
+            salary_range='GHS 3000 - 4000', requirements='Django experience',
+        )
+        self.farm = JobListing.objects.create(
+            title='Farm hand', description='Seasonal harvest work', job_type='contract',
+            salary_range='GHS 1000 - 2000', requirements='Can drive a tractor',
+        )
+        self.cashier = JobListing.objects.create(
+            title='Cashier', description='Shop till and web orders', job_type='part_time',
+            salary_range='GHS 1000 - 2000', requirements='Numeracy',
+        )
+
+    def titles(self, text='', **filters):
+        return [job['title'] for job in search_jobs(text, **filters)['results']]
+
+    def test_matches_every_word_as_a_prefix_in_any_field(self):
+        self.assertEqual(self.titles('pyth'), ['Python developer'])
+        self.assertEqual(self.titles('TRACT'), ['Farm hand'])
+        self.assertEqual(self.titles('web djan'), ['Python developer'])
+        self.assertEqual(self.titles('python tractor'), [])
+        self.assertEqual(self.titles('"python" OR'), [])
+
+    def test_facets(self):
+        self.assertEqual(get_facets()['salary_range'], [('GHS 1000 - 2000', 2), ('GHS 3000 - 4000', 1)])
+        search = search_jobs('web')
+        self.assertEqual(search['count'], 2)
+        self.assertEqual(search['facets']['job_type'], [('full_time', 1), ('part_time', 1)])
+        self.assertEqual(self.titles('web', job_type='part_time'), ['Cashier'])
+        self.assertEqual(self.titles(salary_range='GHS 3000 - 4000'), ['Python developer'])
+
+    def test_index_follows_updates_and_deletes(self):
+        # Queryset writes skip the signals, so only the triggers keep the index current
+        JobListing.objects.filter(pk=self.python.pk).update(title='Welder')
+        cache.clear()
+        self.assertEqual(self.titles('welder'), ['Welder'])
+        self.assertEqual(self.titles('python'), [])
+        JobListing.objects.filter(pk=self.farm.pk).delete()
+        cache.clear()
+        self.assertEqual(self.titles('tractor'), [])
+
+    def test_listing_changes_invalidate_cached_searches(self):
+        self.assertEqual(self.titles('python'), ['Python developer'])
+        self.python.title = 'Welder'
+        self.python.save()
+        self.assertEqual(self.titles('python'), [])
+        self.assertEqual(self.titles('welder'), ['Welder'])
+        self.python.delete()
+        self.assertEqual(self.titles('welder'), [])
+        self.assertEqual(get_facets()['job_type'], [('contract', 1), ('part_time', 1)])
+
+    def test_pages_past_the_last_redirect_without_caching(self):
+        self.assertEqual(self.client.get(reverse('jobs'), {'page': 2}).status_code, 200)
+        keys = set(cache._cache)
+        for page in (3, 10 ** 9):
+            response = self.client.get(reverse('jobs'), {'page': page})
+            self.assertRedirects(response, f"{reverse('jobs')}?page=2")
+            self.assertEqual(search_jobs(page=page)['page'], 2)
+        self.assertEqual(set(cache._cache), keys)
+
+    def test_unmatched_and_wordless_text_are_not_cached(self):
+        self.client.get(reverse('jobs'))
+        keys = set(cache._cache)
+        response = self.client.get(reverse('jobs'), {'q': 'zzzz'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['search']['count'], 0)
+        response = self.client.get(reverse('jobs'), {'q': '!!!'})
+        self.assertRedirects(response, reverse('jobs'))
+        self.assertEqual(set(cache._cache), keys)
+
+
+class ArchiveTests(TestCase):
+    """Settled rows of old months move to the archive with their ids and stay readable"""
+
+    def setUp(self):
+        self.registration = create_member('archived')
+        self.cutoff = date(2024, 3, 1)
+        self.payments = {
+            (month, status): Payment.objects.create(
+                registration=self.registration, user=self.registration.user, amount=15, payment_type='monthly',
+                status=status, reference=f'JM-ARCH{month}{status}', email=self.registration.email,
+                month_paid_for=date(2024, month, 1), mobile_money_provider='mtn',
+            )
+            for month, status in ((1, 'success'), (1, 'pending'), (2, 'failed'), (3, 'success'))
+        }
+        self.winners = {}
+        for month, payout_status in ((1, 'paid'), (2, 'failed'), (3, 'paid')):
+            draw = MonthlyDraw.objects.create(draw_month=date(2024, month, 1))
+            winner = Winner.objects.create(registration=self.registration, monthly_draw=draw,
+                                           prize_type='basic_income', prize_details='Basic income')
+            Payout.objects.create(
+                winner=winner, registration=self.registration, installment=1, due_month=draw.draw_month,
+                amount=500, mobile_money_provider='mtn', status=payout_status, reference=f'PO-ARCH{month}',
+            )
+            self.winners[month, payout_status] = winner
+
+    def test_moves_settled_rows_before_the_cutoff(self):
+        self.assertEqual(archive.archive_payments(self.cutoff, batch_size=1), 2)
+        self.assertEqual(archive.archive_winners(self.cutoff, batch_size=1), 1)
+
+        archived = [self.payments[1, 'success'], self.payments[2, 'failed']]
+        self.assertEqual(
+            sorted(ArchivedPayment.objects.values_list('id', 'reference', 'status')),
+            sorted((payment.pk, payment.reference, payment.status) for payment in archived),
+        )
+        # Pending payments, failed payouts and recent months stay
+        self.assertEqual(
+            set(Payment.objects.values_list('pk', flat=True)),
+            {self.payments[1, 'pending'].pk, self.payments[3, 'success'].pk},
+        )
+        winner = self.winners[1, 'paid']
+        self.assertEqual(ArchivedWinner.objects.get().pk, winner.pk)
+        self.assertEqual(ArchivedPayout.objects.get().winner_id, winner.pk)
+        self.assertFalse(Winner.objects.filter(pk=winner.pk).exists())
+        self.assertFalse(Payout.objects.filter(winner_id=winner.pk).exists())
+
+        # A second run has nothing left to move
+        self.assertEqual(archive.archive_payments(self.cutoff), 0)
+        self.assertEqual(archive.archive_winners(self.cutoff), 0)
+
+    def test_history_reads_both_tables(self):
+        call_command('archive_data', '--months', '1', stdout=StringIO())
+        self.assertEqual(ArchivedWinner.objects.count(), 2)
+        self.assertEqual(
+            [winner.pk for winner in archive.winner_history(registration=self.registration)],
+            [winner.pk for winner in sorted(self.winners.values(), key=lambda winner: winner.created_date, reverse=True)],
+        )
+        self.assertEqual(len(archive.payment_history(self.registration)), 1)
+        self.assertEqual(
+            {payment.pk for payment in archive.payment_history(self.registration, archived=True)},
+            {payment.pk for payment in self.payments.values()},
+        )
+
+
+class ConditionalPageTests(TestCase):
+    """Per-user pages answer 304 until their rows change, removals included"""
+
+    def setUp(self):
+        self.registration = create_member('conditional')
+        self.client.force_login(self.registration.user)
+        draws = [MonthlyDraw.objects.create(draw_month=date(2024, month, 1)) for month in (1, 2)]
+        self.winners = [
+            Winner.objects.create(registration=self.registration, monthly_draw=draw,
+                                  prize_type='basic_income', prize_details='Basic income')
+            for draw in draws
+        ]
+        self.payments = [
+            Payment.objects.create(
+                registration=self.registration, user=self.registration.user, amount=15, payment_type='monthly',
+                status='success', reference=f'JM-COND{month}', email=self.registration.email,
+                month_paid_for=date(2024, month, 1), mobile_money_provider='mtn',
+            )
+            for month in (1, 2)
+        ]
+
+    def assertRevalidates(self, name, remove):
+        response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        self.assertEqual(self.client.get(reverse(name), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # The newest row stays, so its timestamp alone would not notice the removal
+        remove()
+        response = self.client.get(reverse(name), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        future = 'Fri, 01 Jan 2100 00:00:00 GMT'
+        self.assertEqual(self.client.get(reverse(name), HTTP_IF_MODIFIED_SINCE=future).status_code, 200)
+
+    def test_winners(self):
+        self.assertRevalidates('user_winners', self.winners[0].delete)
+
+    def test_payment_history(self):
+        self.assertRevalidates('payment_history', self.payments[0].delete)
+
+
+class FindDuplicatesTests(TestCase):
+    """The rescan compares fresh blocking keys, and writes nothing on a dry run"""
+
+    def setUp(self):
+        self.stale = create_member('stale', phone_number='0241234567')
+        self.fresh = create_member('fresh', phone_number='+233 24 123 4567')
+        create_member('other', phone_number='0200000000')
+        # As after a bulk import, which skips the signals keeping them current
+        Registration.objects.filter(pk=self.stale.pk).update(phone_key='999999999', name_key='')
+        DuplicateCluster.objects.all().delete()
+
+    def find_duplicates(self, *args):
+        out = StringIO()
+        call_command('find_duplicates', '--chunk-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_writes_nothing(self):
+        output = self.find_duplicates('--dry-run')
+        self.assertIn('Would update the blocking keys of 1 registrations', output)
+        self.assertIn(f'[{self.stale.pk}, {self.fresh.pk}]', output)
+        self.assertEqual(
+            Registration.objects.values_list('phone_key', 'name_key').get(pk=self.stale.pk), ('999999999', ''),
+        )
+        self.assertFalse(DuplicateCluster.objects.exists())
+
+    def test_rescan(self):
+        self.assertIn('Updated the blocking keys of 1 registrations', self.find_duplicates())
+        self.assertEqual(Registration.objects.get(pk=self.stale.pk).phone_key, '241234567')
+        cluster = DuplicateCluster.objects.get()
+        self.assertEqual(
+            sorted(cluster.members.values_list('registration_id', flat=True)), [self.stale.pk, self.fresh.pk],
+        )
+
+
+class PreparedDrawMixin:
+    """This month's draw among three paying members, snapshotted into a temporary directory"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(DRAW_SNAPSHOT_DIR=directory.name))
+        self.month = timezone.localdate().replace(day=1)
+        self.draw = MonthlyDraw.objects.create(
+            draw_month=self.month, status='active', minimum_participants=1, current_participants=3,
+        )
+        for index in range(3):
+            self.registration = registration = create_member(f'entrant{index}')
+            Payment.objects.create(
+                registration=registration, user=registration.user, amount=15, payment_type='monthly',
+                status='success', reference=f'JM-SELECT{index}', email=registration.email,
+                month_paid_for=self.month, mobile_money_provider='mtn',
+            )
+        prepare_draw(self.draw.pk, 'published-seed', 'uniform')
+
+
+class SelectWinnersTests(PreparedDrawMixin, TestCase):
+    """A prepared draw keeps the seed and strategy it was prepared with"""
+
+    def select(self, *args):
+        out = StringIO()
+        call_command('select_winners', '--month', f'{self.month:%Y-%m}', '--job-winners', '0',
+                     '--income-winners', '1', *args, stdout=out)
+        return out.getvalue()
+
+    def test_refuses_another_seed_or_strategy(self):
+        for args in (['--seed', 'other-seed'], ['--strategy', 'weighted']):
+            with self.subTest(args=args):
+                self.assertIn('This draw was prepared with seed published-seed', self.select(*args))
+                self.assertFalse(Winner.objects.exists())
+
+    def test_reruns_with_the_recorded_seed(self):
+        self.select('--seed', 'published-seed', '--strategy', 'uniform')
+        winner = Winner.objects.get()
+        self.assertEqual(
+            winner.prize_details,
+            f"Basic Income Support - GHS {settings.BASIC_INCOME_MONTHLY_AMOUNT} per month "
+            f"for {settings.BASIC_INCOME_MONTHS} months",
+        )
+
+
+class TaskQueueTests(TestCase):
+    """Tasks are claimed once, retried with backoff and requeued when their worker dies"""
+
+    def test_claim_by_priority(self):
+        low = echo_task.using(priority=0).enqueue('low')
+        high = echo_task.using(priority=10).enqueue('high')
+        claimed = default_task_backend.claim('worker-1', limit=1)
+        self.assertEqual([str(record.pk) for record in claimed], [high.id])
+        self.assertEqual((claimed[0].status, claimed[0].attempts), ('RUNNING', 1))
+
+        self.assertEqual([str(record.pk) for record in default_task_backend.claim('worker-2', limit=5)], [low.id])
+        self.assertEqual(default_task_backend.claim('worker-3', limit=5), [])
+
+        record = default_task_backend.execute(claimed[0])
+        self.assertEqual(record.status, 'SUCCESSFUL')
+        self.assertEqual(default_task_backend.get_result(high.id).return_value, 'high')
+
+    def test_retry_with_backoff_then_fail(self):
+        result = failing_task.enqueue()
+        for attempt in range(1, default_task_backend.max_attempts + 1):
+            record = default_task_backend.claim('worker')[0]
+            record = default_task_backend.execute(record)
+            self.assertEqual(len(record.errors), attempt)
+            if attempt < default_task_backend.max_attempts:
+                self.assertEqual(record.status, 'READY')
+                self.assertGreater(record.available_at, timezone.now())
+                # Not claimed again before the backoff is over
+                self.assertEqual(default_task_backend.claim('worker'), [])
+                QueuedTask.objects.filter(pk=record.pk).update(available_at=timezone.now())
+        self.assertEqual(default_task_backend.get_result(result.id).status, 'FAILED')
+
+    def test_expired_lease_is_requeued(self):
+        result = echo_task.enqueue('lost')
+        record = default_task_backend.claim('dead-worker')[0]
+        self.assertEqual(default_task_backend.requeue_stale(), 0)
+
+        expired = timezone.now() - timedelta(seconds=default_task_backend.lease_timeout + 1)
+        QueuedTask.objects.filter(pk=record.pk).update(last_attempted_at=expired)
+        self.assertEqual(default_task_backend.requeue_stale(), 1)
+        self.assertEqual(default_task_backend.get_result(result.id).status, 'READY')
+
+        # The dead worker's late outcome is ignored once another worker holds the claim
+        claimed = default_task_backend.claim('worker')[0]
+        default_task_backend.execute(record)
+        self.assertEqual(default_task_backend.get_result(result.id).status, 'RUNNING')
+
+        # Out of attempts, an expired lease fails the task
+        QueuedTask.objects.filter(pk=claimed.pk).update(last_attempted_at=expired, attempts=claimed.max_attempts)
+        self.assertEqual(default_task_backend.requeue_stale(), 1)
+        self.assertEqual(default_task_backend.get_result(result.id).status, 'FAILED')
+
+
+class TaskWorkerTests(TransactionTestCase):
+    """A task whose outcome cannot be saved does not stop the worker"""
+
+    def test_worker_survives_a_database_error(self):
+        broken = echo_task.enqueue('broken')
+        fine = echo_task.enqueue('fine')
+        run_task = run_tasks.run_task
+
+        def flaky_run_task(backend, record):
+            if str(record.pk) == broken.id:
+                raise OperationalError('database is locked')
+            return run_task(backend, record)
+
+        with mock.patch.object(run_tasks, 'run_task', flaky_run_task), self.assertLogs(run_tasks.logger):
+            done = run_tasks.work(None, threads=1, batch_size=1, poll_interval=0, burst=True)
+        self.assertEqual(done, 1)
+        self.assertEqual(default_task_backend.get_result(fine.id).status, 'SUCCESSFUL')
+        # Left to its lease, which makes it ready again
+        self.assertEqual(default_task_backend.get_result(broken.id).status, 'RUNNING')
+
+
+class DrawEntryProofTests(PreparedDrawMixin, TestCase):
+    """Members get a proof of entry, and a 404 instead of an error for anything else"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.registration.user)
+
+    def proof_url(self, year, month):
+        return reverse('draw_entry_proof', kwargs={'year': year, 'month': month})
+
+    def test_proof_verifies(self):
+        response = self.client.get(self.proof_url(self.month.year, self.month.month))
+        self.assertEqual(response.status_code, 200)
+        self.draw.refresh_from_db()
+        self.assertTrue(verify_inclusion(self.registration.id, response.json()['proof'], self.draw.merkle_root))
+
+    def test_invalid_dates_are_not_found(self):
+        for year, month in ((0, 1), (self.month.year, 13), (self.month.year, 0)):
+            with self.subTest(year=year, month=month):
+                self.assertEqual(self.client.get(self.proof_url(year, month)).status_code, 404)
+
+    def test_missing_snapshot_is_not_found(self):
+        self.draw.refresh_from_db()
+        os.remove(self.draw.snapshot_file)
+        self.assertEqual(self.client.get(self.proof_url(self.month.year, self.month.month)).status_code, 404)
 
-# Create your tests here.
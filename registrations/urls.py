@@ -3,6 +3,7 @@ from . import views
 from . import admin_views
 from . import user_views
 from . import payment_views
+from . import api_views
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -10,8 +11,16 @@ urlpatterns = [
     path('registration/success/', views.registration_success, name='registration_success'),
     path('faq/', views.faq_view, name='faq'),
     path('how-it-works/', views.how_it_works_view, name='how_it_works'),
+    path('jobs/', views.jobs_view, name='jobs'),
     path('api/set-language/', views.set_language, name='set_language'),
     path('api/get-language/', views.get_language, name='get_language'),
+    path('api/draw-progress/', views.draw_progress_stream, name='draw_progress_stream'),
+
+    # Read-only JSON API
+    path('api/draw/', api_views.api_draw, name='api_draw'),
+    path('api/stats/', api_views.api_stats, name='api_stats'),
+    path('api/jobs/', api_views.api_jobs, name='api_jobs'),
+    path('api/me/', api_views.api_me, name='api_me'),
 
     # User authentication routes
     path('user/register/', user_views.user_register, name='user_register'),
@@ -20,6 +29,7 @@ urlpatterns = [
     path('user/dashboard/', user_views.user_dashboard, name='user_dashboard'),
     path('user/profile/', user_views.user_profile, name='user_profile'),
     path('user/winners/', user_views.user_winners, name='user_winners'),
+    path('user/dashboard/draws/<int:year>/<int:month>/proof/', user_views.draw_entry_proof, name='draw_entry_proof'),
 
     # Payment routes
     path('payment/', payment_views.initiate_payment, name='payment_page'),
@@ -34,4 +44,6 @@ urlpatterns = [
     path('admin-winners/', admin_views.admin_winners, name='admin_winners'),
     path('admin-jobs/', admin_views.admin_jobs, name='admin_jobs'),
     path('admin-registration/<int:registration_id>/', admin_views.admin_registration_detail, name='admin_registration_detail'),
+    path('admin-profiles/', admin_views.admin_profiles, name='admin_profiles'),
+    path('admin-profiles/<str:name>.<str:extension>', admin_views.admin_profile_download, name='admin_profile_download'),
 ]
\ No newline at end of file
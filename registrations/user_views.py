@@ -3,9 +3,13 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.http import JsonResponse
-from .models import Registration, MonthlyDraw, Winner
+from django.http import Http404, JsonResponse
+from . import archive
+from .models import Registration, MonthlyDraw
 from .forms import RegistrationForm, UserLoginForm, UserRegistrationForm
+from .odds import format_odds, get_odds_snapshot
+from .draws import entrant_index, inclusion_proof, load_snapshot, merkle_path
+from .conditional import conditional_page, dashboard_etag, winners_etag
 from datetime import datetime, date
 
 def user_register(request):
@@ -88,112 +92,143 @@ def user_logout(request):
     return redirect('home')
 
 @login_required
+@conditional_page(etag_func=dashboard_etag)
 def user_dashboard(request):
     """User personal dashboard"""
     language = request.session.get('language', 'en')
     
-    try:
-        # Get user's registration
-        registration = Registration.objects.get(user=request.user)
-        
-        # Get current monthly draw
-        current_month = date.today().replace(day=1)
-        try:
-            monthly_draw = MonthlyDraw.objects.get(draw_month=current_month)
-        except MonthlyDraw.DoesNotExist:
-            monthly_draw = MonthlyDraw.objects.create(
-                draw_month=current_month,
-                status='active' if Registration.objects.count() >= 5000 else 'pending'
-            )
-        
-        # Get user's winner history
-        user_winners = Winner.objects.filter(registration=registration).order_by('-created_date')
-        
-        # Calculate user's chances
-        total_participants = Registration.objects.filter(is_active=True).count()
-        user_chances = f"1 in {total_participants}" if total_participants > 0 else "0"
-        
-        # Registration statistics
-        registration_date = registration.registration_date
-        
-        context = {
-            'registration': registration,
-            'monthly_draw': monthly_draw,
-            'user_winners': user_winners,
-            'user_chances': user_chances,
-            'total_participants': total_participants,
-            'registration_date': registration_date,
-            'language': language,
-        }
-        
-        return render(request, 'registrations/user_dashboard.html', context)
-        
-    except Registration.DoesNotExist:
+    registration = request.registration
+    if not registration:
         # User exists but no registration record
         messages.warning(request, 'Registration record not found. Please contact support.')
         return redirect('home')
 
+    # Current draw and odds come from the cached per-draw snapshot
+    odds = get_odds_snapshot()
+    
+    # Get user's winner history
+    user_winners = archive.winner_history(registration=registration)
+    
+    # Registration statistics
+    registration_date = registration.registration_date
+    
+    context = {
+        'registration': registration,
+        'monthly_draw': odds['draw'],
+        'odds': odds,
+        'user_winners': user_winners,
+        'user_chances': format_odds(odds),
+        'total_participants': odds['paid_entrants'],
+        'registration_date': registration_date,
+        'language': language,
+    }
+    
+    return render(request, 'registrations/user_dashboard.html', context)
+
 @login_required
 def user_profile(request):
     """User profile management"""
     language = request.session.get('language', 'en')
 
-    try:
-        registration = Registration.objects.get(user=request.user)
-
-        if request.method == 'POST':
-            # Handle profile updates for allowed fields
-            phone_number = request.POST.get('phone_number')
-            region = request.POST.get('region')
-            mobile_money_provider = request.POST.get('mobile_money_provider')
-
-            # Update allowed fields
-            if phone_number:
-                registration.phone_number = phone_number
-            if region:
-                registration.region = region
-            if mobile_money_provider:
-                registration.mobile_money_provider = mobile_money_provider
-
-            # Handle CV upload if provided
-            if 'cv_file' in request.FILES:
-                registration.cv_file = request.FILES['cv_file']
+    registration = request.registration
+    if not registration:
+        messages.error(request, 'Registration record not found.')
+        return redirect('user_dashboard')
 
-            registration.save()
+    if request.method == 'POST':
+        # Handle profile updates for allowed fields
+        phone_number = request.POST.get('phone_number')
+        region = request.POST.get('region')
+        mobile_money_provider = request.POST.get('mobile_money_provider')
 
-            if language == 'en':
-                messages.success(request, 'Profile updated successfully!')
-            else:
-                messages.success(request, 'Profiel succesvol bijgewerkt!')
+        # Update allowed fields
+        wallet = (registration.phone_number, registration.mobile_money_provider)
+        if phone_number:
+            registration.phone_number = phone_number
+        if region:
+            registration.region = region
+        if mobile_money_provider:
+            registration.mobile_money_provider = mobile_money_provider
+        if (registration.phone_number, registration.mobile_money_provider) != wallet:
+            # Payouts go to the new wallet, which needs its own transfer recipient
+            registration.transfer_recipient_code = None
+            registration.transfer_recipient_error = None
+
+        # Handle CV upload if provided
+        if 'cv_file' in request.FILES:
+            registration.cv_file = request.FILES['cv_file']
+
+        registration.save()
 
-            return redirect('user_profile')
+        if language == 'en':
+            messages.success(request, 'Profile updated successfully!')
         else:
-            context = {
-                'registration': registration,
-                'language': language,
-            }
-            return render(request, 'registrations/user_profile.html', context)
+            messages.success(request, 'Profiel succesvol bijgewerkt!')
 
-    except Registration.DoesNotExist:
-        messages.error(request, 'Registration record not found.')
-        return redirect('user_dashboard')
+        return redirect('user_profile')
+    else:
+        context = {
+            'registration': registration,
+            'language': language,
+        }
+        return render(request, 'registrations/user_profile.html', context)
 
 @login_required
+@conditional_page(etag_func=winners_etag)
 def user_winners(request):
     """User winners history"""
     language = request.session.get('language', 'en')
     
-    try:
-        registration = Registration.objects.get(user=request.user)
-        user_winners = Winner.objects.filter(registration=registration).order_by('-created_date')
-        
-        context = {
-            'user_winners': user_winners,
-            'language': language,
-        }
-        
-        return render(request, 'registrations/user_winners.html', context)
-        
-    except Registration.DoesNotExist:
+    registration = request.registration
+    if not registration:
         messages.error(request, 'Registration record not found.')
-        return redirect('user_dashboard')
\ No newline at end of file
+        return redirect('user_dashboard')
+
+    user_winners = archive.winner_history(registration=registration)
+    
+    context = {
+        'user_winners': user_winners,
+        'job_wins': sum(1 for winner in user_winners if winner.prize_type == 'job'),
+        'income_wins': sum(1 for winner in user_winners if winner.prize_type == 'basic_income'),
+        'language': language,
+    }
+    
+    return render(request, 'registrations/user_winners.html', context)
+
+@login_required
+def draw_entry_proof(request, year, month):
+    """Merkle inclusion proof that the user was entered in a month's draw"""
+    registration = request.registration
+    if not registration:
+        raise Http404('Registration record not found.')
+
+    try:
+        draw_month = date(year, month, 1)
+    except ValueError:
+        raise Http404('Invalid month.')
+    monthly_draw = get_object_or_404(MonthlyDraw, draw_month=draw_month)
+    if not monthly_draw.merkle_root:
+        raise Http404('This draw has not closed yet.')
+
+    # Binary search of the memory-mapped snapshot, then one read per tree level
+    try:
+        snapshot = load_snapshot(monthly_draw.snapshot_file)
+        index = entrant_index(snapshot, registration.id)
+        if index is None:
+            raise Http404('You were not entered in this draw.')
+        proof = inclusion_proof(merkle_path(monthly_draw.snapshot_file), len(snapshot), index)
+    except FileNotFoundError:
+        raise Http404("This draw's snapshot is not available.")
+
+    response = JsonResponse({
+        'draw_month': monthly_draw.draw_month.strftime('%Y-%m'),
+        'registration_id': registration.id,
+        'leaf_index': index,
+        'entrants': monthly_draw.snapshot_size,
+        'snapshot_sha256': monthly_draw.snapshot_sha256,
+        'merkle_root': monthly_draw.merkle_root,
+        'proof': proof,
+    })
+    # A closed draw's tree never changes
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
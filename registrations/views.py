@@ -1,39 +1,64 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib import messages
 from django.conf import settings
+from django.utils.cache import add_never_cache_headers
 from django.core.files.storage import default_storage
 import json
 import os
-from .models import Registration, MonthlyDraw, Winner
+from .models import Registration, MonthlyDraw, Winner, JobListing
 from .forms import RegistrationForm, LanguageForm
+from .cache import DRAW_STATS, JOB_LISTINGS, cache_public_page
+from . import live
+from .search import match_expression, search_jobs
 
+# FAQ data - could be from database in future
+FAQS = [
+    {
+        'question_en': 'What are my chances of getting a job or basic income?',
+        'question_nl': 'Hoe groot is mijn kans op een baan of basisinkomen?',
+        'answer_en': 'Your chance depends on the number of participants. With the minimum of 5,000 participants, your chance is 1 in 5,000 per month. The more participants, the more jobs and basic incomes we can offer.',
+        'answer_nl': 'Je kans is afhankelijk van het aantal deelnemers. Bij het minimum van 5.000 deelnemers is je kans 1 op 5.000 per maand. Hoe meer deelnemers, hoe meer banen en basisinkomens we kunnen aanbieden.'
+    },
+    {
+        'question_en': 'What exactly does the basic income include?',
+        'question_nl': 'Wat houdt het basisinkomen precies in?',
+        'answer_en': 'The basic income is a monthly payment of GHS 1,500-2,000 (depending on your experience and education) that you receive for 12 months, regardless of whether you find work during that period.',
+        'answer_nl': 'Het basisinkomen is een maandelijkse uitkering van GHS 1.500-2.000 (afhankelijk van je ervaring en opleiding) die je gedurende 12 maanden ontvangt, ongeacht of je in die periode werk vindt.'
+    },
+    {
+        'question_en': 'Can I unsubscribe at any time?',
+        'question_nl': 'Kan ik me op elk moment uitschrijven?',
+        'answer_en': 'Yes, you can unsubscribe at any time. The monthly payment will then stop at the end of the current billing period.',
+        'answer_nl': 'Ja, je kunt je op elk moment uitschrijven. De maandelijkse betaling stopt dan aan het einde van de huidige factureringsperiode.'
+    },
+    {
+        'question_en': 'How are winners selected?',
+        'question_nl': 'Hoe worden winnaars geselecteerd?',
+        'answer_en': 'We use a transparent, random selection system that is verified by an independent party. All participants have equal chances.',
+        'answer_nl': 'We gebruiken een transparant, willekeurig selectiesysteem dat wordt gecontroleerd door een onafhankelijke partij. Alle deelnemers hebben gelijke kansen.'
+    },
+    {
+        'question_en': 'What happens if there are fewer than 5,000 participants?',
+        'question_nl': 'Wat gebeurt er als er minder dan 5.000 deelnemers zijn?',
+        'answer_en': 'With fewer than 5,000 participants, the monthly draw is postponed until the minimum number of participants is reached. You only pay when the draw takes place.',
+        'answer_nl': 'Bij minder dan 5.000 deelnemers wordt de maandelijkse trekking uitgesteld totdat het minimum aantal deelnemers is bereikt. Je betaalt pas wanneer de trekking plaatsvindt.'
+    }
+]
+
+@cache_public_page(timeout=settings.PAGE_CACHE_DRAW_STATS_TIMEOUT, depends_on=[DRAW_STATS])
 def home(request):
     """Main landing page view"""
     # Get current language from session or default to English
     language = request.session.get('language', 'en')
     
-    # Get the current or next monthly draw
-    from datetime import datetime, date
-    today = date.today()
-    current_month = today.replace(day=1)
-    
-    try:
-        monthly_draw = MonthlyDraw.objects.get(draw_month=current_month)
-    except MonthlyDraw.DoesNotExist:
-        # Create new monthly draw for current month
-        monthly_draw = MonthlyDraw.objects.create(
-            draw_month=current_month,
-            status='active' if Registration.objects.count() >= 5000 else 'pending'
-        )
-    
     context = {
         'language': language,
-        'monthly_draw': monthly_draw,
-        'total_participants': Registration.objects.filter(is_active=True).count(),
-        'needed_participants': max(0, monthly_draw.minimum_participants - Registration.objects.filter(is_active=True).count()),
+        # Kept current by main.js through draw_progress_stream
+        'progress': live.draw_progress(),
     }
     
     return render(request, 'registrations/home.html', context)
@@ -77,6 +102,7 @@ def registration_view(request):
     
     return render(request, 'registrations/registration.html', context)
 
+@cache_public_page()
 def registration_success(request):
     """Registration success page"""
     language = request.session.get('language', 'en')
@@ -87,6 +113,27 @@ def registration_success(request):
     
     return render(request, 'registrations/registration_success.html', context)
 
+@require_http_methods(["GET"])
+def draw_progress_stream(request):
+    """
+    Server-sent events with the home page's participant counter.
+
+    Under ASGI the connection stays open and receives every change. Under
+    WSGI it would hold a worker thread, so the current progress is sent
+    once and the browser reconnects after LIVE_RECONNECT_MS instead.
+    """
+    if isinstance(request, ASGIRequest):
+        response = StreamingHttpResponse(live.progress_events(), content_type='text/event-stream')
+    else:
+        response = HttpResponse(
+            f"retry: {settings.LIVE_RECONNECT_MS}\n\n" + live.progress_event(live.draw_progress()),
+            content_type='text/event-stream',
+        )
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 def set_language(request):
     """Set user language preference"""
     if request.method == 'POST':
@@ -123,51 +170,65 @@ def get_language(request):
     language = request.session.get('language', 'en')
     return JsonResponse({'language': language})
 
+@cache_public_page()
 def faq_view(request):
     """FAQ page view"""
     language = request.session.get('language', 'en')
     
-    # FAQ data - could be from database in future
-    faqs = [
-        {
-            'question_en': 'What are my chances of getting a job or basic income?',
-            'question_nl': 'Hoe groot is mijn kans op een baan of basisinkomen?',
-            'answer_en': 'Your chance depends on the number of participants. With the minimum of 5,000 participants, your chance is 1 in 5,000 per month. The more participants, the more jobs and basic incomes we can offer.',
-            'answer_nl': 'Je kans is afhankelijk van het aantal deelnemers. Bij het minimum van 5.000 deelnemers is je kans 1 op 5.000 per maand. Hoe meer deelnemers, hoe meer banen en basisinkomens we kunnen aanbieden.'
-        },
-        {
-            'question_en': 'What exactly does the basic income include?',
-            'question_nl': 'Wat houdt het basisinkomen precies in?',
-            'answer_en': 'The basic income is a monthly payment of GHS 1,500-2,000 (depending on your experience and education) that you receive for 12 months, regardless of whether you find work during that period.',
-            'answer_nl': 'Het basisinkomen is een maandelijkse uitkering van GHS 1.500-2.000 (afhankelijk van je ervaring en opleiding) die je gedurende 12 maanden ontvangt, ongeacht of je in die periode werk vindt.'
-        },
-        {
-            'question_en': 'Can I unsubscribe at any time?',
-            'question_nl': 'Kan ik me op elk moment uitschrijven?',
-            'answer_en': 'Yes, you can unsubscribe at any time. The monthly payment will then stop at the end of the current billing period.',
-            'answer_nl': 'Ja, je kunt je op elk moment uitschrijven. De maandelijkse betaling stopt dan aan het einde van de huidige factureringsperiode.'
-        },
-        {
-            'question_en': 'How are winners selected?',
-            'question_nl': 'Hoe worden winnaars geselecteerd?',
-            'answer_en': 'We use a transparent, random selection system that is verified by an independent party. All participants have equal chances.',
-            'answer_nl': 'We gebruiken een transparant, willekeurig selectiesysteem dat wordt gecontroleerd door een onafhankelijke partij. Alle deelnemers hebben gelijke kansen.'
-        },
-        {
-            'question_en': 'What happens if there are fewer than 5,000 participants?',
-            'question_nl': 'Wat gebeurt er als er minder dan 5.000 deelnemers zijn?',
-            'answer_en': 'With fewer than 5,000 participants, the monthly draw is postponed until the minimum number of participants is reached. You only pay when the draw takes place.',
-            'answer_nl': 'Bij minder dan 5.000 deelnemers wordt de maandelijkse trekking uitgesteld totdat het minimum aantal deelnemers is bereikt. Je betaalt pas wanneer de trekking plaatsvindt.'
-        }
-    ]
     
     context = {
         'language': language,
-        'faqs': faqs,
+        'faqs': FAQS,
     }
     
     return render(request, 'registrations/faq.html', context)
 
+@cache_public_page(timeout=settings.JOB_SEARCH_CACHE_TIMEOUT, depends_on=[JOB_LISTINGS])
+def jobs_view(request):
+    """Public job board with search and filters"""
+    language = request.session.get('language', 'en')
+
+    text = request.GET.get('q', '')[:200]
+    job_type = request.GET.get('job_type', '')
+    if job_type not in dict(JobListing.JOB_TYPE_CHOICES):
+        job_type = ''
+    salary_range = request.GET.get('salary_range', '')[:100]
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+
+    search = search_jobs(text, job_type, salary_range, page)
+
+    # The page cache keys on the full URL, so wordless text and pages past
+    # the last are sent to their real address instead of being cached apart
+    if search['page'] < page or (text and not match_expression(text)):
+        query = request.GET.copy()
+        query['page'] = search['page']
+        if search['page'] == 1:
+            query.pop('page')
+        if not match_expression(text):
+            query.pop('q', None)
+        return redirect(f'{request.path}?{query.urlencode()}' if query else request.path)
+
+    labels = dict(JobListing.JOB_TYPE_CHOICES)
+
+    context = {
+        'language': language,
+        'search': search,
+        'jobs': [{**job, 'job_type_display': labels.get(job['job_type'], job['job_type'])} for job in search['results']],
+        'job_type_facets': [(value, labels.get(value, value), count) for value, count in search['facets']['job_type']],
+        'query': text,
+        'job_type': job_type,
+        'salary_range': salary_range,
+    }
+
+    response = render(request, 'registrations/jobs.html', context)
+    if text and not search['count']:
+        add_never_cache_headers(response)
+    return response
+
+@cache_public_page()
 def how_it_works_view(request):
     """How it works page view"""
     language = request.session.get('language', 'en')
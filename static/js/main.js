@@ -150,8 +150,26 @@ document.addEventListener('DOMContentLoaded', function() {
             });
         });
     }
+    
+    // Live participant counter
+    const drawProgress = document.querySelector('[data-draw-progress]');
+    if (drawProgress && window.EventSource) {
+        const source = new EventSource(drawProgress.dataset.drawProgress);
+        source.addEventListener('progress', function(e) {
+            updateDrawProgress(drawProgress, JSON.parse(e.data));
+        });
+    }
 });
 
+// Helper function to show the latest draw progress
+function updateDrawProgress(container, progress) {
+    container.querySelectorAll('[data-progress]').forEach(el => {
+        el.textContent = progress[el.dataset.progress];
+    });
+    container.querySelector('[data-progress-pending]').hidden = progress.status !== 'pending';
+    container.querySelector('[data-progress-open]').hidden = progress.status === 'pending';
+}
+
 // Helper function to get CSRF token
 function getCookie(name) {
     let cookieValue = null;